@@ -1,17 +1,37 @@
 # app.py
 
-from flask import Flask, render_template, request, jsonify, session, send_file
-import os
+import itertools
+import json
 import logging
+import os
+import secrets
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 from dotenv import load_dotenv
+from flask import Flask, Response, g, jsonify, redirect, render_template, request, send_file, session, stream_with_context
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from werkzeug.utils import secure_filename
-import secrets
 
 # Import utility modules
-from utils.genai_utils import call_genai
-from utils.audio_utils import text_to_audio
+from utils.audio_utils import AUDIO_DIR, audio_filename, get_tts_stats, split_sentences, stream_audio
+from utils.cache_utils import get_cache_stats
+from utils.client_pool import get_pool_stats
 from utils.code_executor import detect_dependencies, save_code_to_file
-from utils.image_utils import generate_images, get_model_info
+from utils.code_runner import CODE_RUNNER_ENABLED, run_code, runner_authorized
+from utils.code_store import code_digest, code_metadata, code_path, get_code_store_stats, stream_bundle
+from utils.genai_utils import call_genai, call_genai_stream
+from utils.history_store import get_history_stats, history_store, record_generation
+from utils.http_utils import asset_fingerprint, compress_response
+from utils.image_processing import ensure_variant, thumbnail_url
+from utils.image_store import find_original, image_mime_type, image_path, image_url, parse_filename
+from utils.image_utils import get_image_queue_stats, get_model_info, start_images
+from utils.job_queue import job_manager
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimitError
+from utils.singleflight import get_coalescing_stats
+from utils.topic_index import get_similarity_stats
+from utils.upstream_guard import get_upstream_stats
 
 # Load environment variables
 load_dotenv()
@@ -22,21 +42,307 @@ logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
+# A fixed key keeps session cookies, and so users' history, valid across restarts
+app.secret_key = os.getenv('FLASK_SECRET_KEY') or secrets.token_hex(16)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '100'))
+# Items of one batch generated at the same time, and the process-wide cap
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '16'))
+# Fingerprinted asset URLs change with the content, so they can be cached for good
+STATIC_MAX_AGE = 365 * 24 * 3600
+DOWNLOAD_MAX_AGE = int(os.getenv('DOWNLOAD_MAX_AGE', '3600'))
+
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
 
 # Create necessary directories
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs('generated_audio', exist_ok=True)
 os.makedirs('generated_code', exist_ok=True)
 
+metrics.register_gauges("response_cache", get_cache_stats)
+metrics.register_gauges("topic_similarity", get_similarity_stats)
+metrics.register_gauges("coalescing", get_coalescing_stats)
+metrics.register_gauges("client_pool", get_pool_stats)
+metrics.register_gauges("jobs", job_manager.stats)
+metrics.register_gauges("history", get_history_stats)
+metrics.register_gauges("upstream", get_upstream_stats)
+metrics.register_gauges("code_store", get_code_store_stats)
+metrics.register_gauges("tts", get_tts_stats)
+metrics.register_gauges("image_queue", get_image_queue_stats)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def assign_session_id():
+    # History is keyed by this id; give every browser one on its first page view
+    if request.endpoint != 'static' and 'sid' not in session:
+        session['sid'] = secrets.token_hex(16)
+        session.permanent = True
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses are timed to the first byte, not to the end of the stream
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_seconds', time.perf_counter() - started, route=route, method=request.method)
+        metrics.inc('http_requests_total', route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.url_defaults
+def add_asset_fingerprint(endpoint, values):
+    # url_for('static', filename=...) gets ?v=<content hash>, busting caches on change
+    if endpoint == 'static' and 'v' not in values and values.get('filename'):
+        fingerprint = asset_fingerprint(app.static_folder, values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+@app.after_request
+def set_caching_headers(response):
+    # Registered after the metrics hook, so Flask runs it first
+    if request.endpoint == 'static':
+        if request.args.get('v'):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    compress_response(response, request.headers.get('Accept-Encoding'))
+
+    # Rendered pages: revalidate every time, but answer 304 when unchanged
+    if (request.method in ('GET', 'HEAD') and response.status_code == 200 and response.mimetype == 'text/html'
+            and not response.is_streamed):
+        response.add_etag()
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+    return response
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def _request_params():
+    """Read request parameters from a JSON body or, for GET, the query string"""
+    if request.method == 'GET':
+        return request.args.to_dict()
+    return request.get_json(silent=True) or {}
+
+def _rate_limited_response(error):
+    """Answer a rate-limited (429) or shed (503) request with a Retry-After hint"""
+    response = jsonify({
+        'error': error.user_message,
+        'retry_after': error.retry_after
+    })
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def _sse_event(event, data, event_id=None):
+    """Format one Server-Sent Events message"""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(events):
+    """Wrap an event generator in an unbuffered text/event-stream response"""
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _job_accepted(job):
+    """Answer a request queued as a background job with 202 and where to follow it"""
+    status_url = f"/api/jobs/{job.id}"
+    response = jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': status_url,
+        'events_url': f"{status_url}/events"
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+def _no_progress(stage, message, **data):
+    pass
+
+# API clients without cookies send the token from /api/session-token in this header
+SESSION_TOKEN_HEADER = 'X-Session-Token'
+
+def _session_serializer():
+    return URLSafeTimedSerializer(app.secret_key, salt='learnsphere-session-token')
+
+def session_from_token(token):
+    """Session id carried by a token from /api/session-token, or None if it is forged or expired"""
+    if not token:
+        return None
+    try:
+        return _session_serializer().loads(token, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+
+def _session_id():
+    """Session the request belongs to, from the signed session cookie or a signed X-Session-Token"""
+    return session_from_token(request.headers.get(SESSION_TOKEN_HEADER)) or session.get('sid')
+
+def _record_history(session_id, topic, length, mode, payload):
+    """Add a successful generation's result to the session's history"""
+    record_generation(
+        session_id, topic, length, mode,
+        briefing=payload.get('content') or payload.get('explanation'),
+        code_file=payload.get('filename') if mode == 'Code with explanation' else None,
+        audio_file=payload.get('filename') if mode == 'Audio' else None,
+        images=payload.get('images')
+    )
+
+def _recorded(pipeline, session_id, topic, length, mode):
+    """Wrap a pipeline so its successful results are added to the session's history"""
+    def run(*args, progress=_no_progress):
+        payload, status = pipeline(*args, progress=progress)
+        if status == 200:
+            _record_history(session_id, topic, length, mode, payload)
+        return payload, status
+    return run
+
+def _text_pipeline(api_key, topic, length, progress=_no_progress):
+    """Generate a text explanation for a topic; returns (payload, status)"""
+    result = call_genai(api_key, topic, length, "Text explanation")
+    if not result:
+        return {'error': 'Failed to generate content'}, 500
+    return _finalize_text(topic, result), 200
+
+def _code_pipeline(api_key, topic, length, progress=_no_progress):
+    """Generate and save code for a topic; returns (payload, status)"""
+    result = call_genai(api_key, topic, length, "Code with explanation")
+    if not result:
+        return {'error': 'Failed to generate content'}, 500
+
+    progress('text', 'Explanation generated')
+    payload = _finalize_code(topic, result)
+    progress('code', 'Code saved', filename=payload['filename'])
+    return payload, 200
+
+def _images_pipeline(api_key, hf_key, backend, topic, length, progress=_no_progress):
+    """Generate an explanation and its images for a topic; returns (payload, status)
+
+    The text is streamed and each image prompt is dispatched as soon as it is
+    complete, so image generation overlaps the rest of the text.
+    """
+    def image_done(done, total):
+        progress('image', f'Image {done}/{total} done', done=done, total=total)
+
+    batch = start_images(api_key, hf_key, backend, on_progress=image_done)
+    try:
+        result = None
+        for event, payload in call_genai_stream(api_key, topic, length, "Image Explanation"):
+            if event == 'image_prompt':
+                batch.submit(payload)
+                progress('image_prompt', 'Image prompt dispatched', prompt=payload)
+            elif event == 'result':
+                result = payload
+            elif event == 'error':
+                logger.error(f"Image explanation stream failed: {payload}")
+
+        if not result:
+            return {'error': 'Failed to generate content'}, 500
+
+        briefing, _, _, image_prompts = result
+        progress('text', 'Explanation generated', images=len(image_prompts))
+
+        image_urls = batch.collect()
+    finally:
+        # Without an explanation nobody collects the images; don't spend quota on the queued ones
+        batch.cancel()
+
+    return {
+        'success': True,
+        'explanation': briefing,
+        'images': image_urls,
+        'thumbnails': [thumbnail_url(url) for url in image_urls],
+        'prompts': image_prompts
+    }, 200
+
+def _audio_text(api_key, topic, length, text):
+    """Return the text to speak, generating an audio script when none was supplied"""
+    if text:
+        return text
+
+    result = call_genai(api_key, topic, length, "Audio")
+    if not result:
+        return None
+
+    briefing, _, audio_script, _ = result
+    return audio_script or briefing
+
+def _audio_pipeline(api_key, topic, length, text, progress=_no_progress):
+    """Generate and save spoken audio for a topic or text; returns (payload, status)"""
+    script = _audio_text(api_key, topic, length, text)
+    if script is None:
+        return {'error': 'Failed to generate content'}, 500
+    if not script.strip():
+        return {'error': 'Nothing to synthesize'}, 400
+    if not text:
+        progress('text', 'Audio script generated')
+
+    topic = topic or "ml_topic"
+    filename = audio_filename(script, topic)
+    if os.path.exists(os.path.join(AUDIO_DIR, filename)):
+        progress('audio', 'Audio already generated')
+    else:
+        total = len(split_sentences(script))
+        for done, _ in enumerate(stream_audio(script, topic), start=1):
+            progress('audio', f'Audio chunk {done}/{total} done', done=done, total=total)
+
+    return {
+        'success': True,
+        'filename': filename,
+        'download_url': f"/api/download-audio/{filename}"
+    }, 200
+BATCH_MODES = {
+    'text': 'Text explanation',
+    'code': 'Code with explanation',
+    'audio': 'Audio',
+    'images': 'Image Explanation',
+}
+
+def _batch_item(api_key, hf_key, backend, item):
+    """Run one batch item through its mode's pipeline; returns (payload, status)"""
+    if not isinstance(item, dict) or not str(item.get('topic') or '').strip():
+        return {'error': 'Topic is required'}, 400
+
+    topic = item['topic']
+    length = item.get('length', 'Brief')
+    mode = BATCH_MODES.get(item.get('mode', 'text'), item.get('mode'))
+    if mode == 'Text explanation':
+        return _text_pipeline(api_key, topic, length)
+    if mode == 'Code with explanation':
+        return _code_pipeline(api_key, topic, length)
+    if mode == 'Image Explanation':
+        return _images_pipeline(api_key, hf_key, backend, topic, length)
+    if mode == 'Audio':
+        return _audio_pipeline(api_key, topic, length, item.get('text', ''))
+    return {'error': f"Unknown mode: {item.get('mode')}"}, 400
+
+def _run_batch_item(api_key, hf_key, backend, item):
+    """Like _batch_item, but turns exceptions into error payloads"""
+    try:
+        return _batch_item(api_key, hf_key, backend, item)
+    except RateLimitError as e:
+        return {'error': e.user_message, 'retry_after': e.retry_after}, e.status_code
+    except Exception as e:
+        logger.error(f"Error in batch item {item!r}: {e}")
+        return {'error': str(e)}, 500
+
 # Routes
 @app.route('/')
 def index():
@@ -93,10 +399,15 @@ def generate_text():
 
         if result:
             briefing, _, _, _ = result
+            record_generation(_session_id(), topic, length, "Text explanation", briefing=briefing)
             return jsonify({
                 'success': True,
                 'content': briefing
             })
+        else:
+            return jsonify({'error': 'Failed to generate content'}), 500
+    except RateLimitError as e:
+        return _rate_limited_response(e)
     except Exception as e:
         logger.error(f"Error in generate_text: {e}")
         return jsonify({'error': str(e)}), 500
@@ -115,31 +426,134 @@ def generate_code():
         if not api_key:
             return jsonify({'error': 'API key is required'}), 400
 
-        # Generate content
-        result = call_genai(api_key, topic, length, "Code with explanation")
-
-        if result:
-            briefing, code_content, _, _ = result
-
-            # Detect dependencies
-            dependencies = detect_dependencies(code_content) if code_content else []
-
-            # Save code to file
-            code_filename = save_code_to_file(code_content, topic) if code_content else None
+        pipeline = _recorded(_code_pipeline, _session_id(), topic, length, "Code with explanation")
+        if data.get('async'):
+            return _job_accepted(job_manager.submit('code', pipeline, api_key, topic, length))
 
-            return jsonify({
-                'success': True,
-                'explanation': briefing,
-                'code': code_content,
-                'dependencies': dependencies,
-                'filename': code_filename
-            })
+        payload, status = pipeline(api_key, topic, length)
+        return jsonify(payload), status
+    except RateLimitError as e:
+        return _rate_limited_response(e)
     except Exception as e:
         logger.error(f"Error in generate_code: {e}")
         return jsonify({'error': str(e)}),500
            
 
            
+def _stream_generation(mode, finalize):
+    """Validate a streaming request and return an SSE response for it"""
+    data = _request_params()
+    topic = data.get('topic', '')
+    length = data.get('length', 'Brief')
+    api_key = data.get('api_key', os.getenv('GEMINI_API_KEY', ''))
+
+    if not topic:
+        return jsonify({'error': 'Topic is required'}), 400
+
+    if not api_key:
+        return jsonify({'error': 'API key is required'}), 400
+
+    # Pull the first event here so a rate limit still becomes a plain 429
+    stream = call_genai_stream(api_key, topic, length, mode)
+    first = next(stream)
+    session_id = _session_id()
+
+    def events():
+        for event, payload in itertools.chain([first], stream):
+            if event == 'chunk':
+                yield _sse_event('chunk', {'text': payload})
+            elif event == 'code':
+                # The code block is usable before the explanation finishes
+                yield _sse_event('code', {'code': payload})
+            elif event == 'result':
+                result = finalize(topic, payload)
+                _record_history(session_id, topic, length, mode, result)
+                yield _sse_event('done', result)
+            elif event == 'error':
+                yield _sse_event('error', {'error': payload})
+
+    return _sse_response(events())
+
+def _finalize_text(topic, result):
+    briefing, _, _, _ = result
+    return {'success': True, 'content': briefing}
+
+def _finalize_code(topic, result):
+    briefing, code_content, _, _ = result
+    filename = save_code_to_file(code_content, topic) if code_content else None
+    return {
+        'success': True,
+        'explanation': briefing,
+        'code': code_content,
+        'dependencies': detect_dependencies(code_content) if code_content else [],
+        'filename': filename,
+        'bundle_url': f"/api/download-bundle/{filename}" if filename else None
+    }
+
+@app.route('/api/generate-text/stream', methods=['GET', 'POST'])
+def generate_text_stream():
+    """Stream a text explanation as Server-Sent Events"""
+    try:
+        return _stream_generation("Text explanation", _finalize_text)
+    except RateLimitError as e:
+        return _rate_limited_response(e)
+    except Exception as e:
+        logger.error(f"Error in generate_text_stream: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/generate-code/stream', methods=['GET', 'POST'])
+def generate_code_stream():
+    """Stream a code explanation as Server-Sent Events; the final event carries the code"""
+    try:
+        return _stream_generation("Code with explanation", _finalize_code)
+    except RateLimitError as e:
+        return _rate_limited_response(e)
+    except Exception as e:
+        logger.error(f"Error in generate_code_stream: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/run-code', methods=['POST'])
+def run_code_api():
+    """Run a stored generated script in an isolated sandbox, streaming output as Server-Sent Events"""
+    if not CODE_RUNNER_ENABLED:
+        return jsonify({'error': 'Code execution is disabled'}), 404
+    if not runner_authorized(request.headers.get('Authorization')):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename', '')
+
+        if 'code' in data:
+            return jsonify({'error': 'Only stored scripts can be run; pass the filename from code generation'}), 400
+
+        # Only content-addressed scripts the app generated itself, never arbitrary names
+        filepath = code_path(filename) if code_digest(filename) else None
+        if not filepath:
+            return jsonify({'error': 'File not found'}), 404
+        with open(filepath, 'r', encoding='utf-8') as f:
+            code = f.read()
+
+        # Pull the first event here so a busy pool still becomes a plain 503
+        stream = run_code(code)
+        first = next(stream)
+
+        def events():
+            for event, payload in itertools.chain([first], stream):
+                if event == 'exit':
+                    yield _sse_event('exit', payload)
+                else:
+                    yield _sse_event(event, {'text': payload})
+
+        return _sse_response(events())
+
+    except RuntimeError as e:
+        logger.error(f"Error in run_code_api: {e}")
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error in run_code_api: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/generate-images', methods=['POST'])
 def generate_images_api():
     """Generate images for visualization"""
@@ -157,29 +571,252 @@ def generate_images_api():
         if not api_key:
             return jsonify({'error': 'API key is required'}), 400
 
-        # Generate content with image prompts
-        result = call_genai(api_key, topic, length, "Image Explanation")
-
-        if result:
-            briefing, _, _, image_prompts = result
+        pipeline = _recorded(_images_pipeline, _session_id(), topic, length, "Image Explanation")
+        if data.get('async'):
+            return _job_accepted(job_manager.submit('images', pipeline, api_key, hf_key, backend, topic, length))
 
-            # Generate images
-            image_urls = []
-            if image_prompts:
-                image_urls = generate_images(image_prompts, api_key, hf_key, backend)
-
-            return jsonify({
-                'success': True,
-                'explanation': briefing,
-                'images': image_urls,
-                'prompts': image_prompts
-            })
-        else:
-            return jsonify({'error': 'Failed to generate content'}), 500
+        payload, status = pipeline(api_key, hf_key, backend, topic, length)
+        return jsonify(payload), status
+    except RateLimitError as e:
+        return _rate_limited_response(e)
     except Exception as e:
         logger.error(f"Error in generate_code: {e}")
         return jsonify({'error': str(e)}),500
     
+@app.route('/api/generate-audio', methods=['POST'])
+def generate_audio():
+    """Generate spoken audio for a topic (or supplied text), streamed as MP3"""
+    try:
+        data = request.get_json()
+        topic = data.get('topic', '')
+        length = data.get('length', 'Brief')
+        text = data.get('text', '')
+        api_key = data.get('api_key', os.getenv('GEMINI_API_KEY', ''))
+
+        if not topic and not text:
+            return jsonify({'error': 'Topic or text is required'}), 400
+
+        if not text and not api_key:
+            return jsonify({'error': 'API key is required'}), 400
+
+        session_id = _session_id()
+        if data.get('async'):
+            pipeline = _recorded(_audio_pipeline, session_id, topic or "ml_topic", length, "Audio")
+            return _job_accepted(job_manager.submit('audio', pipeline, api_key, topic, length, text))
+
+        text = _audio_text(api_key, topic, length, text)
+        if text is None:
+            return jsonify({'error': 'Failed to generate content'}), 500
+
+        if not text.strip():
+            return jsonify({'error': 'Nothing to synthesize'}), 400
+
+        filename = audio_filename(text, topic or "ml_topic")
+
+        def audio():
+            yield from stream_audio(text, topic or "ml_topic")
+            # Only once the whole file has been written
+            record_generation(session_id, topic or "ml_topic", length, "Audio", audio_file=filename)
+
+        response = Response(stream_with_context(audio()), mimetype='audio/mpeg')
+        response.headers['X-Audio-Filename'] = filename
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except RateLimitError as e:
+        return _rate_limited_response(e)
+    except Exception as e:
+        logger.error(f"Error in generate_audio: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batch-generate', methods=['POST'])
+def batch_generate():
+    """Generate many items concurrently, streaming one NDJSON line per item as each finishes"""
+    try:
+        data = request.get_json()
+        items = data.get('items')
+        api_key = data.get('api_key', os.getenv('GEMINI_API_KEY', ''))
+        hf_key = data.get('hf_key', os.getenv('HF_API_KEY', ''))
+        backend = data.get('backend', 'Google Gemini (Fast & Free)')
+
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'A non-empty list of items is required'}), 400
+
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'At most {BATCH_MAX_ITEMS} items per batch'}), 400
+
+        if not api_key:
+            return jsonify({'error': 'API key is required'}), 400
+
+        try:
+            concurrency = max(1, min(int(data.get('concurrency', BATCH_CONCURRENCY)), BATCH_CONCURRENCY))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'concurrency must be an integer'}), 400
+
+        def results():
+            pending = {}
+            queued = iter(enumerate(items))
+            succeeded = failed = 0
+            try:
+                while True:
+                    # Keep at most `concurrency` items of this batch in flight
+                    for index, item in itertools.islice(queued, concurrency - len(pending)):
+                        future = _batch_executor.submit(_run_batch_item, api_key, hf_key, backend, item)
+                        pending[future] = (index, item)
+                    if not pending:
+                        break
+
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        index, item = pending.pop(future)
+                        payload, status = future.result()
+                        line = {'index': index, 'status': status}
+                        if isinstance(item, dict):
+                            line.update({k: item[k] for k in ('topic', 'length', 'mode') if k in item})
+                        if status < 400:
+                            succeeded += 1
+                            line['result'] = payload
+                        else:
+                            failed += 1
+                            line.update(payload)
+                        yield json.dumps(line) + "\n"
+
+                yield json.dumps({'done': True, 'succeeded': succeeded, 'failed': failed}) + "\n"
+            finally:
+                # Client went away: don't start the rest of the batch
+                for future in pending:
+                    future.cancel()
+
+        response = Response(stream_with_context(results()), mimetype='application/x-ndjson')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        logger.error(f"Error in batch_generate: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a background job; the result is included once it is done"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Follow a background job's progress as Server-Sent Events until it finishes"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    # Reconnecting EventSource clients resume after the last event they saw
+    after = request.headers.get('Last-Event-ID') or request.args.get('after') or 0
+    try:
+        seq = int(after)
+    except ValueError:
+        seq = 0
+
+    def events():
+        nonlocal seq
+        while True:
+            new_events = job.events_after(seq, timeout=15)
+            for event in new_events:
+                seq = event['seq']
+                yield _sse_event('progress', event, event_id=seq)
+            if job.status in ('done', 'failed'):
+                yield _sse_event(job.status, job.to_dict(include_events=False), event_id=seq)
+                return
+            if not new_events:
+                # Keep proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    return _sse_response(events())
+
+def _history_entry(entry):
+    """Add download and view URLs to a history entry"""
+    if entry.get('code_file'):
+        entry['code_url'] = f"/api/download-code/{entry['code_file']}"
+        entry['bundle_url'] = f"/api/download-bundle/{entry['code_file']}"
+    if entry.get('audio_file'):
+        entry['audio_url'] = f"/api/download-audio/{entry['audio_file']}"
+    entry['thumbnails'] = [thumbnail_url(url) for url in entry['images']]
+    return entry
+
+@app.route('/api/session-token', methods=['GET'])
+def session_token():
+    """Signed token for the current session, for API clients that can't keep cookies"""
+    return jsonify({'session_token': _session_serializer().dumps(session['sid']), 'header': SESSION_TOKEN_HEADER})
+
+@app.route('/api/history', methods=['GET'])
+def list_history():
+    """List the session's past generations, newest first; pass next_cursor as ?before= for the next page"""
+    try:
+        if history_store is None:
+            return jsonify({'error': 'History is disabled'}), 404
+
+        session_id = _session_id()
+        if not session_id:
+            return jsonify({'error': 'No session'}), 400
+
+        try:
+            limit = int(request.args.get('limit', 20))
+            before = request.args.get('before', type=int)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+
+        page = history_store.list(session_id, limit=limit, before=before,
+                                  topic=request.args.get('topic'), mode=request.args.get('mode'))
+        page['items'] = [_history_entry(entry) for entry in page['items']]
+        return jsonify(page)
+
+    except Exception as e:
+        logger.error(f"Error in list_history: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/latest', methods=['GET'])
+def latest_history():
+    """Reopen the session's most recent generation for a topic, length and mode without calling Gemini"""
+    try:
+        if history_store is None:
+            return jsonify({'error': 'History is disabled'}), 404
+
+        topic = request.args.get('topic', '')
+        if not topic:
+            return jsonify({'error': 'Topic is required'}), 400
+
+        entry = history_store.latest(_session_id(), topic, request.args.get('length', 'Brief'),
+                                     request.args.get('mode', 'Text explanation'))
+        if entry is None:
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify(_history_entry(entry))
+
+    except Exception as e:
+        logger.error(f"Error in latest_history: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/<int:entry_id>', methods=['GET', 'DELETE'])
+def history_entry(entry_id):
+    """Reopen one past generation, including its explanation, or delete it"""
+    try:
+        if history_store is None:
+            return jsonify({'error': 'History is disabled'}), 404
+
+        if request.method == 'DELETE':
+            if not history_store.delete(_session_id(), entry_id):
+                return jsonify({'error': 'Not found'}), 404
+            return jsonify({'success': True})
+
+        entry = history_store.get(_session_id(), entry_id)
+        if entry is None:
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify(_history_entry(entry))
+
+    except Exception as e:
+        logger.error(f"Error in history_entry: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/model-info', methods=['GET'])
 
 def model_info():
@@ -191,41 +828,154 @@ def model_info():
         return jsonify(info)
 
     except Exception as e:
-        logger.error(f"Error in model_info: (e)") 
+        logger.error(f"Error in model_info: {e}") 
+        return jsonify({'error': str(e)}), 500
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Get response cache hit/miss/eviction counters and near-duplicate topic hits"""
+    try:
+        return jsonify(dict(get_cache_stats(), similarity=get_similarity_stats()))
+
+    except Exception as e:
+        logger.error(f"Error in cache_stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/coalescing-stats', methods=['GET'])
+def coalescing_stats():
+    """Get counters for identical in-flight requests that shared one upstream call"""
+    try:
+        return jsonify(get_coalescing_stats())
+
+    except Exception as e:
+        logger.error(f"Error in coalescing_stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/upstream-status', methods=['GET'])
+def upstream_status():
+    """Get each upstream's adaptive concurrency limit, circuit breaker state and shed counts"""
+    try:
+        return jsonify(get_upstream_stats())
+
+    except Exception as e:
+        logger.error(f"Error in upstream_status: {e}")
         return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Expose per-stage and per-route metrics in Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/download-code/<filename>')
 
 def download_code(filename): 
-    """Download generated code file"""
+    """Download generated code file; supports conditional and Range requests"""
     try:
-        filepath = os.path.join('generated_code', secure_filename(filename))
+        filepath = code_path(filename)
+
+        if filepath:
+            metadata = code_metadata(filename)
+            download_name = f"{metadata['name']}.py" if metadata else os.path.basename(filepath)
+            response = send_file(filepath, mimetype='text/x-python', as_attachment=True,
+                                 download_name=download_name, conditional=True, max_age=DOWNLOAD_MAX_AGE)
+            if code_digest(filename):
+                # Hash-named scripts never change
+                response.cache_control.max_age = STATIC_MAX_AGE
+                response.cache_control.public = True
+                response.cache_control.immutable = True
+            return response
+        else:
+            return jsonify({'error': 'File not found'}), 404
 
-        if os.path.exists(filepath):
-            return send_file(filepath, as_attachment=True)
+    except Exception as e:
+        logger.error(f"Error in download_code: {e}") 
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/download-bundle/<filename>')
+def download_bundle(filename):
+    """Stream a zip of a generated script and its requirements.txt"""
+    try:
+        filepath = code_path(filename)
+        if not filepath:
+            return jsonify({'error': 'File not found'}), 404
+
+        metadata = code_metadata(filename)
+        if metadata:
+            name, requirements = metadata['name'], metadata['dependencies']
         else:
+            # Older timestamped files have no index entry
+            with open(filepath, 'r', encoding='utf-8') as f:
+                requirements = detect_dependencies(f.read())
+            name = os.path.splitext(os.path.basename(filepath))[0]
+
+        response = Response(stream_with_context(stream_bundle(filename, name, requirements)),
+                            mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(name) or "generated_code"}.zip"'
+        digest = code_digest(filename)
+        if digest:
+            response.set_etag(f"{digest}-bundle")
+            response.cache_control.max_age = DOWNLOAD_MAX_AGE
+            response.make_conditional(request)
+        return response
+
+    except Exception as e:
+        logger.error(f"Error in download_bundle: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/images/<filename>')
+def serve_image(filename):
+    """Serve a stored image; names are content hashes, so responses are immutable"""
+    try:
+        parts = parse_filename(filename)
+        filepath = image_path(filename)
+
+        if not filepath and parts and parts[1]:
+            # Resized copies are made in the background; wait for a pending one
+            filepath = ensure_variant(filename)
+            if not filepath:
+                original = find_original(parts[0])
+                if original:
+                    return redirect(image_url(original))
+
+        if not filepath:
             return jsonify({'error': 'File not found'}), 404
 
+        response = send_file(
+            filepath,
+            mimetype=image_mime_type(filename),
+            conditional=True,
+            etag=filename.rsplit('.', 1)[0],
+            max_age=365 * 24 * 3600
+        )
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
     except Exception as e:
-        logger.error(f"Error in download_code: (e)") 
+        logger.error(f"Error in serve_image: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/download-audio/<filename>')
 
 def download_audio(filename): 
-    """Download generated audio file"""
+    """Download generated audio file; supports conditional and Range requests"""
 
     try:
-        filepath= os.path.join('generated_audio', secure_filename(filename))
+        filepath = os.path.abspath(os.path.join('generated_audio', secure_filename(filename)))
 
         if os.path.exists(filepath):
-            return send_file(filepath, as_attachment=True)
+            # Audio filenames hash the text they were made from, so the content never changes
+            response = send_file(filepath, mimetype='audio/mpeg', as_attachment=True,
+                                 conditional=True, max_age=STATIC_MAX_AGE)
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+            return response
 
         else:
             return jsonify({'error': 'File not found'}), 404
 
     except Exception as e:
 
-        logger.error(f"Error in download_audio: (e)") 
+        logger.error(f"Error in download_audio: {e}") 
         return jsonify({'error': str(e)}), 500
 
 
@@ -0,0 +1,240 @@
+"""
+ASGI entry point for LearnSphere.
+
+The upstream-bound API routes (/api/generate-text, /api/generate-code and
+/api/generate-images) are served natively on the event loop using the async
+Gemini SDK methods, so one process can hold hundreds of in-flight generations.
+Every other route is handed to the Flask app through asgiref's WsgiToAsgi.
+Requests with ``"async": true`` are queued on the shared job manager, as in
+the Flask routes.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import SESSION_TOKEN_HEADER, _code_pipeline, _finalize_code, _finalize_text, _images_pipeline, _record_history, _recorded, app, session_from_token
+from utils.genai_utils import call_genai_async
+from utils.http_utils import compress_body
+from utils.image_processing import thumbnail_url
+from utils.image_utils import generate_images_async
+from utils.job_queue import job_manager
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+wsgi_application = WsgiToAsgi(app)
+
+
+async def _read_json(receive, limit):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if len(body) > limit:
+            return None
+    try:
+        return json.loads(body or b"{}")
+    except ValueError:
+        return None
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def _session_id(scope):
+    """Session id from a signed X-Session-Token or the Flask session cookie, as in app._session_id"""
+    session_id = session_from_token(_header(scope, SESSION_TOKEN_HEADER.lower().encode()))
+    if session_id:
+        return session_id
+
+    cookie_name = app.config["SESSION_COOKIE_NAME"]
+    for item in _header(scope, b"cookie").split(";"):
+        name, _, value = item.strip().partition("=")
+        if name == cookie_name and value:
+            serializer = app.session_interface.get_signing_serializer(app)
+            try:
+                return serializer.loads(value, max_age=int(app.permanent_session_lifetime.total_seconds())).get("sid")
+            except Exception:
+                return None
+    return None
+
+
+async def _send_json(send, payload, status=200, headers=(), accept_encoding=""):
+    body, encoding = compress_body(json.dumps(payload).encode("utf-8"), accept_encoding)
+    if encoding:
+        headers = [*headers, (b"content-encoding", encoding.encode())]
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"vary", b"Accept-Encoding"),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _validate(data):
+    """Return (topic, length, api_key, error_response)"""
+    topic = data.get('topic', '')
+    length = data.get('length', 'Brief')
+    api_key = data.get('api_key', os.getenv('GEMINI_API_KEY', ''))
+
+    if not topic:
+        return topic, length, api_key, ({'error': 'Topic is required'}, 400)
+
+    if not api_key:
+        return topic, length, api_key, ({'error': 'API key is required'}, 400)
+
+    return topic, length, api_key, None
+
+
+def _job_accepted(job):
+    status_url = f"/api/jobs/{job.id}"
+    return {
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': status_url,
+        'events_url': f"{status_url}/events"
+    }, 202
+
+
+async def generate_text(data, session_id=None):
+    """Generate text explanation"""
+    topic, length, api_key, error = _validate(data)
+    if error:
+        return error
+
+    result = await call_genai_async(api_key, topic, length, "Text explanation")
+    if not result:
+        return {'error': 'Failed to generate content'}, 500
+
+    payload = _finalize_text(topic, result)
+    await asyncio.to_thread(_record_history, session_id, topic, length, "Text explanation", payload)
+    return payload, 200
+
+
+async def generate_code(data, session_id=None):
+    """Generate code with explanation"""
+    topic, length, api_key, error = _validate(data)
+    if error:
+        return error
+
+    if data.get('async'):
+        pipeline = _recorded(_code_pipeline, session_id, topic, length, "Code with explanation")
+        return _job_accepted(job_manager.submit('code', pipeline, api_key, topic, length))
+
+    result = await call_genai_async(api_key, topic, length, "Code with explanation")
+    if not result:
+        return {'error': 'Failed to generate content'}, 500
+
+    # Saving the script touches disk; keep it off the event loop
+    payload = await asyncio.to_thread(_finalize_code, topic, result)
+    await asyncio.to_thread(_record_history, session_id, topic, length, "Code with explanation", payload)
+    return payload, 200
+
+
+async def generate_images(data, session_id=None):
+    """Generate images for visualization"""
+    topic, length, api_key, error = _validate(data)
+    if error:
+        return error
+
+    hf_key = data.get('hf_key', os.getenv('HF_API_KEY', ''))
+    backend = data.get('backend', 'Google Gemini (Fast & Free)')
+
+    if data.get('async'):
+        pipeline = _recorded(_images_pipeline, session_id, topic, length, "Image Explanation")
+        return _job_accepted(job_manager.submit('images', pipeline, api_key, hf_key, backend, topic, length))
+
+    result = await call_genai_async(api_key, topic, length, "Image Explanation")
+    if not result:
+        return {'error': 'Failed to generate content'}, 500
+
+    briefing, _, _, image_prompts = result
+    image_urls = []
+    if image_prompts:
+        image_urls = await generate_images_async(image_prompts, api_key, hf_key, backend)
+
+    payload = {
+        'success': True,
+        'explanation': briefing,
+        'images': image_urls,
+        'thumbnails': [thumbnail_url(url) for url in image_urls],
+        'prompts': image_prompts
+    }
+    await asyncio.to_thread(_record_history, session_id, topic, length, "Image Explanation", payload)
+    return payload, 200
+
+
+ASYNC_ROUTES = {
+    '/api/generate-text': generate_text,
+    '/api/generate-code': generate_code,
+    '/api/generate-images': generate_images,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI callable: async API routes natively, everything else through Flask"""
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+
+    handler = None
+    if scope["type"] == "http" and scope["method"] == "POST":
+        handler = ASYNC_ROUTES.get(scope["path"])
+
+    if handler is None:
+        return await wsgi_application(scope, receive, send)
+
+    started = time.perf_counter()
+    headers = []
+    data = await _read_json(receive, app.config['MAX_CONTENT_LENGTH'])
+
+    try:
+        if not isinstance(data, dict):
+            payload, status = {'error': 'Invalid JSON body'}, 400
+        else:
+            payload, status = await handler(data, _session_id(scope))
+            if status == 202:
+                headers.append((b"location", payload['status_url'].encode()))
+
+    except RateLimitError as e:
+        payload = {'error': e.user_message, 'retry_after': e.retry_after}
+        status = e.status_code
+        headers.append((b"retry-after", str(e.retry_after).encode()))
+
+    except Exception as e:
+        logger.error(f"Error in {handler.__name__}: {e}")
+        payload, status = {'error': str(e)}, 500
+
+    await _send_json(send, payload, status, headers, _header(scope, b"accept-encoding"))
+
+    metrics.observe('http_request_seconds', time.perf_counter() - started, route=scope["path"], method="POST")
+    metrics.inc('http_requests_total', route=scope["path"], method="POST", status=status)
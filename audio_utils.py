@@ -1,18 +1,464 @@
-from gtts import gTTS
-import os
+import hashlib
 import logging
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import types
+import wave
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from io import BytesIO
+
+try:
+    from gtts import gTTS
+except ImportError:  # Only needed by the gtts engine
+    gTTS = None
+
+try:
+    from piper.voice import PiperVoice
+except ImportError:  # Optional local engine
+    PiperVoice = None
+
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+AUDIO_DIR = "generated_audio"
+CHUNK_CACHE_DIR = os.path.join(AUDIO_DIR, "chunks")
+TTS_MAX_WORKERS = int(os.getenv('TTS_MAX_WORKERS', '4'))
+TTS_MAX_CHUNK_CHARS = int(os.getenv('TTS_MAX_CHUNK_CHARS', '400'))
+# gtts (Google, network), espeak or piper (local, offline)
+TTS_ENGINE = os.getenv('TTS_ENGINE', 'gtts').lower()
+# Local engines are CPU-bound; by default they get one worker process per core
+TTS_PROCESS_WORKERS = int(os.getenv('TTS_PROCESS_WORKERS', '0')) or os.cpu_count() or 1
+TTS_ESPEAK_BINARY = os.getenv('TTS_ESPEAK_BINARY') or shutil.which('espeak-ng') or 'espeak'
+TTS_ESPEAK_VOICE = os.getenv('TTS_ESPEAK_VOICE', 'en-us')
+TTS_ESPEAK_WPM = int(os.getenv('TTS_ESPEAK_WPM', '170'))
+TTS_PIPER_MODEL = os.getenv('TTS_PIPER_MODEL', '')
+# lame or ffmpeg; local engines produce WAV and are re-encoded so every engine serves MP3
+TTS_MP3_ENCODER = os.getenv('TTS_MP3_ENCODER') or ('lame' if shutil.which('lame') else 'ffmpeg')
+TTS_MP3_BITRATE_KBPS = int(os.getenv('TTS_MP3_BITRATE_KBPS', '64'))
+TTS_SUBPROCESS_TIMEOUT_SECONDS = float(os.getenv('TTS_SUBPROCESS_TIMEOUT_SECONDS', '60'))
+# Run as ``__main__`` in TTS worker processes instead of the parent's entry script
+TTS_WORKER_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_worker.py")
+
+_tts_executor = ThreadPoolExecutor(max_workers=TTS_MAX_WORKERS, thread_name_prefix="tts")
+_process_executor = None
+_executor_lock = threading.Lock()
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+_stats = {"chunks_synthesized": 0, "chunk_cache_hits": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def split_sentences(text, max_chars=TTS_MAX_CHUNK_CHARS):
+    """
+    Split text into synthesis chunks at sentence boundaries.
+
+    Consecutive sentences are packed together up to ``max_chars``; a single
+    sentence longer than that is split at word boundaries.
+
+    Args:
+        text: Text to split
+        max_chars: Maximum characters per chunk
+
+    Returns:
+        List of non-empty text chunks
+    """
+
+    chunks = []
+    current = ""
+
+    for sentence in _SENTENCE_END.split(" ".join(text.split())):
+        if not sentence:
+            continue
+
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def _write_atomic(path, data):
+    # Chunks may be written from worker processes, so the pid goes in the name too
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _run(command, data):
+    """Run a helper program, feeding it ``data`` and returning its stdout."""
+
+    result = subprocess.run(command, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            timeout=TTS_SUBPROCESS_TIMEOUT_SECONDS, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"{command[0]} failed ({result.returncode}): "
+                           f"{result.stderr.decode('utf-8', 'replace').strip()[:200]}")
+    return result.stdout
+
+
+def encode_mp3(wav_data):
+    """
+    Encode WAV bytes to MP3 with TTS_MP3_ENCODER.
+
+    The encoder's info header is left out so segments can be joined byte-wise.
+
+    Args:
+        wav_data: WAV file bytes
+
+    Returns:
+        MP3 bytes
+    """
+
+    if TTS_MP3_ENCODER == "lame":
+        command = ["lame", "--quiet", "-t", "-b", str(TTS_MP3_BITRATE_KBPS), "-", "-"]
+    else:
+        command = [TTS_MP3_ENCODER, "-hide_banner", "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+                   "-f", "mp3", "-b:a", f"{TTS_MP3_BITRATE_KBPS}k", "-write_xing", "0", "pipe:1"]
+    return _run(command, wav_data)
+
+
+class TTSEngine(ABC):
+    """
+    Speech synthesizer used by ``stream_audio``.
+
+    Subclasses turn one text chunk into MP3 bytes. ``synthesize`` runs on
+    the TTS thread pool, or on the TTS process pool when ``use_processes``
+    is set, so an engine must be picklable in that case.
+    """
+
+    name = "engine"
+    use_processes = False
+
+    @property
+    def cache_tag(self):
+        """Prefix for chunk and file cache keys; changes whenever the voice does."""
+        return f"{self.name}\x1f"
+
+    @abstractmethod
+    def synthesize(self, chunk, lang="en"):
+        """Return MP3 bytes for ``chunk`` spoken in ``lang``."""
+
+
+class GTTSEngine(TTSEngine):
+    """Google Translate's TTS endpoint via gTTS; one network round trip per chunk"""
+
+    name = "gtts"
+
+    @property
+    def cache_tag(self):
+        # Empty, so audio generated before engines were pluggable stays valid
+        return ""
+
+    def synthesize(self, chunk, lang="en"):
+        if gTTS is None:
+            raise RuntimeError("gTTS is not installed")
+        buffer = BytesIO()
+        gTTS(text=chunk, lang=lang, slow=False).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class EspeakEngine(TTSEngine):
+    """Offline synthesis with the espeak-ng (or espeak) command-line program"""
+
+    name = "espeak"
+    use_processes = True
+
+    def __init__(self, binary=TTS_ESPEAK_BINARY, voice=TTS_ESPEAK_VOICE, wpm=TTS_ESPEAK_WPM):
+        self.binary = binary
+        self.voice = voice
+        self.wpm = wpm
+
+    @property
+    def cache_tag(self):
+        return f"{self.name}:{self.voice}:{self.wpm}\x1f"
+
+    def synthesize(self, chunk, lang="en"):
+        voice = self.voice if lang == "en" else lang
+        wav_data = _run([self.binary, "-v", voice, "-s", str(self.wpm), "--stdout", "--stdin"],
+                        chunk.encode("utf-8"))
+        return encode_mp3(wav_data)
+
+
+# Piper voices take a while to load, so each worker process keeps its own
+_piper_voices = {}
+
+
+class PiperEngine(TTSEngine):
+    """Offline neural synthesis with a Piper ONNX voice, run in-process"""
+
+    name = "piper"
+    use_processes = True
+
+    def __init__(self, model_path=TTS_PIPER_MODEL):
+        if not model_path:
+            raise ValueError("TTS_PIPER_MODEL must point to a Piper .onnx voice")
+        self.model_path = model_path
+
+    @property
+    def cache_tag(self):
+        return f"{self.name}:{os.path.basename(self.model_path)}\x1f"
+
+    def _voice(self):
+        voice = _piper_voices.get(self.model_path)
+        if voice is None:
+            if PiperVoice is None:
+                raise RuntimeError("piper-tts is not installed")
+            voice = _piper_voices[self.model_path] = PiperVoice.load(self.model_path)
+        return voice
+
+    def synthesize(self, chunk, lang="en"):
+        voice = self._voice()
+        buffer = BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            # piper-tts 1.3 renamed synthesize() to synthesize_wav()
+            getattr(voice, "synthesize_wav", voice.synthesize)(chunk, wav_file)
+        return encode_mp3(buffer.getvalue())
+
+
+_ENGINE_FACTORIES = {
+    "gtts": GTTSEngine,
+    "espeak": EspeakEngine,
+    "piper": PiperEngine,
+}
+_engines = {}
+
+
+def register_engine(name, factory):
+    """
+    Make a TTS engine available under ``name``.
+
+    Args:
+        name: Engine name, as used in TTS_ENGINE
+        factory: Callable with no arguments returning a TTSEngine
+    """
+
+    with _executor_lock:
+        _ENGINE_FACTORIES[name] = factory
+        _engines.pop(name, None)
+
+
+def get_engine(name=None):
+    """
+    Return the TTS engine instance for a name.
+
+    Args:
+        name: Engine name, or None for the deployment's TTS_ENGINE
+
+    Returns:
+        TTSEngine instance, shared between calls
+
+    Raises:
+        ValueError: If no engine has that name
+    """
+
+    name = (name or TTS_ENGINE).lower()
+    with _executor_lock:
+        engine = _engines.get(name)
+        if engine is None:
+            factory = _ENGINE_FACTORIES.get(name)
+            if factory is None:
+                raise ValueError(f"Unknown TTS engine '{name}'; choose from {', '.join(sorted(_ENGINE_FACTORIES))}")
+            engine = _engines[name] = factory()
+    return engine
+
+
+class _TTSWorkerProcess(multiprocessing.context.SpawnProcess):
+    """Spawned process that imports tts_worker.py as its main module rather than the parent's"""
+
+    def start(self):
+        stand_in = types.ModuleType("__main__")
+        stand_in.__file__ = TTS_WORKER_MAIN
+        # The child is told which main module to load from sys.modules["__main__"]
+        # at launch; only the few milliseconds of the launch see the stand-in
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = stand_in
+        try:
+            super().start()
+        finally:
+            sys.modules["__main__"] = main
+
+
+class _TTSWorkerContext(multiprocessing.context.SpawnContext):
+    Process = _TTSWorkerProcess
+
+
+def _executor_for(engine):
+    """Thread pool for I/O-bound engines, the shared process pool for CPU-bound ones"""
+
+    global _process_executor
+    if not engine.use_processes:
+        return _tts_executor
+    with _executor_lock:
+        if _process_executor is None:
+            # spawn, not fork: the web process has threads (and locks) a fork would copy
+            _process_executor = ProcessPoolExecutor(max_workers=TTS_PROCESS_WORKERS,
+                                                    mp_context=_TTSWorkerContext())
+        return _process_executor
+
+
+def _reset_process_pool(broken):
+    global _process_executor
+    with _executor_lock:
+        if _process_executor is broken:
+            _process_executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _synthesize_chunk(engine, chunk, lang="en"):
+    """
+    Synthesize one chunk to MP3 bytes, reusing the content-hash cache.
+
+    Runs on the engine's executor, possibly in a worker process.
+
+    Args:
+        engine: TTSEngine to use
+        chunk: Text to synthesize
+        lang: Language code
+
+    Returns:
+        Tuple of (MP3 bytes, synthesis seconds or None on a cache hit)
+    """
+
+    digest = hashlib.sha256(f"{engine.cache_tag}{lang}\x1f{chunk}".encode("utf-8")).hexdigest()
+    path = os.path.join(CHUNK_CACHE_DIR, f"{digest}.mp3")
+
+    try:
+        with open(path, "rb") as f:
+            return f.read(), None
+    except FileNotFoundError:
+        pass
+
+    started = time.perf_counter()
+    data = engine.synthesize(chunk, lang)
+    elapsed = time.perf_counter() - started
+
+    os.makedirs(CHUNK_CACHE_DIR, exist_ok=True)
+    _write_atomic(path, data)
+    return data, elapsed
 
-def text_to_audio(text, topic="ml_topic"):
+
+def audio_filename(text, topic="ml_topic", engine=None):
     """
-    Converts a string of text into an MP3 audio file using gTTS.
+    Return the deterministic filename for the audio of ``text``.
+
+    Args:
+        text: Text that will be synthesized
+        topic: Topic name for filename
+        engine: Engine name, or None for the deployment's engine
+
+    Returns:
+        Filename inside generated_audio/
+    """
+
+    safe_topic = "".join(c if c.isalnum() else "_" for c in topic)[:30]
+    key = f"{get_engine(engine).cache_tag}{' '.join(text.split())}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    return f"{safe_topic}_{digest}.mp3"
+
+
+def stream_audio(text, topic="ml_topic", lang="en", engine=None):
+    """
+    Synthesize text chunk by chunk and yield MP3 segments in order.
+
+    Chunks are synthesized in parallel on the engine's thread or process
+    pool; each segment is yielded as soon as it and every segment before it
+    are ready. Once all segments have been produced the joined file is saved
+    under ``audio_filename(text, topic)``. Previously generated text is
+    streamed straight from that file.
 
     Args:
         text: Text to convert to audio
         topic: Topic name for filename
+        lang: Language code
+        engine: Engine name, or None for the deployment's TTS_ENGINE
+
+    Yields:
+        MP3 byte segments
+    """
+
+    tts_engine = get_engine(engine)
+    filename = audio_filename(text, topic, engine)
+    filepath = os.path.join(AUDIO_DIR, filename)
+
+    if os.path.exists(filepath):
+        with open(filepath, "rb") as f:
+            while True:
+                block = f.read(64 * 1024)
+                if not block:
+                    return
+                yield block
+
+    executor = _executor_for(tts_engine)
+    futures = [executor.submit(_synthesize_chunk, tts_engine, chunk, lang) for chunk in split_sentences(text)]
+    segments = []
+    try:
+        for future in futures:
+            segment, seconds = future.result()
+            if seconds is None:
+                _count("chunk_cache_hits")
+            else:
+                _count("chunks_synthesized")
+                metrics.observe("stage_seconds", seconds, stage="tts_chunk", engine=tts_engine.name)
+            segments.append(segment)
+            yield segment
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time
+        _count("errors")
+        _reset_process_pool(executor)
+        raise
+    except Exception:
+        _count("errors")
+        raise
+    finally:
+        # Client went away or a chunk failed: don't waste workers on the rest
+        for future in futures:
+            future.cancel()
+
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    _write_atomic(filepath, b"".join(segments))
+    logger.info(f"Audio generated successfully with {tts_engine.name}: {filename}")
+
+
+def text_to_audio(text, topic="ml_topic", engine=None):
+    """
+    Converts a string of text into an MP3 audio file with the configured TTS engine.
+
+    The text is synthesized in parallel sentence chunks (see ``stream_audio``).
+
+    Args:
+        text: Text to convert to audio
+        topic: Topic name for filename
+        engine: Engine name, or None for the deployment's TTS_ENGINE
 
     Returns:
         Filename of generated audio file or None if failed
@@ -23,27 +469,31 @@ def text_to_audio(text, topic="ml_topic"):
         return None
 
     try:
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_topic = "".join(c if c.isalnum() else "_" for c in topic)[:30]
-        filename = f"{safe_topic}_{timestamp}.mp3"
-        filepath = os.path.join("generated_audio", filename)
-
-        # Create directory if not exists
-        os.makedirs("generated_audio", exist_ok=True)
-
-        # Generate audio
-        tts = gTTS(text=text, lang="en", slow=False)
-        tts.save(filepath)
-
-        logger.info(f"Audio generated successfully: {filename}")
-        return filename
+        for _ in stream_audio(text, topic, engine=engine):
+            pass
+        return audio_filename(text, topic, engine)
 
     except Exception as e:
         logger.error(f"Failed to generate audio: {e}")
         return None
 
 
+def get_tts_stats():
+    """
+    Return the TTS engine in use and its counters.
+
+    Returns:
+        Dictionary with engine, process workers, chunks synthesized, cache hits and errors
+    """
+
+    with _stats_lock:
+        stats = dict(_stats)
+    engine = _engines.get(TTS_ENGINE)
+    stats["engine"] = TTS_ENGINE
+    stats["process_workers"] = TTS_PROCESS_WORKERS if engine is not None and engine.use_processes else 0
+    return stats
+
+
 def delete_old_audio_files(max_age_hours=24):
     """
     Delete audio files older than specified hours.
@@ -0,0 +1,200 @@
+"""
+Offline load test for the LearnSphere API routes.
+
+Runs the Flask app in-process against the local Gemini stand-in in
+fake_gemini.py, so no network or API key is needed:
+
+    python benchmark.py --requests 200 --concurrency 16
+    python benchmark.py --scenario images --image-latency-ms 1500 --rate-limit-rate 0.05
+    python benchmark.py --repeat-topics 10 --json results.json
+    python benchmark.py --scenario images --image-tail-rate 0.1 --image-tail-ms 8000 \
+        --standin-backend-latency-ms 2500 --hedge
+
+Reports requests/sec, latency percentiles, status codes and memory use per
+scenario.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import fake_gemini
+
+SCENARIOS = {
+    "text": ("/api/generate-text", "Text explanation"),
+    "code": ("/api/generate-code", "Code with explanation"),
+    "images": ("/api/generate-images", "Image Explanation"),
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the LearnSphere API routes")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--length", default="Brief", help="Explanation length sent with each request")
+    parser.add_argument("--repeat-topics", type=int, default=0,
+                        help="Draw topics from this many distinct values (0 = every request unique)")
+    parser.add_argument("--text-latency-ms", type=float, default=800)
+    parser.add_argument("--image-latency-ms", type=float, default=2000)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream calls failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of upstream calls failing with 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry hint (s) sent with injected 429s")
+    parser.add_argument("--response-chars", type=int, default=4000)
+    parser.add_argument("--image-bytes", type=int, default=300_000)
+    parser.add_argument("--image-prompts", type=int, default=3)
+    parser.add_argument("--image-tail-rate", type=float, default=0.0, help="Fraction of image calls hit by a slow tail")
+    parser.add_argument("--image-tail-ms", type=float, default=0, help="Extra latency of tail image calls")
+    parser.add_argument("--standin-backend-latency-ms", type=float,
+                        help="Add a stand-in image backend with this latency as the fallback")
+    parser.add_argument("--hedge", action="store_true", help="Hedge slow image calls with the fallback backend")
+    parser.add_argument("--respect-rate-limits", action="store_true",
+                        help="Keep the app's local Gemini RPM limits instead of lifting them")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Track peak Python allocations with tracemalloc (slower)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def load_app(args):
+    """Install the fake SDKs, isolate generated files and import the app."""
+
+    fake_gemini.install(fake_gemini.FakeConfig(
+        text_latency_ms=args.text_latency_ms,
+        image_latency_ms=args.image_latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after_seconds=args.retry_after,
+        response_chars=args.response_chars,
+        image_bytes=args.image_bytes,
+        image_prompts=args.image_prompts,
+        image_tail_rate=args.image_tail_rate,
+        image_tail_ms=args.image_tail_ms,
+        seed=args.seed,
+    ))
+
+    if args.standin_backend_latency_ms is not None:
+        os.environ.setdefault("IMAGE_BACKEND_ORDER", "gemini,standin")
+    if args.hedge:
+        os.environ.setdefault("IMAGE_HEDGE", "1")
+        os.environ.setdefault("IMAGE_HEDGE_MIN_SAMPLES", "5")
+
+    if not args.respect_rate_limits:
+        os.environ.setdefault("GEMINI_TEXT_RPM", "1000000")
+        os.environ.setdefault("GEMINI_IMAGE_RPM", "1000000")
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+    # The app writes caches and generated files relative to the working directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # The modules import each other as ``utils.<module>``; without an installed
+    # ``utils`` package, map it onto this directory as tests/conftest.py does
+    if "utils" not in sys.modules and importlib.util.find_spec("utils") is None:
+        package = types.ModuleType("utils")
+        package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+        sys.modules["utils"] = package
+    workdir = tempfile.mkdtemp(prefix="learnsphere_bench_")
+    os.chdir(workdir)
+
+    from app import app
+    app.logger.disabled = True
+    if args.standin_backend_latency_ms is not None:
+        fake_gemini.FakeImageBackend("standin", latency_ms=args.standin_backend_latency_ms,
+                                     jitter_ms=args.jitter_ms, image_bytes=args.image_bytes,
+                                     seed=args.seed).register()
+    return app, workdir
+
+
+def run_scenario(app, name, args):
+    route, _ = SCENARIOS[name]
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(i):
+        topic_id = i % args.repeat_topics if args.repeat_topics else i
+        payload = {"topic": f"{name} benchmark topic {topic_id}", "length": args.length}
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post(route, json=payload)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    return {
+        "scenario": name,
+        "route": route,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(args.requests / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 1),
+            "p95": round(percentile(ordered, 0.95) * 1000, 1),
+            "p99": round(percentile(ordered, 0.99) * 1000, 1),
+            "max": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+        },
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "traced_peak_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None,
+    }
+
+
+def print_report(results, upstream_calls):
+    header = f"{'scenario':<10} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'rss MB':>8}  statuses"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        lat = r["latency_ms"]
+        statuses = ", ".join(f"{code}x{count}" for code, count in r["statuses"].items())
+        print(f"{r['scenario']:<10} {r['requests_per_second']:>8} {lat['p50']:>9} {lat['p95']:>9} "
+              f"{lat['p99']:>9} {lat['max']:>9} {r['peak_rss_mb']:>8}  {statuses}")
+    print(f"\nupstream calls: {upstream_calls}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    app, workdir = load_app(args)
+
+    results = [run_scenario(app, name, args) for name in (args.scenario or list(SCENARIOS))]
+    print_report(results, fake_gemini.config.calls)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "upstream_calls": fake_gemini.config.calls, "workdir": workdir}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
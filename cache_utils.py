@@ -0,0 +1,241 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv('GENAI_CACHE_DIR', 'generated_cache')
+CACHE_MAX_ENTRIES = int(os.getenv('GENAI_CACHE_MAX_ENTRIES', '512'))
+CACHE_TTL_SECONDS = int(os.getenv('GENAI_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+# Expired disk records are kept this much longer, to be served while the upstream is down
+CACHE_STALE_SECONDS = int(os.getenv('GENAI_CACHE_STALE_SECONDS', str(30 * 24 * 3600)))
+
+
+def normalize_text(value):
+    """
+    Normalize a free-text key component (case and whitespace).
+
+    Args:
+        value: Text to normalize
+
+    Returns:
+        Lower-cased text with runs of whitespace collapsed to one space
+    """
+
+    return " ".join(str(value or "").lower().split())
+
+
+def make_cache_key(topic, length, mode):
+    """
+    Build the cache key for a generation request.
+
+    Args:
+        topic: ML topic to explain
+        length: Length of explanation
+        mode: Output mode
+
+    Returns:
+        Hex digest identifying the normalized (topic, length, mode) triple
+    """
+
+    raw = "\x1f".join(normalize_text(part) for part in (topic, length, mode))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for parsed Gemini responses.
+
+    The first tier is an in-memory LRU bounded by ``max_entries``; the second
+    is a directory of JSON files that survives restarts. Both tiers honour the
+    same TTL. Values are the parsed (briefing, code_content, audio_script,
+    image_prompts) tuples returned by ``call_genai``.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS,
+                 stale_seconds=CACHE_STALE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "writes": 0,
+            "stale_hits": 0,
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _is_expired(self, created):
+        return self.ttl_seconds > 0 and time.time() - created > self.ttl_seconds
+
+    def _is_past_stale(self, created):
+        return self.ttl_seconds > 0 and time.time() - created > self.ttl_seconds + self.stale_seconds
+
+    def _remember(self, key, created, value):
+        # Caller must hold the lock
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                record = json.load(f)
+            return record["created"], tuple(record["value"])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key}: {e}")
+            return None
+
+    def _delete_disk(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key):
+        """
+        Look up a cached response.
+
+        Args:
+            key: Cache key from ``make_cache_key``
+
+        Returns:
+            Cached response tuple or None on a miss
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._is_expired(created):
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expirations"] += 1
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            created, value = entry
+            if not self._is_expired(created):
+                with self._lock:
+                    self._remember(key, created, value)
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                return value
+            if self._is_past_stale(created):
+                self._delete_disk(key)
+            with self._lock:
+                self._stats["expirations"] += 1
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def get_stale(self, key):
+        """
+        Look up a response that may have expired, for use when it can't be regenerated.
+
+        Args:
+            key: Cache key from ``make_cache_key``
+
+        Returns:
+            Cached response tuple within the TTL plus the stale period, or None
+        """
+
+        entry = self._read_disk(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if self._is_past_stale(created):
+            return None
+        with self._lock:
+            self._stats["stale_hits"] += 1
+        return value
+
+    def set(self, key, value, **metadata):
+        """
+        Store a response in both tiers.
+
+        Args:
+            key: Cache key from ``make_cache_key``
+            value: Response tuple to store
+            **metadata: Extra JSON-serializable fields kept in the disk record
+        """
+
+        created = time.time()
+        value = tuple(value)
+
+        with self._lock:
+            self._remember(key, created, value)
+            self._stats["writes"] += 1
+
+        record = dict(metadata, created=created, value=list(value))
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.error(f"Error writing cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+
+        with self._lock:
+            self._entries.clear()
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(".json"):
+                self._delete_disk(filename[:-len(".json")])
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            Dictionary of hit/miss/eviction counters and current sizes
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
+
+
+response_cache = ResponseCache()
+
+
+def get_cache_stats():
+    """
+    Return counters for the shared response cache.
+
+    Returns:
+        Dictionary with cache statistics
+    """
+
+    return response_cache.stats()
@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from google.genai import Client, types
+
+logger = logging.getLogger(__name__)
+
+CLIENT_POOL_MAX_KEYS = int(os.getenv('CLIENT_POOL_MAX_KEYS', '32'))
+
+
+class _BoundedRegistry:
+    """Thread-safe LRU map that builds missing entries under a lock."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.reused += 1
+                return entry
+
+            entry = factory()
+            self._entries[key] = entry
+            self.created += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "created": self.created, "reused": self.reused}
+
+
+_text_clients = _BoundedRegistry(CLIENT_POOL_MAX_KEYS)
+_text_models = _BoundedRegistry(CLIENT_POOL_MAX_KEYS * 8)
+_async_text_clients = _BoundedRegistry(CLIENT_POOL_MAX_KEYS)
+_image_clients = _BoundedRegistry(CLIENT_POOL_MAX_KEYS)
+
+
+def _config_key(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class TextModel:
+    """
+    A Gemini text model bound to one API key's google.genai Client.
+
+    Keeps the ``generate_content(contents, stream=False)`` and
+    ``generate_content_async(contents)`` calls of google.generativeai's
+    GenerativeModel, but is built only from public google.genai
+    constructors, so the key is passed explicitly rather than set on SDK
+    internals.
+    """
+
+    def __init__(self, client, model_name, generation_config, safety_settings=None):
+        self.client = client
+        self.model_name = model_name
+        self.config = types.GenerateContentConfig(
+            **generation_config,
+            safety_settings=[types.SafetySetting(**setting) for setting in safety_settings or []]
+        )
+
+    def generate_content(self, contents, stream=False):
+        if stream:
+            return self._stream(contents)
+        return self.client.models.generate_content(model=self.model_name, contents=contents, config=self.config)
+
+    def _stream(self, contents):
+        # The request is only sent on the first next(); start it here so rate limits
+        # and connection errors raise from generate_content, where they can be retried
+        chunks = self.client.models.generate_content_stream(model=self.model_name, contents=contents,
+                                                            config=self.config)
+        first = next(chunks, None)
+        return itertools.chain([] if first is None else [first], chunks)
+
+    async def generate_content_async(self, contents):
+        return await self.client.aio.models.generate_content(model=self.model_name, contents=contents,
+                                                             config=self.config)
+
+
+_loop_ids = weakref.WeakKeyDictionary()
+_loop_counter = itertools.count(1)
+_loop_ids_lock = threading.Lock()
+
+
+def _loop_id():
+    """Id of the running event loop, never reused by a later loop (unlike ``id(loop)``)."""
+
+    loop = asyncio.get_running_loop()
+    with _loop_ids_lock:
+        if loop not in _loop_ids:
+            _loop_ids[loop] = next(_loop_counter)
+        return _loop_ids[loop]
+
+
+def _get_text_client(api_key):
+    """
+    Return the google.genai Client for an API key.
+
+    Each key gets its own client (and connection pool) instead of going
+    through process-global configuration, so concurrent requests with
+    different keys cannot see each other's credentials.
+    """
+
+    return _text_clients.get_or_create(api_key, lambda: Client(api_key=api_key))
+
+
+def get_text_model(api_key, model_name, generation_config, safety_settings=None):
+    """
+    Return a cached TextModel bound to ``api_key``.
+
+    Args:
+        api_key: Gemini API key
+        model_name: Gemini model name
+        generation_config: Generation config dictionary
+        safety_settings: Safety settings list
+
+    Returns:
+        TextModel that reuses the key's client connection
+    """
+
+    key = (api_key, model_name, _config_key(generation_config), _config_key(safety_settings))
+    return _text_models.get_or_create(
+        key,
+        lambda: TextModel(_get_text_client(api_key), model_name, generation_config, safety_settings)
+    )
+
+
+def get_async_text_model(api_key, model_name, generation_config, safety_settings=None):
+    """
+    Return a cached TextModel for ``generate_content_async``.
+
+    Must be called from inside the event loop that will await the model:
+    an async client's connection pool is bound to the loop it is first used
+    on, so clients and models are cached per loop and kept apart from the
+    sync ones.
+
+    Args:
+        api_key: Gemini API key
+        model_name: Gemini model name
+        generation_config: Generation config dictionary
+        safety_settings: Safety settings list
+
+    Returns:
+        TextModel ready for ``generate_content_async``
+    """
+
+    loop_id = _loop_id()
+    key = ("async", loop_id, api_key, model_name, _config_key(generation_config), _config_key(safety_settings))
+    return _text_models.get_or_create(
+        key,
+        lambda: TextModel(_async_text_clients.get_or_create((loop_id, api_key), lambda: Client(api_key=api_key)),
+                          model_name, generation_config, safety_settings)
+    )
+
+
+def get_image_client(api_key, timeout_seconds):
+    """
+    Return a cached google.genai Client for image generation.
+
+    Args:
+        api_key: Gemini API key
+        timeout_seconds: HTTP timeout applied to every request
+
+    Returns:
+        Client whose HTTP connection pool is shared by all callers with this key
+    """
+
+    return _image_clients.get_or_create(
+        (api_key, timeout_seconds),
+        lambda: Client(api_key=api_key, http_options=types.HttpOptions(timeout=int(timeout_seconds * 1000)))
+    )
+
+
+def get_pool_stats():
+    """
+    Return client registry sizes and reuse counters.
+
+    Returns:
+        Dictionary with one entry per registry
+    """
+
+    return {
+        "text_clients": _text_clients.stats(),
+        "text_models": _text_models.stats(),
+        "async_text_clients": _async_text_clients.stats(),
+        "image_clients": _image_clients.stats(),
+    }
@@ -1,9 +1,28 @@
-import os
 import logging
-from datetime import datetime
+
+from utils.code_store import save_code
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Import name -> pip package for the libraries generated code typically uses
+COMMON_IMPORTS = {
+    'sklearn': 'scikit-learn',
+    'pandas': 'pandas',
+    'numpy': 'numpy',
+    'matplotlib': 'matplotlib',
+    'seaborn': 'seaborn',
+    'tensorflow': 'tensorflow',
+    'torch': 'torch',
+    'cv2': 'opencv-python',
+    'PIL': 'Pillow',
+    'plotly': 'plotly',
+    'keras': 'keras',
+    'scipy': 'scipy',
+    'xgboost': 'xgboost',
+    'lightgbm': 'lightgbm'
+}
+
 
 def detect_dependencies(code):
     """
@@ -18,24 +37,7 @@ def detect_dependencies(code):
 
     dependencies = []
 
-    common_imports = {
-        'sklearn': 'scikit-learn',
-        'pandas': 'pandas',
-        'numpy': 'numpy',
-        'matplotlib': 'matplotlib',
-        'seaborn': 'seaborn',
-        'tensorflow': 'tensorflow',
-        'torch': 'torch',
-        'cv2': 'opencv-python',
-        'PIL': 'Pillow',
-        'plotly': 'plotly',
-        'keras': 'keras',
-        'scipy': 'scipy',
-        'xgboost': 'xgboost',
-        'lightgbm': 'lightgbm'
-    }
-
-    for import_name, package_name in common_imports.items():
+    for import_name, package_name in COMMON_IMPORTS.items():
         if f"import {import_name}" in code or f"from {import_name}" in code:
             dependencies.append(package_name)
 
@@ -44,14 +46,14 @@ def detect_dependencies(code):
 
 def save_code_to_file(code, topic):
     """
-    Save generated code to a file.
+    Save generated code to the content-addressed code store.
 
     Args:
         code: Python code string
-        topic: Topic name for filename
+        topic: Topic the code was generated for
 
     Returns:
-        Filename of saved code or None if failed
+        Filename of saved code (``<sha256>.py``) or None if failed
     """
 
     if not code or not code.strip():
@@ -59,20 +61,8 @@ def save_code_to_file(code, topic):
         return None
 
     try:
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_topic = "".join(c if c.isalnum() else "_" for c in topic)[:30]
-        filename = f"{safe_topic}_{timestamp}.py"
-        filepath = os.path.join("generated_code", filename)
-
-        # Create directory if not exists
-        os.makedirs("generated_code", exist_ok=True)
-
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(code)
-
-        logger.info(f"Code saved successfully: {filename}")
-        return filename
+        with metrics.timer("stage_seconds", stage="save_code"):
+            return save_code(code, topic, detect_dependencies(code))
 
     except Exception as e:
         logger.error(f"Error saving code: {e}")
@@ -0,0 +1,472 @@
+import codecs
+import hmac
+import itertools
+import json
+import logging
+import os
+import queue
+import select
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows has no rlimits or namespaces
+    resource = None
+
+from utils.code_executor import COMMON_IMPORTS
+
+logger = logging.getLogger(__name__)
+
+# Running generated code is opt-in, and every request must carry CODE_RUNNER_TOKEN
+CODE_RUNNER_ENABLED = os.getenv('CODE_RUNNER_ENABLED', '0') == '1'
+CODE_RUNNER_TOKEN = os.getenv('CODE_RUNNER_TOKEN', '')
+RUNNER_POOL_SIZE = int(os.getenv('CODE_RUNNER_POOL_SIZE', '2'))
+RUNNER_PRELOAD = [
+    name.strip() for name in os.getenv('CODE_RUNNER_PRELOAD', ','.join(COMMON_IMPORTS)).split(',') if name.strip()
+]
+RUN_CPU_SECONDS = int(os.getenv('CODE_RUN_CPU_SECONDS', '10'))
+RUN_MEMORY_MB = int(os.getenv('CODE_RUN_MEMORY_MB', '1024'))
+RUN_WALL_SECONDS = float(os.getenv('CODE_RUN_WALL_SECONDS', '20'))
+RUN_MAX_OUTPUT_BYTES = int(os.getenv('CODE_RUN_MAX_OUTPUT_BYTES', str(1024 * 1024)))
+RUN_MAX_PROCESSES = int(os.getenv('CODE_RUN_MAX_PROCESSES', '16'))
+RUN_MAX_FILE_BYTES = 16 * 1024 * 1024
+RUNNER_ACQUIRE_TIMEOUT = float(os.getenv('CODE_RUNNER_ACQUIRE_TIMEOUT', '30'))
+# nsjail, bwrap, or unshare (util-linux; the app needs CAP_SYS_ADMIN for it)
+RUNNER_SANDBOX = os.getenv('CODE_RUNNER_SANDBOX', 'nsjail').lower()
+# Pool slot N runs as uid RUNNER_UID_BASE + N, so no two runs share a uid (or an RLIMIT_NPROC count)
+RUNNER_UID_BASE = int(os.getenv('CODE_RUNNER_UID_BASE', '60000'))
+RUNNER_GID = int(os.getenv('CODE_RUNNER_GID', '65534'))
+# cgroup v2 directory delegated to the app; each run gets a child cgroup that is killed as a whole
+RUNNER_CGROUP_ROOT = os.getenv('CODE_RUNNER_CGROUP_ROOT', '')
+
+# The sandbox sees only these variables; nothing from the app's environment is passed on
+SANDBOX_ENV = {
+    "PATH": "/usr/local/bin:/usr/bin:/bin",
+    "HOME": "/tmp",
+    "LANG": "C.UTF-8",
+    "MPLBACKEND": "Agg",
+    "PYTHONDONTWRITEBYTECODE": "1",
+}
+SYSTEM_RO_PATHS = ["/usr", "/bin", "/lib", "/lib64", "/etc/ld.so.cache", "/etc/localtime"]
+
+# Runs inside the sandbox: preload quietly, read one job from stdin, limit itself and run it
+_BOOTSTRAP = r'''
+import os, sys, json, importlib, resource, traceback
+sys.path[:0] = json.loads(sys.argv[1])
+devnull = os.open(os.devnull, os.O_RDWR)
+saved = (os.dup(1), os.dup(2))
+os.dup2(devnull, 1)
+os.dup2(devnull, 2)
+for name in json.loads(sys.argv[2]):
+    try:
+        importlib.import_module(name)
+    except Exception:
+        pass
+os.dup2(saved[0], 1)
+os.dup2(saved[1], 2)
+
+limits = json.loads(sys.stdin.buffer.readline())
+code = sys.stdin.buffer.read().decode("utf-8")
+os.dup2(devnull, 0)
+sys.stdin = open(os.devnull)
+
+try:
+    with open("/proc/self/statm") as f:
+        preloaded = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+except (OSError, ValueError):
+    preloaded = 0
+memory = preloaded + limits["memory_mb"] * 1024 * 1024
+for limit, value in ((resource.RLIMIT_CPU, limits["cpu_seconds"]), (resource.RLIMIT_AS, memory),
+                     (resource.RLIMIT_FSIZE, limits["max_file_bytes"]), (resource.RLIMIT_NPROC, limits["max_processes"])):
+    resource.setrlimit(limit, (value, value))
+
+sys.argv = ["generated_code.py"]
+exit_code = 1
+try:
+    exec(compile(code, "generated_code.py", "exec"), {"__name__": "__main__"})
+    exit_code = 0
+except SystemExit as e:
+    exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+except BaseException:
+    traceback.print_exc()
+finally:
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(exit_code)
+'''
+
+_run_ids = itertools.count()
+
+if CODE_RUNNER_ENABLED and not CODE_RUNNER_TOKEN:
+    logger.warning("CODE_RUNNER_ENABLED is set without CODE_RUNNER_TOKEN; all run requests will be refused.")
+
+
+def runner_authorized(authorization):
+    """
+    Check a request's Authorization header against CODE_RUNNER_TOKEN.
+
+    Args:
+        authorization: Value of the Authorization header ("Bearer <token>")
+
+    Returns:
+        True only if a token is configured and the header carries it
+    """
+
+    if not CODE_RUNNER_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), CODE_RUNNER_TOKEN.encode())
+
+
+def default_limits():
+    """
+    Return the configured per-run resource limits.
+
+    Returns:
+        Dictionary with cpu_seconds, memory_mb, wall_seconds, max_output_bytes,
+        max_processes and max_file_bytes
+    """
+
+    return {
+        "cpu_seconds": RUN_CPU_SECONDS,
+        "memory_mb": RUN_MEMORY_MB,
+        "wall_seconds": RUN_WALL_SECONDS,
+        "max_output_bytes": RUN_MAX_OUTPUT_BYTES,
+        "max_processes": RUN_MAX_PROCESSES,
+        "max_file_bytes": RUN_MAX_FILE_BYTES,
+    }
+
+
+def _hidden_paths():
+    """App directories the sandbox must not see: the working directory and the utils package's parent"""
+
+    paths = sorted({os.getcwd(), os.path.dirname(os.path.dirname(os.path.abspath(__file__)))} - {os.sep})
+    # Covering a parent already covers what is inside it
+    return [path for i, path in enumerate(paths) if not _is_under(path, paths[:i])]
+
+
+def _is_under(path, parents):
+    return any(path == parent or path.startswith(parent.rstrip(os.sep) + os.sep) for parent in parents)
+
+
+def _python_paths(hidden):
+    """Import paths the sandboxed interpreter needs, minus anything inside the app directories"""
+
+    return [path for path in dict.fromkeys(os.path.abspath(p) for p in sys.path if p)
+            if os.path.isdir(path) and not _is_under(path, hidden)]
+
+
+class _RunCgroup:
+    """Child cgroup holding one sandbox and everything it starts"""
+
+    def __init__(self, name, max_processes):
+        self.path = os.path.join(RUNNER_CGROUP_ROOT, name)
+        os.mkdir(self.path)
+        # pids.max exists only when the pids controller is enabled for the delegated root
+        if os.path.exists(os.path.join(self.path, "pids.max")):
+            self._write("pids.max", max_processes + 4)
+
+    def _write(self, name, value):
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(str(value))
+
+    def add(self, pid):
+        self._write("cgroup.procs", pid)
+
+    def kill(self, timeout=5.0):
+        """SIGKILL every process in the cgroup, wait for it to empty and remove it."""
+
+        try:
+            self._write("cgroup.kill", 1)
+        except FileNotFoundError:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with open(os.path.join(self.path, "cgroup.events")) as f:
+                if "populated 0" in f.read():
+                    break
+            time.sleep(0.01)
+        try:
+            os.rmdir(self.path)
+        except OSError as e:
+            logger.error(f"Could not remove run cgroup {self.path}: {e}")
+
+
+class _Sandbox:
+    """
+    One isolated, pre-warmed interpreter that runs exactly one job.
+
+    Started through RUNNER_SANDBOX with fresh network, mount, PID, IPC and
+    UTS namespaces, an unprivileged uid of its own and an empty environment.
+    A gate holds the wrapper until its pid is in the run cgroup, so every
+    process it ever starts is in there too and dies with ``destroy()``.
+    """
+
+    def __init__(self, slot, preload, hidden):
+        self.slot = slot
+        self.uid = RUNNER_UID_BASE + slot
+        self.workdir = None
+        self.cgroup = _RunCgroup(f"run-{os.getpid()}-{slot}-{next(_run_ids)}", RUN_MAX_PROCESSES)
+        self.process = None
+        try:
+            command = self._command(preload, hidden)
+            self.process = subprocess.Popen(
+                ["/bin/sh", "-c", 'read -r _ && exec "$@"', "sandbox-gate"] + command,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                env=dict(SANDBOX_ENV), close_fds=True
+            )
+            self.cgroup.add(self.process.pid)
+            self.process.stdin.write(b"\n")
+            self.process.stdin.flush()
+        except Exception:
+            self.destroy()
+            raise
+
+    def _command(self, preload, hidden):
+        python_paths = _python_paths(hidden)
+        python = [sys.executable, "-I", "-c", _BOOTSTRAP, json.dumps(python_paths), json.dumps(preload)]
+        prefixes = {sys.prefix, sys.base_prefix, sys.exec_prefix}
+        ro_paths = [path for path in dict.fromkeys(SYSTEM_RO_PATHS + sorted(prefixes) + python_paths)
+                    if os.path.exists(path)]
+
+        if RUNNER_SANDBOX == "nsjail":
+            # nsjail unshares every namespace by default; rlimits are set by the bootstrap
+            command = ["nsjail", "--mode", "o", "--quiet", "--user", str(self.uid), "--group", str(RUNNER_GID),
+                       "--hostname", "sandbox", "--cwd", "/tmp", "--time_limit", "0",
+                       "--rlimit_as", "max", "--rlimit_cpu", "max", "--rlimit_fsize", "max",
+                       "--rlimit_nofile", "max", "--rlimit_nproc", "max",
+                       "--tmpfsmount", "/tmp", "--bindmount_ro", "/dev/null", "--bindmount_ro", "/dev/urandom"]
+            for path in ro_paths:
+                command += ["--bindmount_ro", path]
+            for key, value in SANDBOX_ENV.items():
+                command += ["--env", f"{key}={value}"]
+            return command + ["--"] + python
+
+        if RUNNER_SANDBOX == "bwrap":
+            command = ["bwrap", "--unshare-all", "--die-with-parent", "--new-session",
+                       "--uid", str(self.uid), "--gid", str(RUNNER_GID), "--clearenv",
+                       "--proc", "/proc", "--dev", "/dev", "--tmpfs", "/tmp", "--chdir", "/tmp"]
+            for path in ro_paths:
+                command += ["--ro-bind", path, path]
+            for key, value in SANDBOX_ENV.items():
+                command += ["--setenv", key, value]
+            return command + ["--"] + python
+
+        if RUNNER_SANDBOX == "unshare":
+            # Same filesystem as the host minus the app directories, which are covered with empty tmpfs
+            self.workdir = tempfile.mkdtemp(prefix="learnsphere_run_")
+            os.chown(self.workdir, self.uid, RUNNER_GID)
+            mounts = " && ".join(f"mount -t tmpfs -o size=1m,mode=0 tmpfs {shlex.quote(path)}" for path in hidden) or "true"
+            env = [f"{key}={value}" for key, value in SANDBOX_ENV.items() if key != "HOME"]
+            return ["unshare", "--net", "--mount", "--pid", "--ipc", "--uts", "--fork", "--kill-child",
+                    "--mount-proc", "/bin/sh", "-c", f'{mounts} && cd "$0" && exec "$@"', self.workdir,
+                    "setpriv", f"--reuid={self.uid}", f"--regid={RUNNER_GID}", "--clear-groups",
+                    "--no-new-privs", "--inh-caps=-all", "--bounding-set=-all",
+                    "env", "-i", f"HOME={self.workdir}", *env] + python
+
+        raise RuntimeError(f"Unknown CODE_RUNNER_SANDBOX '{RUNNER_SANDBOX}'")
+
+    def run(self, code, limits):
+        """Hand the job to the sandbox and relay its output until it exits or the wall clock runs out."""
+
+        started = time.monotonic()
+        try:
+            self.process.stdin.write(json.dumps(limits).encode("utf-8") + b"\n" + code.encode("utf-8"))
+            self.process.stdin.close()
+        except BrokenPipeError:
+            raise RuntimeError("Code runner sandbox failed to start")
+
+        streams = {self.process.stdout.fileno(): "stdout", self.process.stderr.fileno(): "stderr"}
+        # A multibyte character may straddle two reads
+        decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in streams.values()}
+        deadline = started + limits["wall_seconds"]
+        sent = 0
+        truncated = False
+        timed_out = False
+        exited_at = None
+
+        while streams:
+            now = time.monotonic()
+            if now >= deadline:
+                timed_out = self.process.poll() is None
+                break
+            if exited_at is None and self.process.poll() is not None:
+                exited_at = now
+            elif exited_at is not None and now - exited_at > 0.5:
+                # The script is gone but something it started still holds the pipes open
+                break
+            ready, _, _ = select.select(list(streams), [], [], min(deadline - now, 0.1))
+            for fd in ready:
+                data = os.read(fd, 4096)
+                if not data:
+                    del streams[fd]
+                    continue
+                if sent < limits["max_output_bytes"]:
+                    text = decoders[streams[fd]].decode(data)
+                    if text:
+                        yield streams[fd], text
+                    sent += len(data)
+                else:
+                    truncated = True
+
+        for name, decoder in decoders.items():
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield name, text
+
+        exit_code = None
+        if not timed_out:
+            try:
+                exit_code = self.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                pass
+        yield "exit", {
+            "exit_code": exit_code,
+            "timed_out": timed_out,
+            "truncated": truncated,
+            "duration": round(time.monotonic() - started, 3),
+        }
+
+    def destroy(self):
+        """Kill everything in the run cgroup and release the sandbox's resources."""
+
+        self.cgroup.kill()
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+                try:
+                    pipe.close()
+                except Exception:
+                    pass
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class WarmRunnerPool:
+    """
+    Pool of pre-started, isolated sandboxes for running generated code.
+
+    Each sandbox has already imported the libraries in RUNNER_PRELOAD and
+    waits for one job; afterwards its whole cgroup is killed and a fresh
+    sandbox takes the slot, so nothing a run leaves behind reaches the next.
+    Runs are confined by namespaces, a per-slot uid, CPU, memory, file-size,
+    process-count and wall-clock limits.
+    """
+
+    def __init__(self, size=RUNNER_POOL_SIZE, preload=RUNNER_PRELOAD):
+        self.size = size
+        self.preload = preload
+        self._idle = queue.Queue()
+        self._down = set()
+        self._spawning = set()
+        self._hidden = []
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _check_host(self):
+        if resource is None or sys.platform != 'linux':
+            raise RuntimeError("Sandboxed code execution requires a Linux host")
+        if not shutil.which(RUNNER_SANDBOX, path=SANDBOX_ENV["PATH"]):
+            raise RuntimeError(f"Sandbox program '{RUNNER_SANDBOX}' is not installed")
+        if not RUNNER_CGROUP_ROOT or not os.path.exists(os.path.join(RUNNER_CGROUP_ROOT, "cgroup.procs")):
+            raise RuntimeError("CODE_RUNNER_CGROUP_ROOT must name a cgroup v2 directory delegated to the app")
+
+    def _claim(self, slots):
+        """Mark slots as spawning; caller must hold the lock. Each slot uid may back only one sandbox."""
+
+        self._down.difference_update(slots)
+        self._spawning.update(slots)
+        return slots
+
+    def _spawn(self, slot):
+        """Start a sandbox for a slot claimed with ``_claim``; the slot goes back to down if that fails."""
+
+        try:
+            sandbox = _Sandbox(slot, self.preload, self._hidden)
+        except Exception as e:
+            logger.error(f"Could not start code runner sandbox {slot}: {e}")
+            with self._lock:
+                self._spawning.discard(slot)
+                self._down.add(slot)
+            return
+        with self._lock:
+            self._spawning.discard(slot)
+        self._idle.put(sandbox)
+
+    def start(self):
+        """Start the sandboxes if they are not running yet."""
+
+        with self._lock:
+            if self._started:
+                return
+            self._check_host()
+            self._hidden = _hidden_paths()
+            self._started = True
+            slots = self._claim(list(range(self.size)))
+        for slot in slots:
+            self._spawn(slot)
+        logger.info(f"Started {self.size} {RUNNER_SANDBOX} code runner(s) preloading {', '.join(self.preload)}")
+
+    def run(self, code, limits=None):
+        """
+        Run code in a warm sandbox and stream its output.
+
+        Args:
+            code: Python source to execute
+            limits: Optional overrides for ``default_limits()``
+
+        Yields:
+            Tuples of ("stdout" | "stderr", text) followed by one ("exit", info)
+        """
+
+        self.start()
+        limits = dict(default_limits(), **(limits or {}))
+
+        with self._lock:
+            down = self._claim(list(self._down))
+        for slot in down:
+            self._spawn(slot)
+
+        try:
+            sandbox = self._idle.get(timeout=RUNNER_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("All code runners are busy, please try again shortly")
+
+        try:
+            yield from sandbox.run(code, limits)
+        finally:
+            # Finished, timed out or abandoned: nothing of this run may outlive it
+            sandbox.destroy()
+            with self._lock:
+                self._claim([sandbox.slot])
+            self._spawn(sandbox.slot)
+
+
+runner_pool = WarmRunnerPool()
+
+
+def run_code(code, limits=None):
+    """
+    Run generated code in the shared warm runner pool.
+
+    Args:
+        code: Python source to execute
+        limits: Optional overrides for ``default_limits()``
+
+    Yields:
+        Tuples of ("stdout" | "stderr", text) followed by one ("exit", info)
+    """
+
+    return runner_pool.run(code, limits)
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zipfile
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+CODE_STORE_DIR = os.getenv('CODE_STORE_DIR', 'generated_code')
+CODE_BUNDLE_CHUNK_BYTES = 64 * 1024
+
+# Scripts are "<sha256>.py"; older "<topic>_<timestamp>.py" files are still served
+_FILENAME_RE = re.compile(r'^([0-9a-f]{64})\.py$')
+
+_stats = {"saves": 0, "dedup_hits": 0, "bytes_written": 0, "bundles": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _metadata_path(digest):
+    return os.path.join(CODE_STORE_DIR, 'meta', f"{digest}.json")
+
+
+def display_name(topic):
+    """Filesystem-safe script name for a topic, without extension."""
+
+    return "".join(c if c.isalnum() else "_" for c in topic)[:30] or "generated_code"
+
+
+def save_code(code, topic, dependencies=None):
+    """
+    Store a script under its content hash and index its metadata.
+
+    Identical code maps to one file; the metadata of the first save is kept.
+
+    Args:
+        code: Python code string
+        topic: Topic the code was generated for
+        dependencies: pip packages the code needs
+
+    Returns:
+        Stored filename (``<sha256>.py``)
+    """
+
+    data = code.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    filename = f"{digest}.py"
+    path = os.path.join(CODE_STORE_DIR, filename)
+
+    if os.path.exists(path) and os.path.exists(_metadata_path(digest)):
+        _count("dedup_hits")
+        logger.info(f"Code already stored as {filename}")
+        return filename
+
+    os.makedirs(os.path.dirname(_metadata_path(digest)), exist_ok=True)
+    _write_atomic(path, data)
+    # The index entry goes last, so its presence means the script is complete
+    metadata = {
+        "digest": digest,
+        "topic": topic,
+        "name": display_name(topic),
+        "size": len(data),
+        "dependencies": sorted(dependencies or []),
+        "created_at": time.time(),
+    }
+    _write_atomic(_metadata_path(digest), json.dumps(metadata).encode('utf-8'))
+
+    _count("saves")
+    _count("bytes_written", len(data))
+    logger.info(f"Stored code {filename} ({len(data)} bytes)")
+    return filename
+
+
+def code_path(filename):
+    """
+    Resolve a stored script filename to its path.
+
+    Args:
+        filename: Filename as returned by ``save_code``, or a legacy timestamped name
+
+    Returns:
+        Filesystem path, or None if the file is missing
+    """
+
+    filename = secure_filename(filename or '')
+    if not filename.endswith('.py'):
+        return None
+    path = os.path.abspath(os.path.join(CODE_STORE_DIR, filename))
+    return path if os.path.isfile(path) else None
+
+
+def code_metadata(filename):
+    """
+    Look up the index entry for a stored script.
+
+    Args:
+        filename: Stored script filename
+
+    Returns:
+        Metadata dictionary, or None for legacy files and unknown names
+    """
+
+    match = _FILENAME_RE.match(filename or '')
+    if not match:
+        return None
+    try:
+        with open(_metadata_path(match.group(1)), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def code_digest(filename):
+    """Return the content hash in a stored script filename, or None for legacy names."""
+
+    match = _FILENAME_RE.match(filename or '')
+    return match.group(1) if match else None
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_bundle(filename, name, requirements):
+    """
+    Stream a zip of a stored script and its requirements.txt.
+
+    The archive is written to an unseekable sink, so zipfile emits data
+    descriptors and each compressed block can be yielded as soon as it
+    exists; memory use stays at about one chunk whatever the script size.
+
+    Args:
+        filename: Stored script filename
+        name: Script name inside the archive, without extension
+        requirements: pip packages for requirements.txt
+
+    Yields:
+        Chunks of the zip archive
+    """
+
+    path = code_path(filename)
+    if not path:
+        raise FileNotFoundError(filename)
+
+    date_time = time.localtime(os.path.getmtime(path))[:6]
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        script = zipfile.ZipInfo(f"{name}.py", date_time=date_time)
+        script.compress_type = zipfile.ZIP_DEFLATED
+        with open(path, 'rb') as source, bundle.open(script, 'w') as target:
+            for block in iter(lambda: source.read(CODE_BUNDLE_CHUNK_BYTES), b''):
+                target.write(block)
+                data = sink.drain()
+                if data:
+                    yield data
+
+        manifest = zipfile.ZipInfo("requirements.txt", date_time=date_time)
+        manifest.compress_type = zipfile.ZIP_DEFLATED
+        bundle.writestr(manifest, "".join(f"{package}\n" for package in sorted(requirements)))
+        yield sink.drain()
+
+    # Closing the archive writes the central directory
+    yield sink.drain()
+    _count("bundles")
+
+
+def get_code_store_stats():
+    """
+    Return counters for the generated code store.
+
+    Returns:
+        Dictionary with saves, dedup hits, bytes written and bundles
+    """
+
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,437 @@
+"""
+Local stand-in for the Google Gemini SDKs used by LearnSphere.
+
+``install()`` registers fake ``google.generativeai``, ``google.api_core``,
+``google.ai.generativelanguage`` and ``google.genai`` modules in
+``sys.modules`` so the app can be driven offline. Latency, error rate,
+429 injection and response sizes are controlled through ``FakeConfig``.
+``FakeImageBackend`` is a stand-in for a second image provider, for
+exercising fallback and hedging, and ``FakeTTSEngine`` stands in for a
+speech engine.
+"""
+
+import asyncio
+import math
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import types
+import zlib
+from http import HTTPStatus
+
+
+class FakeConfig:
+    """Knobs for the fake upstream; all latencies are in milliseconds."""
+
+    def __init__(self, text_latency_ms=800, image_latency_ms=2000, jitter_ms=100, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after_seconds=1, response_chars=4000, image_bytes=300_000,
+                 image_prompts=3, stream_chunks=20, image_tail_rate=0.0, image_tail_ms=0, seed=None):
+        self.text_latency_ms = text_latency_ms
+        self.image_latency_ms = image_latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.response_chars = response_chars
+        self.image_bytes = image_bytes
+        self.image_prompts = image_prompts
+        self.stream_chunks = stream_chunks
+        # A fraction of image calls that take image_tail_ms longer (a slow provider's tail)
+        self.image_tail_rate = image_tail_rate
+        self.image_tail_ms = image_tail_ms
+        self.random = random.Random(seed)
+        self.calls = {"text": 0, "image": 0, "rate_limited": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def delay(self, base_ms):
+        with self._lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, base_ms + jitter) / 1000.0
+
+    def image_delay(self):
+        with self._lock:
+            tail = self.image_tail_ms if self.random.random() < self.image_tail_rate else 0
+        return self.delay(self.image_latency_ms + tail)
+
+    def maybe_fail(self, kind, exceptions):
+        with self._lock:
+            self.calls[kind] += 1
+            roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            with self._lock:
+                self.calls["rate_limited"] += 1
+            raise exceptions["rate_limited"](
+                f"429 Resource has been exhausted (e.g. check quota). Please retry in {self.retry_after_seconds}s."
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.calls["errors"] += 1
+            raise exceptions["error"]("500 Internal error encountered.")
+
+
+config = FakeConfig()
+
+
+def _png(size_bytes, rng):
+    """A decodable RGB PNG of random pixels, roughly ``size_bytes`` long."""
+
+    side = max(1, int(math.sqrt(size_bytes / 3)))
+    raw = b"".join(b"\x00" + rng.randbytes(side * 3) for _ in range(side))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+def _response_text(prompt):
+    """Build a response with the sections each mode's parser looks for."""
+
+    match = re.search(r'Topic: "(.*?)"', prompt)
+    topic = match.group(1) if match else "the topic"
+    filler = "Gradient descent updates parameters in the direction that reduces the loss. "
+    body = (filler * (config.response_chars // len(filler) + 1))[:config.response_chars]
+    parts = ["LEARNING OBJECTIVE", body]
+    if "Python program" in prompt:
+        parts.append("```python\nimport numpy as np\n\nweights = np.zeros(3)\nprint(weights)\n```")
+    for i in range(config.image_prompts):
+        parts.append(f"IMG-PROMPT: Diagram {i + 1} showing how {topic} traverses the loss surface step by step")
+    return "\n\n".join(parts)
+
+
+class _UsageMetadata:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class _TextResponse:
+    def __init__(self, prompt, text, finish_reason="STOP", generated=None):
+        self.text = text
+        # Like the real API, streamed chunks report usage so far
+        self.usage_metadata = _UsageMetadata(prompt, generated if generated is not None else text)
+        self.candidates = [types.SimpleNamespace(finish_reason=finish_reason)]
+
+
+def _text_reply(prompt, max_output_tokens=None):
+    """Response text and finish reason, honouring the token cap at roughly four characters per token."""
+
+    text = _response_text(prompt)
+    if max_output_tokens and len(text) > max_output_tokens * 4:
+        return text[:max_output_tokens * 4], "MAX_TOKENS"
+    return text, "STOP"
+
+
+def _text_stream(prompt, text, finish_reason):
+    step = max(1, len(text) // max(1, config.stream_chunks))
+    per_chunk = config.delay(config.text_latency_ms) / max(1, config.stream_chunks)
+    for start in range(0, len(text), step):
+        time.sleep(per_chunk)
+        last = start + step >= len(text)
+        yield _TextResponse(prompt, text[start:start + step], finish_reason if last else None,
+                            generated=text[:start + step])
+
+
+def _build_generativeai(api_core_exceptions):
+    module = types.ModuleType("google.generativeai")
+    text_exceptions = {
+        "rate_limited": api_core_exceptions.ResourceExhausted,
+        "error": api_core_exceptions.InternalServerError,
+    }
+
+    class GenerativeModel:
+        def __init__(self, model_name="gemini-pro", generation_config=None, safety_settings=None, **kwargs):
+            self.model_name = model_name
+            self._generation_config = generation_config or {}
+            self._client = None
+            self._async_client = None
+
+        def _respond(self, prompt):
+            return _text_reply(prompt, self._generation_config.get("max_output_tokens"))
+
+        def generate_content(self, contents, stream=False, **kwargs):
+            config.maybe_fail("text", text_exceptions)
+            text, finish_reason = self._respond(str(contents))
+            if stream:
+                return _text_stream(str(contents), text, finish_reason)
+            time.sleep(config.delay(config.text_latency_ms))
+            return _TextResponse(str(contents), text, finish_reason)
+
+        async def generate_content_async(self, contents, stream=False, **kwargs):
+            config.maybe_fail("text", text_exceptions)
+            text, finish_reason = self._respond(str(contents))
+            await asyncio.sleep(config.delay(config.text_latency_ms))
+            return _TextResponse(str(contents), text, finish_reason)
+
+    module.GenerativeModel = GenerativeModel
+    module.configure = lambda **kwargs: None
+    return module
+
+
+def _build_api_core():
+    package = types.ModuleType("google.api_core")
+    exceptions = types.ModuleType("google.api_core.exceptions")
+
+    class GoogleAPIError(Exception):
+        code = None
+
+    class ResourceExhausted(GoogleAPIError):
+        code = HTTPStatus.TOO_MANY_REQUESTS
+
+    class InternalServerError(GoogleAPIError):
+        code = HTTPStatus.INTERNAL_SERVER_ERROR
+
+    class ServiceUnavailable(GoogleAPIError):
+        code = HTTPStatus.SERVICE_UNAVAILABLE
+
+    for cls in (GoogleAPIError, ResourceExhausted, InternalServerError, ServiceUnavailable):
+        setattr(exceptions, cls.__name__, cls)
+    package.exceptions = exceptions
+    return package, exceptions
+
+
+def _build_generativelanguage():
+    module = types.ModuleType("google.ai.generativelanguage")
+
+    class GenerativeServiceClient:
+        def __init__(self, client_options=None, **kwargs):
+            self.client_options = client_options
+
+    class GenerativeServiceAsyncClient(GenerativeServiceClient):
+        pass
+
+    module.GenerativeServiceClient = GenerativeServiceClient
+    module.GenerativeServiceAsyncClient = GenerativeServiceAsyncClient
+    return module
+
+
+def _build_genai():
+    package = types.ModuleType("google.genai")
+    genai_types = types.ModuleType("google.genai.types")
+    errors = types.ModuleType("google.genai.errors")
+
+    class _Options:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class GenerateContentConfig(_Options):
+        pass
+
+    class HttpOptions(_Options):
+        pass
+
+    class SafetySetting(_Options):
+        pass
+
+    genai_types.GenerateContentConfig = GenerateContentConfig
+    genai_types.HttpOptions = HttpOptions
+    genai_types.SafetySetting = SafetySetting
+
+    class APIError(Exception):
+        def __init__(self, code, message):
+            super().__init__(f"{code} {message}")
+            self.code = code
+
+    class ClientError(APIError):
+        pass
+
+    class ServerError(APIError):
+        pass
+
+    errors.APIError = APIError
+    errors.ClientError = ClientError
+    errors.ServerError = ServerError
+
+    api_exceptions = {
+        "rate_limited": lambda message: ClientError(429, message),
+        "error": lambda message: ServerError(500, message),
+    }
+
+    def _image_response():
+        with config._lock:
+            data = _png(config.image_bytes, config.random)
+        inline = types.SimpleNamespace(data=data, mime_type="image/png")
+        part = types.SimpleNamespace(inline_data=inline, text=None)
+        content = types.SimpleNamespace(parts=[part])
+        return types.SimpleNamespace(candidates=[types.SimpleNamespace(content=content)])
+
+    def _is_image_model(model):
+        return "image" in (model or "")
+
+    def _text_call(contents, config):
+        _fake_config().maybe_fail("text", api_exceptions)
+        return _text_reply(str(contents), getattr(config, "max_output_tokens", None))
+
+    class _Models:
+        def generate_content(self, model=None, contents=None, config=None):
+            if _is_image_model(model):
+                _fake_config().maybe_fail("image", api_exceptions)
+                time.sleep(_fake_config().image_delay())
+                return _image_response()
+            text, finish_reason = _text_call(contents, config)
+            time.sleep(_fake_config().delay(_fake_config().text_latency_ms))
+            return _TextResponse(str(contents), text, finish_reason)
+
+        def generate_content_stream(self, model=None, contents=None, config=None):
+            # Like the SDK, nothing is sent until the first chunk is requested
+            text, finish_reason = _text_call(contents, config)
+            yield from _text_stream(str(contents), text, finish_reason)
+
+    class _AsyncModels:
+        async def generate_content(self, model=None, contents=None, config=None):
+            if _is_image_model(model):
+                _fake_config().maybe_fail("image", api_exceptions)
+                await asyncio.sleep(_fake_config().image_delay())
+                return _image_response()
+            text, finish_reason = _text_call(contents, config)
+            await asyncio.sleep(_fake_config().delay(_fake_config().text_latency_ms))
+            return _TextResponse(str(contents), text, finish_reason)
+
+    class Client:
+        def __init__(self, api_key=None, http_options=None, **kwargs):
+            self.api_key = api_key
+            self.models = _Models()
+            self.aio = types.SimpleNamespace(models=_AsyncModels())
+
+    package.Client = Client
+    package.types = genai_types
+    package.errors = errors
+    return package, genai_types, errors
+
+
+def _fake_config():
+    return config
+
+
+class FakeImageBackend:
+    """
+    Stand-in image provider with the ``utils.image_backends.ImageBackend`` interface.
+
+    Has its own latency, tail and error settings (milliseconds, as in
+    FakeConfig) and counts its calls in ``calls``.
+    """
+
+    def __init__(self, name="standin", latency_ms=2000, jitter_ms=100, tail_rate=0.0, tail_ms=0,
+                 error_rate=0.0, image_bytes=300_000, seed=None):
+        self.name = name
+        self.model = f"fake-{name}"
+        self.config = FakeConfig(image_latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate,
+                                 image_bytes=image_bytes, image_tail_rate=tail_rate, image_tail_ms=tail_ms,
+                                 seed=seed)
+        self.exceptions = {"rate_limited": RuntimeError, "error": RuntimeError}
+
+    @property
+    def calls(self):
+        return self.config.calls
+
+    def _image(self):
+        with self.config._lock:
+            return _png(self.config.image_bytes, self.config.random), "image/png"
+
+    def generate(self, prompt):
+        self.config.maybe_fail("image", self.exceptions)
+        time.sleep(self.config.image_delay())
+        return self._image()
+
+    async def generate_async(self, prompt):
+        self.config.maybe_fail("image", self.exceptions)
+        await asyncio.sleep(self.config.image_delay())
+        return self._image()
+
+    def register(self):
+        """Register with the app's image backends; call after ``install()``."""
+
+        from utils.image_backends import register_backend
+        register_backend(self.name, lambda gemini_key, hf_key, timeout_seconds: self)
+        return self
+
+
+class FakeTTSEngine:
+    """
+    Stand-in speech engine with the ``utils.audio_utils.TTSEngine`` interface.
+
+    Each chunk takes ``latency_ms`` plus ``ms_per_kchar`` per 1000
+    characters. With ``cpu_bound`` that time is spent spinning rather than
+    sleeping, like a local synthesizer, and the engine asks for the process
+    pool. Instances are plain data, so they pickle into worker processes.
+    """
+
+    def __init__(self, name="standin", latency_ms=300, ms_per_kchar=0, cpu_bound=False, kbps=64):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.ms_per_kchar = ms_per_kchar
+        self.use_processes = cpu_bound
+        self.kbps = kbps
+
+    @property
+    def cache_tag(self):
+        return f"{self.name}\x1f"
+
+    def synthesize(self, chunk, lang="en"):
+        seconds = (self.latency_ms + self.ms_per_kchar * len(chunk) / 1000) / 1000.0
+        if self.use_processes:
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                pass
+        else:
+            time.sleep(seconds)
+        # Roughly the size of MP3 speech at ~15 characters per second
+        return b"\xff\xfb" + bytes(int(len(chunk) / 15 * self.kbps * 125))
+
+    def register(self):
+        """Register with the app's TTS engines."""
+
+        from utils.audio_utils import register_engine
+        register_engine(self.name, lambda: self)
+        return self
+
+
+def install(fake_config=None):
+    """
+    Register the fake SDK modules in ``sys.modules``.
+
+    Must run before the app (or any utils module) is imported.
+
+    Args:
+        fake_config: Optional FakeConfig; replaces the module-level config
+
+    Returns:
+        The active FakeConfig
+    """
+
+    global config
+    if fake_config is not None:
+        config = fake_config
+
+    google = sys.modules.get("google") or types.ModuleType("google")
+    google.__path__ = []
+    api_core, api_core_exceptions = _build_api_core()
+    ai = types.ModuleType("google.ai")
+    ai.__path__ = []
+    generativelanguage = _build_generativelanguage()
+    genai, genai_types, genai_errors = _build_genai()
+    generativeai = _build_generativeai(api_core_exceptions)
+
+    google.api_core = api_core
+    google.ai = ai
+    google.genai = genai
+    google.generativeai = generativeai
+    ai.generativelanguage = generativelanguage
+
+    sys.modules.update({
+        "google": google,
+        "google.api_core": api_core,
+        "google.api_core.exceptions": api_core_exceptions,
+        "google.ai": ai,
+        "google.ai.generativelanguage": generativelanguage,
+        "google.genai": genai,
+        "google.genai.types": genai_types,
+        "google.genai.errors": genai_errors,
+        "google.generativeai": generativeai,
+    })
+    return config
@@ -1,15 +1,130 @@
-import google.generativeai as genai
-from google.api_core import exceptions as google_exceptions
-import re
-import time
+import json
 import logging
+import os
+import re
+
+from utils.cache_utils import make_cache_key, response_cache
+from utils.client_pool import get_async_text_model, get_text_model
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimitError, UpstreamUnavailableError, text_scheduler
+from utils.singleflight import text_flight
+from utils.topic_index import TOPIC_SIMILARITY_ENABLED, topic_index
+from utils.upstream_guard import text_guard
 
 logger = logging.getLogger(__name__)
 
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+}
+
+MODEL_NAME = "gemini-2.0-flash-exp"
+
+# Generation settings per (mode, length); "*" matches any mode or length.
+# Decode time grows with output tokens, so shorter explanations get smaller
+# caps. Entries override DEFAULT_PROFILE and can be replaced or extended with
+# GENAI_PROFILES, e.g. '{"Text explanation:Brief": {"model_name": "gemini-2.0-flash-lite"}}'.
+DEFAULT_PROFILE = {
+    "model_name": MODEL_NAME,
+    "max_output_tokens": GENERATION_CONFIG["max_output_tokens"],
+    "temperature": GENERATION_CONFIG["temperature"],
+}
+
+GENERATION_PROFILES = {
+    ("*", "Brief"): {"max_output_tokens": 1024},
+    ("*", "Detailed"): {"max_output_tokens": 2048},
+    ("*", "Comprehensive"): {"max_output_tokens": 2048},
+    # The code block comes on top of the explanation
+    ("Code with explanation", "Brief"): {"max_output_tokens": 1536},
+}
+
+
+def _load_profile_overrides():
+    """Read ``GENAI_PROFILES`` ("mode:length" -> settings JSON) into GENERATION_PROFILES keys."""
+
+    raw = os.getenv('GENAI_PROFILES', '')
+    if not raw:
+        return {}
+
+    try:
+        overrides = {}
+        for name, settings in json.loads(raw).items():
+            mode, _, length = name.partition(":")
+            overrides[(mode or "*", length or "*")] = dict(settings)
+        return overrides
+    except (ValueError, AttributeError, TypeError) as e:
+        logger.error(f"Ignoring invalid GENAI_PROFILES: {e}")
+        return {}
+
+
+GENERATION_PROFILES.update(_load_profile_overrides())
+
+
+def get_generation_profile(mode, length):
+    """
+    Resolve the generation settings for a mode and length.
+
+    More specific entries win: (mode, length), then (mode, "*"), then
+    ("*", length), on top of DEFAULT_PROFILE.
+
+    Args:
+        mode: Output mode
+        length: Length of explanation
+
+    Returns:
+        Tuple of (model_name, generation_config)
+    """
+
+    profile = dict(DEFAULT_PROFILE)
+    for key in (("*", "*"), ("*", length), (mode, "*"), (mode, length)):
+        profile.update(GENERATION_PROFILES.get(key, {}))
+
+    generation_config = dict(GENERATION_CONFIG)
+    generation_config["max_output_tokens"] = int(profile["max_output_tokens"])
+    generation_config["temperature"] = float(profile["temperature"])
+    return profile["model_name"], generation_config
+
+
+def _record_usage(response, model_name, generation_config, mode, length):
+    """Export token usage from a Gemini response so the profile caps can be tuned."""
+
+    try:
+        usage = getattr(response, "usage_metadata", None)
+        labels = {"model": model_name, "mode": mode, "length": length}
+        if usage is not None:
+            metrics.observe("generation_tokens", usage.prompt_token_count or 0, kind="prompt", **labels)
+            metrics.observe("generation_tokens", usage.candidates_token_count or 0, kind="output", **labels)
+            metrics.observe("generation_budget_used",
+                            (usage.candidates_token_count or 0) / generation_config["max_output_tokens"], **labels)
+
+        for candidate in getattr(response, "candidates", None) or []:
+            reason = getattr(candidate.finish_reason, "name", candidate.finish_reason)
+            if reason == "MAX_TOKENS":
+                metrics.inc("generation_truncated_total", **labels)
+                logger.warning(f"Gemini output hit the {generation_config['max_output_tokens']} token cap ({mode}, {length})")
+
+    except Exception as e:
+        logger.error(f"Could not record token usage: {e}")
+
+
 def call_genai(api_key, topic, length, mode, previous_attempts=None):
     """
     Call Google Gemini AI to generate ML learning content
 
+    Responses are served from the shared response cache when the normalized
+    (topic, length, mode) triple, or a near-duplicate topic for the same
+    length and mode, has been generated before. Concurrent identical requests
+    are coalesced into a single Gemini call.
+
     Args:
         api_key: Gemini API key
         topic: ML topic to explain
@@ -21,7 +136,323 @@ def call_genai(api_key, topic, length, mode, previous_attempts=None):
         Tuple of (briefing, code_content, audio_script, image_prompts)
     """
 
-    genai.configure(api_key=api_key)
+    cache_key = make_cache_key(topic, length, mode)
+    cached = _cached_response(topic, length, mode, cache_key)
+    if cached is not None:
+        return cached
+
+    # Identical requests arriving together share one upstream call
+    return text_flight.do(cache_key, _generate_and_cache, api_key, topic, length, mode, cache_key)
+
+
+def _cached_response(topic, length, mode, cache_key):
+    """Return the cached response for this request or a near-duplicate topic, else None."""
+
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Serving '{topic}' ({length}, {mode}) from cache")
+        return cached
+
+    if not TOPIC_SIMILARITY_ENABLED:
+        return None
+
+    match = topic_index.lookup(topic, length, mode)
+    if match is None:
+        return None
+
+    similar_key, similarity = match
+    cached = response_cache.get(similar_key)
+    if cached is None:
+        # The matched response has expired since it was indexed
+        topic_index.discard(similar_key)
+        topic_index.record_stale()
+        return None
+
+    logger.info(f"Serving '{topic}' ({length}, {mode}) from a similar cached topic (similarity {similarity:.2f})")
+    return cached
+
+
+def _store_response(cache_key, result, topic, length, mode):
+    """Cache a generated response and make it findable by similar topics."""
+
+    response_cache.set(cache_key, result, topic=topic, length=length, mode=mode)
+    if TOPIC_SIMILARITY_ENABLED:
+        topic_index.add(topic, length, mode, cache_key)
+
+
+def _stale_response(topic, length, mode, cache_key, reason):
+    """Return an expired cached response for a request Gemini can't serve right now, else None."""
+
+    stale = response_cache.get_stale(cache_key)
+    if stale is not None:
+        logger.warning(f"Serving stale '{topic}' ({length}, {mode}) from cache: {reason}")
+        metrics.inc("stale_responses_total", mode=mode)
+    return stale
+
+
+def _is_empty(result):
+    """True for a failed generation or one without any text, e.g. a response blocked by safety filters."""
+
+    return not result or not any(result)
+
+
+def _generate_and_cache(api_key, topic, length, mode, cache_key):
+    """Call Gemini and store a successful result in the response cache."""
+
+    try:
+        result = _call_genai_uncached(api_key, topic, length, mode)
+    except UpstreamUnavailableError as e:
+        # Shed by the circuit breaker or concurrency limit: an old answer beats none
+        stale = _stale_response(topic, length, mode, cache_key, e)
+        if stale is None:
+            raise
+        return stale
+
+    if not _is_empty(result):
+        _store_response(cache_key, result, topic, length, mode)
+        return result
+    return _stale_response(topic, length, mode, cache_key, "generation failed")
+
+
+async def call_genai_async(api_key, topic, length, mode):
+    """
+    Async variant of ``call_genai`` built on ``generate_content_async``.
+
+    Shares the response cache, coalescing and rate limits with the sync path
+    but never blocks the event loop while waiting on Gemini.
+
+    Args:
+        api_key: Gemini API key
+        topic: ML topic to explain
+        length: Length of explanation (Brief, Detailed, Comprehensive)
+        mode: Output mode (Text explanation, Code with explanation, Audio, Image Explanation)
+
+    Returns:
+        Tuple of (briefing, code_content, audio_script, image_prompts) or None if failed
+    """
+
+    cache_key = make_cache_key(topic, length, mode)
+    cached = _cached_response(topic, length, mode, cache_key)
+    if cached is not None:
+        return cached
+
+    return await text_flight.do_async(cache_key, _generate_and_cache_async, api_key, topic, length, mode, cache_key)
+
+
+async def _generate_and_cache_async(api_key, topic, length, mode, cache_key):
+    """Await Gemini and store a successful result in the response cache."""
+
+    try:
+        result = await _call_genai_uncached_async(api_key, topic, length, mode)
+    except UpstreamUnavailableError as e:
+        stale = _stale_response(topic, length, mode, cache_key, e)
+        if stale is None:
+            raise
+        return stale
+
+    if not _is_empty(result):
+        _store_response(cache_key, result, topic, length, mode)
+        return result
+    return _stale_response(topic, length, mode, cache_key, "generation failed")
+
+
+def call_genai_stream(api_key, topic, length, mode):
+    """
+    Stream Gemini output for a topic as it is generated.
+
+    Yields ``(event, payload)`` pairs: any number of ``("chunk", text)``
+    pieces followed by exactly one ``("result", parsed_tuple)`` or
+    ``("error", message)``. Sections are announced as soon as they are
+    complete, interleaved with the chunks: ``("image_prompt", prompt)`` for
+    each image prompt and ``("code", code)`` once the Python block closes.
+    Cached responses are replayed as a single chunk plus their sections.
+    A RateLimitError raised before the first chunk propagates to the caller.
+
+    Args:
+        api_key: Gemini API key
+        topic: ML topic to explain
+        length: Length of explanation (Brief, Detailed, Comprehensive)
+        mode: Output mode (Text explanation, Code with explanation, Audio, Image Explanation)
+
+    Yields:
+        Tuple of (event name, payload)
+    """
+
+    cache_key = make_cache_key(topic, length, mode)
+    cached = _cached_response(topic, length, mode, cache_key)
+    if cached is not None:
+        yield from _replay(cached)
+        return
+
+    pieces = []
+    parser = StreamingParser(mode)
+    permit = None
+    try:
+        model_name, generation_config = get_generation_profile(mode, length)
+        model = get_text_model(api_key, model_name, generation_config, SAFETY_SETTINGS)
+
+        # One permit covers the whole stream, so a slow or broken stream counts against Gemini
+        permit = text_guard.admit()
+        response = text_scheduler.call(model.generate_content, _build_prompt(topic, length, mode), stream=True)
+        last_chunk = None
+        for chunk in response:
+            last_chunk = chunk
+            # None for chunks without text parts (e.g. a trailing finish reason or a safety block)
+            text = chunk.text
+            if text:
+                pieces.append(text)
+                yield "chunk", text
+                yield from parser.feed(text)
+
+        # Usage totals and the finish reason arrive with the final chunk
+        if last_chunk is not None:
+            _record_usage(last_chunk, model_name, generation_config, mode, length)
+        permit.finish()
+
+    except RateLimitError as e:
+        if permit is not None:
+            permit.finish(e)
+        if pieces:
+            yield "error", "Rate limit exceeded. Please try again shortly."
+            return
+        stale = _stale_response(topic, length, mode, cache_key, e) if isinstance(e, UpstreamUnavailableError) else None
+        if stale is None:
+            raise
+        yield from _replay(stale)
+        return
+
+    except Exception as e:
+        if permit is not None:
+            permit.finish(e)
+        logger.error(f"An unexpected error occurred during the Gemini streaming call: {e}")
+        stale = None if pieces else _stale_response(topic, length, mode, cache_key, e)
+        if stale is None:
+            yield "error", str(e)
+            return
+        yield from _replay(stale)
+        return
+
+    finally:
+        # The client went away mid-stream
+        if permit is not None:
+            permit.abandon()
+
+    if not pieces:
+        # An empty stream, or one where every chunk was blocked; never cache it
+        logger.warning(f"Gemini streamed no text for '{topic}' ({length}, {mode})")
+        stale = _stale_response(topic, length, mode, cache_key, "empty response")
+        if stale is None:
+            yield "error", "Gemini returned an empty response. Please try rephrasing the topic."
+            return
+        yield from _replay(stale)
+        return
+
+    yield from parser.close()
+    result = _parse_response("".join(pieces), mode)
+    _store_response(cache_key, result, topic, length, mode)
+    yield "result", result
+
+
+def _replay(cached):
+    """Yield a cached response as ``call_genai_stream`` events."""
+
+    _, code_content, _, image_prompts = cached
+    yield "chunk", cached[0]
+    if code_content:
+        yield "code", code_content
+    for prompt in image_prompts:
+        yield "image_prompt", prompt
+    yield "result", cached
+
+
+class StreamingParser:
+    """
+    Recognise finished sections of a response while it is still streaming.
+
+    Agrees with ``_parse_response``: an image prompt is the text between one
+    ``IMG-PROMPT:`` marker and the next (or the end of the response), and the
+    code is the first complete ```python block. Sections are returned as
+    ``(event, payload)`` pairs from ``feed`` and ``close``.
+    """
+
+    IMG_MARKER = "IMG-PROMPT:"
+    CODE_PATTERN = re.compile(r"```python\n(.*?)```", re.DOTALL)
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.text = ""
+        self.code_found = False
+        self._marker_end = None
+        self._search_from = 0
+
+    def feed(self, chunk):
+        """
+        Add streamed text and return the sections it completed.
+
+        Args:
+            chunk: Next piece of response text
+
+        Returns:
+            List of ``(event, payload)`` pairs
+        """
+
+        self.text += chunk
+        if self.mode == "Image Explanation":
+            return self._image_prompts()
+        if self.mode == "Code with explanation" and not self.code_found:
+            return self._code()
+        return []
+
+    def close(self):
+        """Return sections that the end of the response completes."""
+
+        if self.mode == "Image Explanation" and self._marker_end is not None:
+            prompt = self.text[self._marker_end:].strip()
+            self._marker_end = None
+            if prompt:
+                return [("image_prompt", prompt)]
+        return []
+
+    def _image_prompts(self):
+        sections = []
+        while True:
+            found = self.text.find(self.IMG_MARKER, self._search_from)
+            if found == -1:
+                # A marker may be split across chunks; rescan the tail next time
+                self._search_from = max(self._search_from, len(self.text) - len(self.IMG_MARKER) + 1)
+                return sections
+
+            if self._marker_end is not None:
+                prompt = self.text[self._marker_end:found].strip()
+                if prompt:
+                    sections.append(("image_prompt", prompt))
+            self._marker_end = self._search_from = found + len(self.IMG_MARKER)
+
+    def _code(self):
+        # Nothing can close the block until a fence arrives
+        if "```" not in self.text[self._search_from:]:
+            self._search_from = max(0, len(self.text) - 2)
+            return []
+
+        match = self.CODE_PATTERN.search(self.text)
+        if not match:
+            return []
+        self.code_found = True
+        return [("code", match.group(1).strip())]
+
+
+def _build_prompt(topic, length, mode):
+    """
+    Build the tutor prompt for a topic.
+
+    Args:
+        topic: ML topic to explain
+        length: Length of explanation
+        mode: Output mode
+
+    Returns:
+        Prompt string sent to Gemini
+    """
 
     # Enhanced prompt construction
     base_prompt = f"""
@@ -94,71 +525,121 @@ Teaching Guidelines:
 #     except Exception as e:
 #         logger.error(f"Unexpected error: {e}")
 #         return None, None, None, None
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    ]
-
-    max_retries = 3
-    attempt = 0
-    generation_config = {
-    "temperature": 0.7,
-    "top_p": 0.95,
-    "top_k": 40,
-    "max_output_tokens": 2048,
-    }
-    final_prompt = base_prompt + code_instruction + audio_instruction + image_instruction
-
-
-    while attempt < max_retries:
-        try:
-            model = genai.GenerativeModel(
-                model_name="gemini-2.0-flash-exp",
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
-
-            response = model.generate_content(final_prompt)
-            full_response_text = response.text
-
-            # Initialize return values
-            briefing, code_content, audio_script, image_prompts = full_response_text, "", "", []
-
-            # Parse different modes
-            if mode == "Code with explanation":
-                code_match = re.search(r"```python\n(.*?)```", briefing, re.DOTALL)
-                if code_match:
-                    code_content = code_match.group(1).strip()
-                    # Remove code block from briefing
-                    briefing = briefing.replace(code_match.group(0), "").strip()
-
-            elif mode == "Audio":
-                if "Audio Script:" in briefing:
-                    parts = briefing.split("Audio Script:", 1)
-                    briefing, audio_script = parts[0].strip(), parts[1].strip()
-
-            elif mode == "Image Explanation":
-                marker = "IMG-PROMPT:"
-                if marker in briefing:
-                    first_marker_pos = briefing.find(marker)
-                    briefing_text = briefing[:first_marker_pos].strip()
-                    prompts_text = briefing[first_marker_pos:]
-                    image_prompts = [p.strip() for p in prompts_text.split(marker) if p.strip()]
-                    briefing = briefing_text
-
-            return briefing, code_content, audio_script, image_prompts
-
-        except google_exceptions.ResourceExhausted as e:
-            logger.warning(f"Rate limit hit. Waiting 60 seconds before retrying... ({attempt + 1}/{max_retries})")
-            time.sleep(60)
-            attempt += 1
-            continue
-
-        except Exception as e:
-            logger.error(f"An unexpected error occurred during the Gemini API call: {e}")
-            return None
-
-    logger.error("API call failed after multiple retries due to rate limiting.")
-    return None
\ No newline at end of file
+
+    return base_prompt + code_instruction + audio_instruction + image_instruction
+
+
+def _parse_response(full_response_text, mode):
+    """
+    Split a raw Gemini response into its mode-specific parts.
+
+    Args:
+        full_response_text: Complete response text
+        mode: Output mode the prompt was built for
+
+    Returns:
+        Tuple of (briefing, code_content, audio_script, image_prompts)
+    """
+
+    # Initialize return values
+    briefing, code_content, audio_script, image_prompts = full_response_text, "", "", []
+
+    # Parse different modes
+    if mode == "Code with explanation":
+        code_match = re.search(r"```python\n(.*?)```", briefing, re.DOTALL)
+        if code_match:
+            code_content = code_match.group(1).strip()
+            # Remove code block from briefing
+            briefing = briefing.replace(code_match.group(0), "").strip()
+
+    elif mode == "Audio":
+        if "Audio Script:" in briefing:
+            parts = briefing.split("Audio Script:", 1)
+            briefing, audio_script = parts[0].strip(), parts[1].strip()
+
+    elif mode == "Image Explanation":
+        marker = "IMG-PROMPT:"
+        if marker in briefing:
+            first_marker_pos = briefing.find(marker)
+            briefing_text = briefing[:first_marker_pos].strip()
+            prompts_text = briefing[first_marker_pos:]
+            image_prompts = [p.strip() for p in prompts_text.split(marker) if p.strip()]
+            briefing = briefing_text
+
+    return briefing, code_content, audio_script, image_prompts
+
+
+def _call_genai_uncached(api_key, topic, length, mode):
+    """
+    Call Gemini for a topic without consulting the response cache.
+
+    Args:
+        api_key: Gemini API key
+        topic: ML topic to explain
+        length: Length of explanation
+        mode: Output mode
+
+    Returns:
+        Tuple of (briefing, code_content, audio_script, image_prompts) or None if failed
+
+    Raises:
+        RateLimitError: If Gemini stays rate limited beyond the retry budget
+    """
+
+    with metrics.timer("stage_seconds", stage="prompt"):
+        final_prompt = _build_prompt(topic, length, mode)
+
+    try:
+        model_name, generation_config = get_generation_profile(mode, length)
+        model = get_text_model(api_key, model_name, generation_config, SAFETY_SETTINGS)
+
+        with metrics.timer("stage_seconds", stage="gemini_text"):
+            response = text_scheduler.call(text_guard.call, model.generate_content, final_prompt)
+        _record_usage(response, model_name, generation_config, mode, length)
+        with metrics.timer("stage_seconds", stage="parse"):
+            return _parse_response(response.text or "", mode)
+
+    except RateLimitError:
+        raise
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during the Gemini API call: {e}")
+        return None
+
+
+async def _call_genai_uncached_async(api_key, topic, length, mode):
+    """
+    Await Gemini for a topic without consulting the response cache.
+
+    Args:
+        api_key: Gemini API key
+        topic: ML topic to explain
+        length: Length of explanation
+        mode: Output mode
+
+    Returns:
+        Tuple of (briefing, code_content, audio_script, image_prompts) or None if failed
+
+    Raises:
+        RateLimitError: If Gemini stays rate limited beyond the retry budget
+    """
+
+    with metrics.timer("stage_seconds", stage="prompt"):
+        final_prompt = _build_prompt(topic, length, mode)
+
+    try:
+        model_name, generation_config = get_generation_profile(mode, length)
+        model = get_async_text_model(api_key, model_name, generation_config, SAFETY_SETTINGS)
+
+        with metrics.timer("stage_seconds", stage="gemini_text"):
+            response = await text_scheduler.call_async(text_guard.call_async, model.generate_content_async, final_prompt)
+        _record_usage(response, model_name, generation_config, mode, length)
+        with metrics.timer("stage_seconds", stage="parse"):
+            return _parse_response(response.text or "", mode)
+
+    except RateLimitError:
+        raise
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during the Gemini API call: {e}")
+        return None
@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from utils.cache_utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB_PATH = os.getenv('HISTORY_DB_PATH', 'generated_history/history.db')
+HISTORY_ENABLED = os.getenv('HISTORY_ENABLED', '1') != '0'
+# Oldest entries beyond this many per session are pruned on write (0 keeps everything)
+HISTORY_MAX_PER_SESSION = int(os.getenv('HISTORY_MAX_PER_SESSION', '500'))
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    topic_key TEXT NOT NULL,
+    length TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    briefing TEXT,
+    code_file TEXT,
+    audio_file TEXT,
+    images TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_session ON generations (session_id, id);
+CREATE INDEX IF NOT EXISTS generations_session_topic ON generations (session_id, topic_key, mode, length, id);
+"""
+
+# Listing leaves out the briefing so pages stay small
+SUMMARY_COLUMNS = "id, topic, length, mode, code_file, audio_file, images, created_at"
+DETAIL_COLUMNS = f"{SUMMARY_COLUMNS}, briefing"
+
+
+class HistoryStore:
+    """
+    Per-session record of generated content, kept in SQLite.
+
+    The database runs in WAL mode so readers never wait for the writer, and
+    each thread keeps its own connection. Entries hold the briefing and
+    references to the stored code, audio and images rather than the files
+    themselves. Pages are keyset-paginated on the entry id, newest first.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH, max_per_session=HISTORY_MAX_PER_SESSION):
+        self.path = path
+        self.max_per_session = max_per_session
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"writes": 0, "reads": 0, "pruned": 0, "errors": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    @staticmethod
+    def _to_dict(row):
+        entry = dict(row)
+        entry["images"] = json.loads(entry["images"]) if entry["images"] else []
+        return entry
+
+    def record(self, session_id, topic, length, mode, briefing=None, code_file=None, audio_file=None, images=None):
+        """
+        Add a generation to a session's history.
+
+        Args:
+            session_id: Session the generation belongs to
+            topic: Topic as requested
+            length: Length of explanation
+            mode: Output mode
+            briefing: Generated explanation text
+            code_file: Saved code filename
+            audio_file: Saved audio filename
+            images: List of image URLs
+
+        Returns:
+            Id of the new entry
+        """
+
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO generations (session_id, topic, topic_key, length, mode, briefing, code_file,"
+                " audio_file, images, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, topic, normalize_text(topic), length, mode, briefing, code_file, audio_file,
+                 json.dumps(images) if images else None, time.time())
+            )
+            entry_id = cursor.lastrowid
+
+            pruned = 0
+            if self.max_per_session > 0:
+                pruned = conn.execute(
+                    "DELETE FROM generations WHERE session_id = ? AND id <= ("
+                    " SELECT id FROM generations WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (session_id, session_id, self.max_per_session)
+                ).rowcount
+
+        self._count("writes")
+        if pruned > 0:
+            self._count("pruned", pruned)
+        return entry_id
+
+    def list(self, session_id, limit=HISTORY_PAGE_SIZE, before=None, topic=None, mode=None):
+        """
+        Return one page of a session's history, newest first.
+
+        Args:
+            session_id: Session to list
+            limit: Page size, capped at HISTORY_MAX_PAGE_SIZE
+            before: Only entries older than this id (the previous page's ``next_cursor``)
+            topic: Only entries for this topic (case and whitespace insensitive)
+            mode: Only entries for this output mode
+
+        Returns:
+            Dictionary with ``items`` (entries without the briefing) and ``next_cursor``
+        """
+
+        limit = max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+        query = f"SELECT {SUMMARY_COLUMNS} FROM generations WHERE session_id = ?"
+        params = [session_id]
+        if topic:
+            query += " AND topic_key = ?"
+            params.append(normalize_text(topic))
+        if mode:
+            query += " AND mode = ?"
+            params.append(mode)
+        if before is not None:
+            query += " AND id < ?"
+            params.append(int(before))
+        query += " ORDER BY id DESC LIMIT ?"
+        # One extra row tells us whether another page exists
+        params.append(limit + 1)
+
+        rows = self._connect().execute(query, params).fetchall()
+        self._count("reads")
+
+        items = [self._to_dict(row) for row in rows[:limit]]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def get(self, session_id, entry_id):
+        """
+        Return one entry of a session's history.
+
+        Args:
+            session_id: Session the entry must belong to
+            entry_id: Entry id
+
+        Returns:
+            Entry dictionary including the briefing, or None if not found
+        """
+
+        row = self._connect().execute(
+            f"SELECT {DETAIL_COLUMNS} FROM generations WHERE session_id = ? AND id = ?",
+            (session_id, int(entry_id))
+        ).fetchone()
+        self._count("reads")
+        return self._to_dict(row) if row else None
+
+    def latest(self, session_id, topic, length, mode):
+        """
+        Return the session's most recent entry for a topic, length and mode.
+
+        Args:
+            session_id: Session to search
+            topic: Topic (case and whitespace insensitive)
+            length: Length of explanation
+            mode: Output mode
+
+        Returns:
+            Entry dictionary including the briefing, or None if not found
+        """
+
+        row = self._connect().execute(
+            f"SELECT {DETAIL_COLUMNS} FROM generations WHERE session_id = ? AND topic_key = ? AND mode = ?"
+            " AND length = ? ORDER BY id DESC LIMIT 1",
+            (session_id, normalize_text(topic), mode, length)
+        ).fetchone()
+        self._count("reads")
+        return self._to_dict(row) if row else None
+
+    def delete(self, session_id, entry_id=None):
+        """
+        Delete one entry, or the whole history of a session.
+
+        Args:
+            session_id: Session to delete from
+            entry_id: Entry id, or None for every entry of the session
+
+        Returns:
+            Number of deleted entries
+        """
+
+        conn = self._connect()
+        with conn:
+            if entry_id is None:
+                cursor = conn.execute("DELETE FROM generations WHERE session_id = ?", (session_id,))
+            else:
+                cursor = conn.execute("DELETE FROM generations WHERE session_id = ? AND id = ?",
+                                      (session_id, int(entry_id)))
+        return cursor.rowcount
+
+    def stats(self):
+        """
+        Return history store counters.
+
+        Returns:
+            Dictionary with writes, reads, pruned and errors
+        """
+
+        with self._lock:
+            return dict(self._stats)
+
+
+history_store = HistoryStore() if HISTORY_ENABLED else None
+
+
+def record_generation(session_id, topic, length, mode, **fields):
+    """
+    Add a generation to a session's history, logging instead of raising on failure.
+
+    Args:
+        session_id: Session the generation belongs to
+        topic: Topic as requested
+        length: Length of explanation
+        mode: Output mode
+        **fields: briefing, code_file, audio_file and images, as for ``HistoryStore.record``
+
+    Returns:
+        Id of the new entry, or None if history is disabled or the write failed
+    """
+
+    if history_store is None or not session_id:
+        return None
+    try:
+        return history_store.record(session_id, topic, length, mode, **fields)
+    except Exception as e:
+        history_store._count("errors")
+        logger.error(f"Error recording history for '{topic}': {e}")
+        return None
+
+
+def get_history_stats():
+    """
+    Return counters for the generation history store.
+
+    Returns:
+        Dictionary with history store statistics
+    """
+
+    return history_store.stats() if history_store is not None else {"enabled": 0}
@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this aren't worth the CPU or the extra header bytes
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL_GZIP = int(os.getenv('COMPRESS_LEVEL_GZIP', '6'))
+COMPRESS_LEVEL_BROTLI = int(os.getenv('COMPRESS_LEVEL_BROTLI', '5'))
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'application/javascript',
+    'text/javascript',
+}
+
+_fingerprints = {}
+_fingerprint_lock = threading.Lock()
+
+
+def _accepted_encodings(accept_encoding):
+    """Parse an Accept-Encoding header into {coding: q}"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding):
+    """
+    Pick the content coding to use for a client.
+
+    Args:
+        accept_encoding: Value of the request's Accept-Encoding header
+
+    Returns:
+        "br", "gzip" or None
+    """
+
+    accepted = _accepted_encodings(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def compress_body(data, accept_encoding):
+    """
+    Compress a response body with the best coding the client accepts.
+
+    Args:
+        data: Body bytes
+        accept_encoding: Value of the request's Accept-Encoding header
+
+    Returns:
+        Tuple of (body, coding); coding is None when the body is left as is
+    """
+
+    if len(data) < COMPRESS_MIN_BYTES:
+        return data, None
+
+    encoding = choose_encoding(accept_encoding)
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_LEVEL_BROTLI), encoding
+    if encoding == 'gzip':
+        # mtime=0 keeps the output, and so any ETag over it, stable
+        return gzip.compress(data, compresslevel=COMPRESS_LEVEL_GZIP, mtime=0), encoding
+    return data, None
+
+
+def compress_response(response, accept_encoding):
+    """
+    Compress a buffered Flask response in place when the client allows it.
+
+    Streamed, file-backed, partial and already-encoded responses are left
+    alone, as are bodies below COMPRESS_MIN_BYTES.
+
+    Args:
+        response: Flask response
+        accept_encoding: Value of the request's Accept-Encoding header
+
+    Returns:
+        The same response
+    """
+
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    if (response.direct_passthrough or response.is_streamed or response.status_code not in (200, 201, 202)
+            or 'Content-Encoding' in response.headers or 'Content-Range' in response.headers):
+        return response
+
+    data, encoding = compress_body(response.get_data(), accept_encoding)
+    if encoding:
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def asset_fingerprint(static_folder, filename):
+    """
+    Short content hash of a static asset, for cache-busting URLs.
+
+    Hashes are cached per file and recomputed when its mtime changes.
+
+    Args:
+        static_folder: App static folder
+        filename: Asset path relative to the static folder
+
+    Returns:
+        12-character hex digest, or None if the file doesn't exist
+    """
+
+    path = os.path.join(static_folder or '', filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _fingerprint_lock:
+        cached = _fingerprints.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(block)
+    fingerprint = digest.hexdigest()[:12]
+
+    with _fingerprint_lock:
+        _fingerprints[path] = (mtime, fingerprint)
+    return fingerprint
@@ -0,0 +1,426 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from google.genai import types
+
+from utils.client_pool import get_image_client
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimitError, hf_image_scheduler, image_scheduler
+from utils.upstream_guard import hf_image_guard, image_guard
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MODEL = "gemini-2.0-flash-preview-image-generation"
+HF_IMAGE_MODEL = os.getenv('HF_IMAGE_MODEL', 'stabilityai/stable-diffusion-xl-base-1.0')
+HF_API_URL = os.getenv('HF_API_URL', 'https://api-inference.huggingface.co/models/')
+
+# Backends tried after the requested one, in this order
+IMAGE_BACKEND_ORDER = [name.strip() for name in os.getenv('IMAGE_BACKEND_ORDER', 'gemini,huggingface').split(',') if name.strip()]
+# Hedging: when the current backend is slower than its recent latency
+# percentile, start the next backend too and keep whichever answers first
+IMAGE_HEDGE = os.getenv('IMAGE_HEDGE', '0') != '0'
+IMAGE_HEDGE_PERCENTILE = float(os.getenv('IMAGE_HEDGE_PERCENTILE', '0.95'))
+IMAGE_HEDGE_MIN_SECONDS = float(os.getenv('IMAGE_HEDGE_MIN_SECONDS', '1.0'))
+# Used until a backend has IMAGE_HEDGE_MIN_SAMPLES successful calls
+IMAGE_HEDGE_DEFAULT_SECONDS = float(os.getenv('IMAGE_HEDGE_DEFAULT_SECONDS', '15'))
+IMAGE_HEDGE_MIN_SAMPLES = int(os.getenv('IMAGE_HEDGE_MIN_SAMPLES', '20'))
+IMAGE_HEDGE_WINDOW = 200
+IMAGE_HEDGE_WORKERS = int(os.getenv('IMAGE_HEDGE_WORKERS', '8'))
+
+# Display names used by the settings page and the API's "backend" field
+BACKEND_ALIASES = {
+    "Google Gemini (Fast & Free)": "gemini",
+    "Hugging Face": "huggingface",
+}
+
+_hedge_executor = ThreadPoolExecutor(max_workers=IMAGE_HEDGE_WORKERS, thread_name_prefix="image-hedge")
+_hf_session = requests.Session()
+
+
+class ImageBackend(ABC):
+    """
+    One image generation provider.
+
+    ``generate`` returns ``(data, mime_type)`` for a prompt, or None when the
+    provider answered without an image. Upstream errors are raised; a
+    RateLimitError means the provider's rate limit was exhausted.
+    """
+
+    name = "base"
+    model = None
+
+    @abstractmethod
+    def generate(self, prompt):
+        """Return ``(data, mime_type)`` for ``prompt``, or None without an image."""
+
+    async def generate_async(self, prompt):
+        """Async counterpart of ``generate``; runs it on a worker thread unless overridden."""
+        return await asyncio.to_thread(self.generate, prompt)
+
+
+class GeminiImageBackend(ImageBackend):
+    """Gemini 2.0 Flash image generation through the pooled google.genai client."""
+
+    name = "gemini"
+    model = IMAGE_MODEL
+
+    def __init__(self, api_key, timeout_seconds):
+        self.client = get_image_client(api_key, timeout_seconds)
+
+    @staticmethod
+    def _extract(response):
+        for part in response.candidates[0].content.parts:
+            if part.inline_data:
+                return part.inline_data.data, part.inline_data.mime_type or "image/png"
+        return None
+
+    def generate(self, prompt):
+        response = image_scheduler.call(
+            image_guard.call,
+            self.client.models.generate_content,
+            model=self.model,
+            contents=f"Generate an image: {prompt}",
+            config=types.GenerateContentConfig(response_modalities=["TEXT", "IMAGE"])
+        )
+        return self._extract(response)
+
+    async def generate_async(self, prompt):
+        response = await image_scheduler.call_async(
+            image_guard.call_async,
+            self.client.aio.models.generate_content,
+            model=self.model,
+            contents=f"Generate an image: {prompt}",
+            config=types.GenerateContentConfig(response_modalities=["TEXT", "IMAGE"])
+        )
+        return self._extract(response)
+
+
+class HuggingFaceError(Exception):
+    """Non-200 answer from the Hugging Face Inference API."""
+
+    def __init__(self, code, message, response=None):
+        super().__init__(f"{code} {message}")
+        # ``code`` and ``response`` let the rate limiter spot 429s and Retry-After
+        self.code = code
+        self.response = response
+
+
+class HuggingFaceImageBackend(ImageBackend):
+    """Text-to-image through the Hugging Face Inference API."""
+
+    name = "huggingface"
+    model = HF_IMAGE_MODEL
+
+    def __init__(self, api_key, timeout_seconds):
+        self.api_key = api_key
+        self.timeout_seconds = timeout_seconds
+
+    def _post(self, prompt):
+        response = _hf_session.post(
+            HF_API_URL + self.model,
+            headers={"Authorization": f"Bearer {self.api_key}", "Accept": "image/png"},
+            json={"inputs": prompt},
+            timeout=self.timeout_seconds
+        )
+        if response.status_code != 200:
+            raise HuggingFaceError(response.status_code, response.text[:200], response)
+
+        mime_type = response.headers.get("Content-Type", "image/png").split(";")[0].strip()
+        if not mime_type.startswith("image/"):
+            raise HuggingFaceError(response.status_code, f"unexpected {mime_type} response", response)
+        return response.content, mime_type
+
+    def generate(self, prompt):
+        return hf_image_scheduler.call(hf_image_guard.call, self._post, prompt)
+
+
+def _gemini_factory(gemini_key, hf_key, timeout_seconds):
+    return GeminiImageBackend(gemini_key, timeout_seconds) if gemini_key else None
+
+
+def _huggingface_factory(gemini_key, hf_key, timeout_seconds):
+    return HuggingFaceImageBackend(hf_key, timeout_seconds) if hf_key else None
+
+
+_factories = {
+    "gemini": _gemini_factory,
+    "huggingface": _huggingface_factory,
+}
+
+
+def register_backend(name, factory):
+    """
+    Make an image backend available by name.
+
+    Args:
+        name: Backend name, as used in IMAGE_BACKEND_ORDER and the "backend" request field
+        factory: ``factory(gemini_key, hf_key, timeout_seconds)`` returning an
+            ImageBackend, or None when it can't be used (e.g. a missing key)
+    """
+
+    _factories[name] = factory
+
+
+def resolve_backends(backend, gemini_key=None, hf_key=None, timeout_seconds=60):
+    """
+    Build the backends to try for a request, requested backend first.
+
+    Args:
+        backend: Requested backend name or display name
+        gemini_key: Google Gemini API key
+        hf_key: Hugging Face API key
+        timeout_seconds: Per-call timeout for the backends' HTTP clients
+
+    Returns:
+        List of ImageBackend; backends without credentials are left out
+    """
+
+    requested = BACKEND_ALIASES.get(backend, backend)
+    names = [requested] + [name for name in IMAGE_BACKEND_ORDER if name != requested]
+
+    backends = []
+    for name in names:
+        factory = _factories.get(name)
+        if factory is None:
+            logger.warning(f"Unknown image backend '{name}'")
+            continue
+        try:
+            instance = factory(gemini_key, hf_key, timeout_seconds)
+        except Exception as e:
+            logger.error(f"Could not set up image backend '{name}': {e}")
+            continue
+        if instance is not None:
+            backends.append(instance)
+    return backends
+
+
+class LatencyTracker:
+    """Recent successful call latencies per backend, for hedge delays."""
+
+    def __init__(self, window=IMAGE_HEDGE_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, name, q):
+        """Return the ``q`` latency percentile, or None with fewer than IMAGE_HEDGE_MIN_SAMPLES samples."""
+        with self._lock:
+            ordered = sorted(self._samples.get(name, ()))
+        if len(ordered) < IMAGE_HEDGE_MIN_SAMPLES:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self):
+        with self._lock:
+            names = list(self._samples)
+        return {
+            name: {
+                "p50": self.percentile(name, 0.5),
+                "hedge_after": hedge_delay(name),
+            }
+            for name in names
+        }
+
+
+latency_tracker = LatencyTracker()
+
+
+def hedge_delay(name):
+    """Seconds to give backend ``name`` before hedging with the next one."""
+
+    observed = latency_tracker.percentile(name, IMAGE_HEDGE_PERCENTILE)
+    if observed is None:
+        return IMAGE_HEDGE_DEFAULT_SECONDS
+    return max(IMAGE_HEDGE_MIN_SECONDS, observed)
+
+
+def _timed(backend, prompt):
+    started = time.perf_counter()
+    with metrics.timer("stage_seconds", stage=f"{backend.name}_image"):
+        result = backend.generate(prompt)
+    if result:
+        latency_tracker.observe(backend.name, time.perf_counter() - started)
+    return result
+
+
+async def _timed_async(backend, prompt):
+    started = time.perf_counter()
+    with metrics.timer("stage_seconds", stage=f"{backend.name}_image"):
+        result = await backend.generate_async(prompt)
+    if result:
+        latency_tracker.observe(backend.name, time.perf_counter() - started)
+    return result
+
+
+def _failed(backend, label, error):
+    kind = "rate_limited" if isinstance(error, RateLimitError) else "error"
+    metrics.inc("image_backend_failures_total", backend=backend.name, kind=kind)
+    if error is None:
+        logger.warning(f"Image {label}: {backend.name} returned no image data.")
+    else:
+        logger.error(f"Image {label}: {backend.name} failed: {error}")
+
+
+def _won(backend, primary):
+    metrics.inc("image_backend_wins_total", backend=backend.name, primary=str(primary).lower())
+
+
+def generate_image(backends, prompt, label=""):
+    """
+    Generate one image, falling back through ``backends`` and optionally hedging.
+
+    Without hedging the backends are tried one after another until one
+    returns an image. With IMAGE_HEDGE on, the next backend is also started
+    once the running one exceeds its hedge delay, and the first image wins.
+    Calls that lose a hedge finish in the background and are discarded.
+
+    Args:
+        backends: ImageBackend list from ``resolve_backends``
+        prompt: Image prompt
+        label: Image position, for log messages
+
+    Returns:
+        Tuple of (data, mime_type, backend_name), or None if every backend failed
+
+    Raises:
+        RateLimitError: If every backend failed and at least one was rate limited
+    """
+
+    remaining = list(backends)
+    rate_limit_error = None
+
+    if not IMAGE_HEDGE or len(remaining) < 2:
+        for backend in remaining:
+            try:
+                result = _timed(backend, prompt)
+            except Exception as e:
+                rate_limit_error = e if isinstance(e, RateLimitError) else rate_limit_error
+                _failed(backend, label, e)
+                continue
+            if result:
+                _won(backend, backend is backends[0])
+                return result + (backend.name,)
+            _failed(backend, label, None)
+
+    else:
+        running = {}
+        last = None
+
+        def launch():
+            nonlocal last
+            last = remaining.pop(0)
+            running[_hedge_executor.submit(_timed, last, prompt)] = last
+
+        launch()
+        while running:
+            timeout = hedge_delay(last.name) if remaining else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info(f"Image {label}: {last.name} slower than {timeout:.1f}s, hedging with {remaining[0].name}")
+                metrics.inc("image_hedges_total", backend=remaining[0].name)
+                launch()
+                continue
+
+            for future in done:
+                backend = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    rate_limit_error = e if isinstance(e, RateLimitError) else rate_limit_error
+                    _failed(backend, label, e)
+                    continue
+                if result:
+                    _won(backend, backend is backends[0])
+                    return result + (backend.name,)
+                _failed(backend, label, None)
+
+            # Nothing left in flight: fall back straight away
+            if not running and remaining:
+                launch()
+
+    if rate_limit_error is not None:
+        raise rate_limit_error
+    return None
+
+
+async def generate_image_async(backends, prompt, label=""):
+    """
+    Async counterpart of ``generate_image``; hedge losers are cancelled.
+    """
+
+    remaining = list(backends)
+    rate_limit_error = None
+    hedge = IMAGE_HEDGE and len(remaining) > 1
+    running = {}
+    last = None
+
+    def launch():
+        nonlocal last
+        last = remaining.pop(0)
+        running[asyncio.ensure_future(_timed_async(last, prompt))] = last
+
+    launch()
+    try:
+        while running:
+            timeout = hedge_delay(last.name) if hedge and remaining else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.info(f"Image {label}: {last.name} slower than {timeout:.1f}s, hedging with {remaining[0].name}")
+                metrics.inc("image_hedges_total", backend=remaining[0].name)
+                launch()
+                continue
+
+            for task in done:
+                backend = running.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    rate_limit_error = e if isinstance(e, RateLimitError) else rate_limit_error
+                    _failed(backend, label, e)
+                    continue
+                if result:
+                    _won(backend, backend is backends[0])
+                    return result + (backend.name,)
+                _failed(backend, label, None)
+
+            if not running and remaining:
+                launch()
+    finally:
+        for task in running:
+            task.cancel()
+
+    if rate_limit_error is not None:
+        raise rate_limit_error
+    return None
+
+
+def get_backend_info():
+    """
+    Describe the configured image backends and hedging policy.
+
+    Returns:
+        Dictionary with the fallback order, hedging settings and observed latencies
+    """
+
+    return {
+        "order": IMAGE_BACKEND_ORDER,
+        "available": sorted(_factories),
+        "hedging": {
+            "enabled": IMAGE_HEDGE,
+            "percentile": IMAGE_HEDGE_PERCENTILE,
+            "min_seconds": IMAGE_HEDGE_MIN_SECONDS,
+            "default_seconds": IMAGE_HEDGE_DEFAULT_SECONDS,
+        },
+        "latency": latency_tracker.stats(),
+    }
@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from io import BytesIO
+
+from PIL import Image, features
+
+from utils.image_store import find_original, image_path, image_url, parse_filename, save_variant
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGE_POSTPROCESS = os.getenv('IMAGE_POSTPROCESS', '1') != '0'
+# webp, avif or png; avif falls back to webp when Pillow lacks the codec
+IMAGE_OUTPUT_FORMAT = os.getenv('IMAGE_OUTPUT_FORMAT', 'webp').lower()
+IMAGE_OUTPUT_QUALITY = int(os.getenv('IMAGE_OUTPUT_QUALITY', '80'))
+IMAGE_DISPLAY_MAX_PX = int(os.getenv('IMAGE_DISPLAY_MAX_PX', '1024'))
+IMAGE_THUMB_MAX_PX = int(os.getenv('IMAGE_THUMB_MAX_PX', '256'))
+IMAGE_POSTPROCESS_WORKERS = int(os.getenv('IMAGE_POSTPROCESS_WORKERS', '2'))
+# How long a request for a variant still being produced may wait for it
+IMAGE_POSTPROCESS_WAIT_SECONDS = float(os.getenv('IMAGE_POSTPROCESS_WAIT_SECONDS', '10'))
+
+VARIANT_SIZES = {
+    "display": IMAGE_DISPLAY_MAX_PX,
+    "thumb": IMAGE_THUMB_MAX_PX,
+}
+
+_postprocess_executor = ThreadPoolExecutor(max_workers=IMAGE_POSTPROCESS_WORKERS, thread_name_prefix="image-post")
+_in_flight = {}
+_lock = threading.Lock()
+
+
+def _resolve_format(requested):
+    if requested == "avif" and not features.check("avif"):
+        logger.warning("Pillow was built without AVIF support; writing WebP instead.")
+        return "webp"
+    if requested not in ("webp", "avif", "png"):
+        logger.warning(f"Unknown IMAGE_OUTPUT_FORMAT '{requested}'; writing WebP instead.")
+        return "webp"
+    return requested
+
+
+OUTPUT_FORMAT = _resolve_format(IMAGE_OUTPUT_FORMAT)
+
+
+def variant_filename(filename, variant):
+    """
+    Name of a resized copy of a stored image.
+
+    Args:
+        filename: Stored image filename (original or any variant)
+        variant: "display" or "thumb"
+
+    Returns:
+        Variant filename, e.g. ``<sha256>-thumb.webp``
+    """
+
+    digest, _, _ = parse_filename(filename)
+    return f"{digest}-{variant}.{OUTPUT_FORMAT}"
+
+
+def _encode(image, max_px):
+    image = image.copy()
+    image.thumbnail((max_px, max_px), Image.LANCZOS)
+
+    if OUTPUT_FORMAT == "png":
+        options = {"optimize": True}
+    elif OUTPUT_FORMAT == "webp":
+        options = {"quality": IMAGE_OUTPUT_QUALITY, "method": 4}
+    else:
+        options = {"quality": IMAGE_OUTPUT_QUALITY}
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+    buffer = BytesIO()
+    image.save(buffer, format=OUTPUT_FORMAT.upper(), **options)
+    return buffer.getvalue()
+
+
+def process_image(filename):
+    """
+    Write the display-size and thumbnail copies of a stored original.
+
+    Args:
+        filename: Original image filename from ``save_image``
+
+    Returns:
+        Dictionary of variant name to filename for the copies that exist
+    """
+
+    source_path = image_path(filename)
+    if not source_path:
+        logger.error(f"Cannot post-process missing image {filename}")
+        return {}
+
+    variants = {}
+    try:
+        with metrics.timer("stage_seconds", stage="image_postprocess"):
+            with Image.open(source_path) as image:
+                image.load()
+                for variant, max_px in VARIANT_SIZES.items():
+                    target = variant_filename(filename, variant)
+                    if not image_path(target):
+                        data = _encode(image, max_px)
+                        save_variant(target, data)
+                        logger.info(f"Stored {variant} copy {target} ({len(data)} bytes, from {os.path.getsize(source_path)})")
+                    variants[variant] = target
+
+    except Exception as e:
+        logger.error(f"Error post-processing image {filename}: {e}")
+
+    return variants
+
+
+def schedule_variants(filename):
+    """
+    Produce an image's variants in the background unless they already exist.
+
+    Concurrent calls for the same image share one job.
+
+    Args:
+        filename: Original image filename
+
+    Returns:
+        Future resolving to ``process_image``'s result, or None if nothing is needed
+    """
+
+    if not IMAGE_POSTPROCESS:
+        return None
+    if all(image_path(variant_filename(filename, variant)) for variant in VARIANT_SIZES):
+        return None
+
+    digest, _, _ = parse_filename(filename)
+    with _lock:
+        future = _in_flight.get(digest)
+        if future is None:
+            future = _postprocess_executor.submit(process_image, filename)
+            _in_flight[digest] = future
+            future.add_done_callback(lambda _: _forget(digest))
+    return future
+
+
+def _forget(digest):
+    with _lock:
+        _in_flight.pop(digest, None)
+
+
+def ensure_variant(filename, timeout=IMAGE_POSTPROCESS_WAIT_SECONDS):
+    """
+    Resolve a variant filename to its path, producing it if it is still missing.
+
+    The work runs on the post-processing pool; the caller only waits for it.
+
+    Args:
+        filename: Variant filename
+        timeout: Seconds to wait for a pending variant
+
+    Returns:
+        Filesystem path or None if the variant can't be produced in time
+    """
+
+    path = image_path(filename)
+    if path or not IMAGE_POSTPROCESS:
+        return path
+
+    parts = parse_filename(filename)
+    if not parts or not parts[1]:
+        return None
+
+    original = find_original(parts[0])
+    if not original:
+        return None
+
+    future = schedule_variants(original)
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.warning(f"Timed out waiting for {filename}")
+            return None
+    return image_path(filename)
+
+
+def display_url(filename):
+    """
+    URL to show for a stored image, queueing its variants if needed.
+
+    Args:
+        filename: Original image filename
+
+    Returns:
+        URL of the display-size copy, or of the original when post-processing is off
+    """
+
+    if not IMAGE_POSTPROCESS:
+        return image_url(filename)
+    schedule_variants(filename)
+    return image_url(variant_filename(filename, "display"))
+
+
+def thumbnail_url(url):
+    """
+    Thumbnail URL for an image URL returned by ``display_url``.
+
+    Args:
+        url: Image URL
+
+    Returns:
+        URL of the thumbnail copy, or ``url`` itself when post-processing is off
+    """
+
+    filename = url.rsplit('/', 1)[-1]
+    if not IMAGE_POSTPROCESS or not parse_filename(filename):
+        return url
+    return image_url(variant_filename(filename, "thumb"))
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+IMAGE_STORE_DIR = os.getenv('IMAGE_STORE_DIR', 'generated_images')
+IMAGE_URL_PREFIX = '/api/images/'
+
+_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+    'image/avif': 'avif',
+}
+_MIME_TYPES = {ext: mime for mime, ext in _EXTENSIONS.items()}
+# Originals are "<sha256>.<ext>"; resized copies add a "-<variant>" suffix
+_FILENAME_RE = re.compile(r'^([0-9a-f]{64})(?:-(display|thumb))?\.(png|jpg|webp|avif)$')
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _prompt_index_path(prompt_key):
+    return os.path.join(IMAGE_STORE_DIR, 'prompts', f"{prompt_key}.txt")
+
+
+def make_prompt_key(model, prompt):
+    """
+    Build the dedupe key for an image prompt.
+
+    Args:
+        model: Image model name
+        prompt: Prompt sent to the model
+
+    Returns:
+        Hex digest of the model name and whitespace-normalized prompt
+    """
+
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(f"{model}\x1f{normalized}".encode('utf-8')).hexdigest()
+
+
+def save_image(data, mime_type='image/png'):
+    """
+    Store image bytes under their content hash.
+
+    Args:
+        data: Raw image bytes
+        mime_type: MIME type reported by the generator
+
+    Returns:
+        Stored filename (``<sha256>.<ext>``); identical bytes map to one file
+    """
+
+    extension = _EXTENSIONS.get(mime_type, 'png')
+    filename = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+    path = os.path.join(IMAGE_STORE_DIR, filename)
+
+    if not os.path.exists(path):
+        os.makedirs(IMAGE_STORE_DIR, exist_ok=True)
+        _write_atomic(path, data)
+        logger.info(f"Stored image {filename} ({len(data)} bytes)")
+
+    return filename
+
+
+def remember_prompt(prompt_key, filename):
+    """Record which stored image a prompt produced."""
+
+    try:
+        os.makedirs(os.path.dirname(_prompt_index_path(prompt_key)), exist_ok=True)
+        _write_atomic(_prompt_index_path(prompt_key), filename.encode('utf-8'))
+    except Exception as e:
+        logger.error(f"Error indexing image prompt: {e}")
+
+
+def lookup_prompt(prompt_key):
+    """
+    Find the stored image previously generated for a prompt.
+
+    Args:
+        prompt_key: Key from ``make_prompt_key``
+
+    Returns:
+        Stored filename or None if the prompt is unknown or its file is gone
+    """
+
+    try:
+        with open(_prompt_index_path(prompt_key), 'r', encoding='utf-8') as f:
+            filename = f.read().strip()
+    except OSError:
+        return None
+
+    return filename if image_path(filename) else None
+
+
+def image_path(filename):
+    """
+    Resolve a stored image filename to its path.
+
+    Args:
+        filename: Filename as returned by ``save_image``
+
+    Returns:
+        Filesystem path, or None if the name is invalid or the file is missing
+    """
+
+    if not _FILENAME_RE.match(filename or ''):
+        return None
+    path = os.path.abspath(os.path.join(IMAGE_STORE_DIR, filename))
+    return path if os.path.isfile(path) else None
+
+
+def parse_filename(filename):
+    """
+    Split a stored image filename into its parts.
+
+    Args:
+        filename: Stored image filename
+
+    Returns:
+        Tuple of (digest, variant or None, extension), or None if the name is invalid
+    """
+
+    match = _FILENAME_RE.match(filename or '')
+    return match.groups() if match else None
+
+
+def find_original(digest):
+    """Return the filename of the original image with this digest, or None."""
+
+    for extension in set(_EXTENSIONS.values()):
+        filename = f"{digest}.{extension}"
+        if image_path(filename):
+            return filename
+    return None
+
+
+def save_variant(filename, data):
+    """
+    Store a derived image (resized or re-encoded copy) under ``filename``.
+
+    Args:
+        filename: Variant filename, e.g. ``<sha256>-thumb.webp``
+        data: Encoded image bytes
+    """
+
+    if not parse_filename(filename):
+        raise ValueError(f"Invalid image filename: {filename}")
+    os.makedirs(IMAGE_STORE_DIR, exist_ok=True)
+    _write_atomic(os.path.join(IMAGE_STORE_DIR, filename), data)
+
+
+def image_mime_type(filename):
+    """Return the MIME type for a stored image filename."""
+
+    return _MIME_TYPES.get(filename.rsplit('.', 1)[-1], 'application/octet-stream')
+
+
+def image_url(filename):
+    """Return the public URL for a stored image filename."""
+
+    return f"{IMAGE_URL_PREFIX}{filename}"
@@ -131,75 +131,409 @@
 
 
 # utils/image_utils.py
-import base64
+import asyncio
 import logging
-from google.genai import Client, types
-from PIL import Image
-from io import BytesIO
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from utils.image_backends import HF_IMAGE_MODEL, IMAGE_MODEL, generate_image, generate_image_async, get_backend_info, resolve_backends
+from utils.image_processing import display_url
+from utils.image_store import lookup_prompt, make_prompt_key, remember_prompt, save_image
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimitError, UpstreamUnavailableError
+from utils.singleflight import image_flight
 
 logger = logging.getLogger(__name__)
 
-def generate_images(prompts, gemini_key=None, hf_key=None, backend="Google Gemini (Fast & Free)"):
+# Upper bound on concurrent image calls across all requests in this process
+IMAGE_MAX_IN_FLIGHT = int(os.getenv('IMAGE_MAX_IN_FLIGHT', '4'))
+IMAGE_TIMEOUT_SECONDS = float(os.getenv('IMAGE_TIMEOUT_SECONDS', '60'))
+# Images waiting for a worker across all requests; further submissions are shed
+IMAGE_MAX_QUEUED = int(os.getenv('IMAGE_MAX_QUEUED', str(IMAGE_MAX_IN_FLIGHT * 4)))
+# How long a queued image may wait for a worker before it is shed
+IMAGE_QUEUE_TIMEOUT_SECONDS = float(os.getenv('IMAGE_QUEUE_TIMEOUT_SECONDS', '30'))
+
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_MAX_IN_FLIGHT, thread_name_prefix="image-gen")
+_queued = 0
+_queue_lock = threading.Lock()
+# Same bound for the async path, one semaphore per event loop (a semaphore binds to the loop it is used on)
+_async_image_slots = weakref.WeakKeyDictionary()
+_async_slots_lock = threading.Lock()
+
+def generate_images(prompts, gemini_key=None, hf_key=None, backend="Google Gemini (Fast & Free)", on_progress=None):
     """
-    Generate images using either Google Gemini or Hugging Face backend.
+    Generate images with the requested backend, falling back to the others in IMAGE_BACKEND_ORDER.
 
     Args:
         prompts (list of str): List of image prompts.
         gemini_key (str): Google Gemini API key.
-        hf_key (str): Hugging Face API key (currently not implemented).
-        backend (str): Backend to use for generation ("Google Gemini (Fast & Free)" or "Hugging Face").
+        hf_key (str): Hugging Face API key.
+        backend (str): Preferred backend ("Google Gemini (Fast & Free)", "Hugging Face" or a backend name).
+        on_progress (callable): Optional ``on_progress(done, total)`` called as each image finishes.
 
     Returns:
-        list of str: Base64-encoded image URLs.
+        list of str: URLs of the display-size images, served by /api/images/<filename>.
+
+    Raises:
+        RateLimitError: If rate limiting prevented every image.
     """
-    if backend == "Google Gemini (Fast & Free)":
-        return _gen_with_gemini(prompts, gemini_key)
-    else:
-        logger.warning("Hugging Face backend not implemented yet.")
-        return []
+    batch = start_images(gemini_key, hf_key, backend, on_progress=on_progress)
+    for prompt in prompts:
+        batch.submit(prompt)
+    return batch.collect()
+
+def start_images(gemini_key=None, hf_key=None, backend="Google Gemini (Fast & Free)", on_progress=None):
+    """
+    Open an image batch that accepts prompts one at a time.
+
+    Use this when prompts become known incrementally (e.g. while the text
+    response is still streaming): each ``submit`` starts generating at once
+    and ``collect`` gathers the URLs in submission order.
+
+    Args:
+        gemini_key (str): Google Gemini API key.
+        hf_key (str): Hugging Face API key.
+        backend (str): Preferred backend.
+        on_progress (callable): Optional ``on_progress(done, submitted)`` called as each image finishes.
 
-def _gen_with_gemini(prompts, api_key):
+    Returns:
+        ImageBatch
     """
-    Generate images using Gemini 2.0 Flash Preview Image Generation model.
+    return ImageBatch(gemini_key, backend, on_progress=on_progress, hf_key=hf_key)
+
+def _enqueue():
+    """Count one more image waiting for a worker; False if the queue is full."""
+    global _queued
+    with _queue_lock:
+        if _queued >= IMAGE_MAX_QUEUED:
+            return False
+        _queued += 1
+        return True
+
+def _dequeued():
+    global _queued
+    with _queue_lock:
+        _queued -= 1
+
+def get_image_queue_stats():
     """
-    if not api_key:
-        logger.error("Google Gemini API key is missing.")
-        return []
+    Return the shared image queue depth.
 
-    try:
-        client = Client(api_key=api_key)
-        image_urls = []
+    Returns:
+        Dictionary with queued images and the queue bound
+    """
+    with _queue_lock:
+        return {"queued": _queued, "max_queued": IMAGE_MAX_QUEUED}
 
-        for i, prompt in enumerate(prompts):
-            enhanced_prompt = _enhance_educational_prompt(prompt)
-            logger.info(f"Generating image {i+1}/{len(prompts)} with Gemini...")
+class _ImageJob:
+    """One submitted prompt; ``started_at`` is set when a worker picks it up."""
 
-            try:
-                response = client.models.generate_content(
-                    model="gemini-2.0-flash-preview-image-generation",
-                    contents=f"Generate an image: {enhanced_prompt}",
-                    config=types.GenerateContentConfig(response_modalities=["TEXT", "IMAGE"])
-                )
-
-                # Extract the first image from the response
-                for part in response.candidates[0].content.parts:
-                    if part.inline_data:
-                        img_bytes = part.inline_data.data
-                        b64 = base64.b64encode(img_bytes).decode()
-                        image_urls.append(f"data:image/png;base64,{b64}")
-                        logger.info(f"Image {i+1} generated successfully.")
-                        break
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.started = threading.Event()
+        self.future = None
+
+class ImageBatch:
+    """
+    Image generations dispatched as their prompts arrive.
+
+    Prompts run concurrently on the shared executor bounded by
+    IMAGE_MAX_IN_FLIGHT; each one goes through the resolved backends with
+    fallback and optional hedging. Results keep submission order; images
+    that fail or do not finish within ``timeout`` seconds of a worker
+    starting them are skipped. Time spent queued behind other requests'
+    images does not count against that deadline; instead the queue is
+    bounded by IMAGE_MAX_QUEUED and IMAGE_QUEUE_TIMEOUT_SECONDS, and images
+    beyond either bound are shed. A RateLimitError is raised only if rate
+    limiting or shedding prevented every image. ``on_progress`` is called
+    in completion order, from the worker that finished the image.
+    """
 
+    def __init__(self, api_key, backend="Google Gemini (Fast & Free)", timeout=IMAGE_TIMEOUT_SECONDS, on_progress=None,
+                 hf_key=None):
+        self.timeout = timeout
+        self.on_progress = on_progress
+        self.backends = resolve_backends(backend, api_key, hf_key, timeout)
+        self._pending = []
+        self._done = 0
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+        if not self.backends:
+            logger.error("No image backend is available; check the API keys.")
+
+    def submit(self, prompt):
+        """Start generating an image for ``prompt``, or shed it if the shared queue is full."""
+        if not self.backends:
+            return
+
+        job = _ImageJob(prompt)
+        with self._lock:
+            if self._cancelled:
+                return
+            index = len(self._pending)
+            if _enqueue():
+                job.future = _image_executor.submit(self._run, job, index)
+            else:
+                logger.warning(f"Image {index+1} shed: {IMAGE_MAX_QUEUED} images already queued.")
+                metrics.inc("image_shed_total", reason="queue_full")
+                job.future = Future()
+                job.future.set_exception(UpstreamUnavailableError("Image queue is full", IMAGE_QUEUE_TIMEOUT_SECONDS))
+            self._pending.append(job)
+        if self.on_progress is not None:
+            job.future.add_done_callback(self._finished)
+
+    def _run(self, job, index):
+        job.started_at = time.monotonic()
+        job.started.set()
+        _dequeued()
+        if self._cancelled:
+            return None
+        waited = job.started_at - job.queued_at
+        if waited > IMAGE_QUEUE_TIMEOUT_SECONDS:
+            # collect() gives up on images queued this long; don't spend a worker
+            logger.warning(f"Image {index+1} shed after waiting {waited:.0f}s for a worker.")
+            metrics.inc("image_shed_total", reason="queue_timeout")
+            raise UpstreamUnavailableError("Image queue wait exceeded", IMAGE_QUEUE_TIMEOUT_SECONDS)
+        return _gen_one(self.backends, job.prompt, index, None)
+
+    def cancel(self):
+        """
+        Give up on the batch, e.g. when the text it belongs to failed.
+
+        Images that haven't started are dropped and later submissions are
+        ignored; images already running can't be interrupted and are stored
+        for reuse, but nothing collects them.
+        """
+        with self._lock:
+            self._cancelled = True
+            pending = list(self._pending)
+        # cancel() is also True for a future cancelled earlier, which was already dequeued
+        dropped = sum(1 for job in pending if not job.future.done() and job.future.cancel())
+        for _ in range(dropped):
+            _dequeued()
+        if dropped:
+            logger.info(f"Cancelled {dropped} queued image(s).")
+
+    def _finished(self, _future):
+        with self._lock:
+            self._done += 1
+            done, submitted = self._done, len(self._pending)
+        try:
+            self.on_progress(done, submitted)
+        except Exception as e:
+            logger.error(f"Image progress callback failed: {e}")
+
+    def collect(self):
+        """
+        Wait for every submitted image.
+
+        Returns:
+            list of str: URLs of the stored images, in submission order.
+
+        Raises:
+            RateLimitError: If rate limiting prevented every image.
+        """
+        with self._lock:
+            pending = list(self._pending)
+
+        image_urls = []
+        rate_limit_error = None
+        for i, job in enumerate(pending):
+            try:
+                url = self._result(job)
+            except FutureTimeoutError:
+                if job.future.cancel():
+                    _dequeued()
+                    logger.error(f"Image {i+1} shed after waiting {IMAGE_QUEUE_TIMEOUT_SECONDS:.0f}s for a worker.")
+                    metrics.inc("image_shed_total", reason="queue_timeout")
+                else:
+                    logger.error(f"Image {i+1} timed out after {self.timeout:.0f}s.")
+                continue
+            except RateLimitError as e:
+                logger.error(f"Image {i+1} skipped: {e}")
+                rate_limit_error = e
+                continue
             except Exception as e:
-                logger.error(f"Error generating image {i+1}: {str(e)}")
+                logger.error(f"Image generation failed: {str(e)}")
                 continue
+            if url:
+                image_urls.append(url)
+
+        # Only surface the rate limit when it cost us every image
+        if rate_limit_error is not None and not image_urls:
+            raise rate_limit_error
 
         return image_urls
 
+    def _result(self, job):
+        # The deadline starts when a worker picks the image up, not at submit()
+        if not job.future.done():
+            queue_left = job.queued_at + IMAGE_QUEUE_TIMEOUT_SECONDS - time.monotonic()
+            if not job.started.wait(max(0.0, queue_left)):
+                raise FutureTimeoutError()
+            return job.future.result(timeout=max(0.0, job.started_at + self.timeout - time.monotonic()))
+        return job.future.result()
+
+def _position(index, total):
+    # Streamed batches don't know their size up front
+    return f"{index+1}/{total}" if total else f"{index+1}"
+
+def _gen_one(backends, prompt, index, total):
+    """
+    Generate a single image and return its stored URL, or None if failed.
+
+    Prompts that were generated before are served from the image store, and
+    concurrent requests for the same prompt are coalesced. Both are keyed on
+    the preferred backend's model.
+    """
+    enhanced_prompt = _enhance_educational_prompt(prompt)
+    prompt_key = make_prompt_key(backends[0].model, enhanced_prompt)
+
+    stored = lookup_prompt(prompt_key)
+    if stored:
+        logger.info(f"Image {_position(index, total)} served from image store.")
+        return display_url(stored)
+
+    # Identical prompts in flight at the same time share one upstream call
+    filename = image_flight.do(prompt_key, _generate_and_store, backends, enhanced_prompt, prompt_key, index, total)
+    return display_url(filename) if filename else None
+
+def _generate_and_store(backends, enhanced_prompt, prompt_key, index, total):
+    """
+    Generate one image and store it; returns the stored filename or None.
+    """
+    logger.info(f"Generating image {_position(index, total)} with {backends[0].name}...")
+
+    try:
+        result = generate_image(backends, enhanced_prompt, _position(index, total))
+        if result:
+            data, mime_type, backend_name = result
+            filename = save_image(data, mime_type)
+            remember_prompt(prompt_key, filename)
+            logger.info(f"Image {index+1} generated successfully with {backend_name}.")
+            return filename
+
+        logger.warning(f"Image {index+1}: no backend returned image data.")
+
+    except RateLimitError:
+        raise
+
     except Exception as e:
-        logger.error(f"Gemini image generation failed: {str(e)}")
+        logger.error(f"Error generating image {index+1}: {str(e)}")
+
+    return None
+
+async def generate_images_async(prompts, gemini_key=None, hf_key=None, backend="Google Gemini (Fast & Free)"):
+    """
+    Async variant of ``generate_images``; Gemini calls use the google.genai aio client.
+
+    Args:
+        prompts (list of str): List of image prompts.
+        gemini_key (str): Google Gemini API key.
+        hf_key (str): Hugging Face API key.
+        backend (str): Preferred backend.
+
+    Returns:
+        list of str: URLs of the stored images, served by /api/images/<filename>.
+
+    Raises:
+        RateLimitError: If rate limiting prevented every image.
+    """
+    backends = resolve_backends(backend, gemini_key, hf_key, IMAGE_TIMEOUT_SECONDS)
+    if not backends:
+        logger.error("No image backend is available; check the API keys.")
         return []
 
+    return await _gen_all_async(backends, prompts)
+
+async def _gen_all_async(backends, prompts, timeout=IMAGE_TIMEOUT_SECONDS):
+    """
+    Generate images concurrently on the event loop, keeping prompt order.
+    """
+    total = len(prompts)
+    results = await asyncio.gather(
+        *(asyncio.wait_for(_gen_one_async(backends, prompt, i, total), timeout)
+          for i, prompt in enumerate(prompts)),
+        return_exceptions=True
+    )
+
+    image_urls = []
+    rate_limit_error = None
+    for i, result in enumerate(results):
+        if isinstance(result, asyncio.TimeoutError):
+            logger.error(f"Image {i+1} timed out after {timeout:.0f}s.")
+        elif isinstance(result, RateLimitError):
+            logger.error(f"Image {i+1} skipped: {result}")
+            rate_limit_error = result
+        elif isinstance(result, BaseException):
+            logger.error(f"Error generating image {i+1}: {str(result)}")
+        elif result:
+            image_urls.append(result)
+
+    # Only surface the rate limit when it cost us every image
+    if rate_limit_error is not None and not image_urls:
+        raise rate_limit_error
+
+    return image_urls
+
+async def _gen_one_async(backends, prompt, index, total):
+    """
+    Async counterpart of ``_gen_one``.
+    """
+    enhanced_prompt = _enhance_educational_prompt(prompt)
+    prompt_key = make_prompt_key(backends[0].model, enhanced_prompt)
+
+    stored = lookup_prompt(prompt_key)
+    if stored:
+        logger.info(f"Image {_position(index, total)} served from image store.")
+        return display_url(stored)
+
+    filename = await image_flight.do_async(
+        prompt_key, _generate_and_store_async, backends, enhanced_prompt, prompt_key, index, total
+    )
+    return display_url(filename) if filename else None
+
+def _async_slots():
+    loop = asyncio.get_running_loop()
+    with _async_slots_lock:
+        slots = _async_image_slots.get(loop)
+        if slots is None:
+            slots = _async_image_slots[loop] = asyncio.Semaphore(IMAGE_MAX_IN_FLIGHT)
+        return slots
+
+async def _generate_and_store_async(backends, enhanced_prompt, prompt_key, index, total):
+    """
+    Async counterpart of ``_generate_and_store``.
+    """
+    async with _async_slots():
+        logger.info(f"Generating image {_position(index, total)} with {backends[0].name}...")
+
+        try:
+            result = await generate_image_async(backends, enhanced_prompt, _position(index, total))
+            if result:
+                data, mime_type, backend_name = result
+                filename = await asyncio.to_thread(save_image, data, mime_type)
+                remember_prompt(prompt_key, filename)
+                logger.info(f"Image {index+1} generated successfully with {backend_name}.")
+                return filename
+
+            logger.warning(f"Image {index+1}: no backend returned image data.")
+
+        except RateLimitError:
+            raise
+
+        except Exception as e:
+            logger.error(f"Error generating image {index+1}: {str(e)}")
+
+    return None
+
 def _enhance_educational_prompt(prompt):
     """
     Enhance prompts for better educational visual content.
@@ -222,9 +556,9 @@ def get_model_info():
     Return information about the current models.
     """
     return {
-        "gemini_model": "gemini-2.0-flash-preview-image-generation",
-        "gemini_fallback": "imagen-3.0-generate-002",
-        "hf_model": "stabilityai/stable-diffusion-xl-base-1.0",
+        "gemini_model": IMAGE_MODEL,
+        "hf_model": HF_IMAGE_MODEL,
+        "backends": get_backend_info(),
         "hf_info": {
             "parameters": "3.5B",
             "architecture": "Latent Diffusion Model",
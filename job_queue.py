@@ -0,0 +1,227 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.rate_limiter import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_RESULT_TTL_SECONDS = int(os.getenv('JOB_RESULT_TTL_SECONDS', '3600'))
+JOB_MAX_RETAINED = int(os.getenv('JOB_MAX_RETAINED', '1000'))
+# Jobs waiting for a worker; further submissions are refused with a 503
+JOB_MAX_QUEUED = int(os.getenv('JOB_MAX_QUEUED', '64'))
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class JobQueueFullError(RateLimitError):
+    """Raised when too many jobs are already waiting for a worker."""
+
+    status_code = 503
+    user_message = "Too many background jobs are queued. Please try again shortly."
+
+
+class Job:
+    """
+    One background generation and its progress log.
+
+    Progress events are appended in order and numbered from 1, so clients can
+    poll or resume an event stream from the last sequence number they saw.
+    """
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.retry_after = None
+        self.events = []
+        self._changed = threading.Condition()
+
+    def progress(self, stage, message, **data):
+        """
+        Record a progress event.
+
+        Args:
+            stage: Short machine-readable stage name (e.g. "text", "image")
+            message: Human-readable description
+            **data: Extra JSON-serializable fields
+        """
+
+        with self._changed:
+            self.events.append(dict(data, seq=len(self.events) + 1, stage=stage, message=message, time=time.time()))
+            self._changed.notify_all()
+
+    def _start(self):
+        with self._changed:
+            self.status = "running"
+            self.started = time.time()
+            self._changed.notify_all()
+
+    def _finish(self, status, result=None, error=None, retry_after=None):
+        with self._changed:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.retry_after = retry_after
+            self.finished = time.time()
+            self.events.append({
+                "seq": len(self.events) + 1,
+                "stage": status,
+                "message": error or "Job finished",
+                "time": self.finished,
+            })
+            self._changed.notify_all()
+
+    def events_after(self, seq, timeout=None):
+        """
+        Return events newer than ``seq``, waiting up to ``timeout`` for one.
+
+        Args:
+            seq: Last sequence number the caller has seen
+            timeout: Seconds to wait if nothing is new (None returns immediately)
+
+        Returns:
+            List of event dictionaries
+        """
+
+        with self._changed:
+            if timeout and len(self.events) <= seq and self.status not in TERMINAL_STATUSES:
+                self._changed.wait(timeout)
+            return list(self.events[seq:])
+
+    def to_dict(self, include_events=True):
+        """Return a JSON-friendly view of the job."""
+
+        with self._changed:
+            info = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+            }
+            if include_events:
+                info["events"] = list(self.events)
+            if self.status == "done":
+                info["result"] = self.result
+            elif self.status == "failed":
+                info["error"] = self.error
+                if self.retry_after:
+                    info["retry_after"] = self.retry_after
+        return info
+
+
+class JobManager:
+    """
+    Runs pipelines on a bounded worker pool and keeps their results for a while.
+
+    A pipeline is called as ``fn(*args, progress=job.progress)`` and returns a
+    ``(payload, status_code)`` pair, the same shape the API routes build.
+    Finished jobs are dropped after ``ttl_seconds`` or once more than
+    ``max_retained`` jobs are held. At most ``max_queued`` jobs wait for a
+    worker; ``submit`` refuses the rest.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, ttl_seconds=JOB_RESULT_TTL_SECONDS, max_retained=JOB_MAX_RETAINED,
+                 max_queued=JOB_MAX_QUEUED):
+        self.workers = workers
+        self.ttl_seconds = ttl_seconds
+        self.max_retained = max_retained
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._queued = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args):
+        """
+        Queue a pipeline run.
+
+        Args:
+            kind: Job type label (e.g. "images")
+            fn: Pipeline function
+            *args: Positional arguments for ``fn``
+
+        Returns:
+            The queued Job
+
+        Raises:
+            JobQueueFullError: If ``max_queued`` jobs are already waiting
+        """
+
+        job = Job(kind)
+        with self._lock:
+            if self._queued >= self.max_queued:
+                self._rejected += 1
+                logger.warning(f"Refusing {kind} job: {self._queued} jobs already queued")
+                # Roughly the time for the workers to take on a full queue's worth of jobs
+                raise JobQueueFullError("Job queue is full", max(1, self.max_queued // max(1, self.workers)))
+            self._queued += 1
+            self._purge()
+            self._jobs[job.id] = job
+        job.progress("queued", "Job queued")
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        with self._lock:
+            self._queued -= 1
+        job._start()
+        job.progress("running", "Job started")
+        try:
+            payload, status = fn(*args, progress=job.progress)
+            if status >= 400:
+                job._finish("failed", error=payload.get('error', 'Generation failed'))
+            else:
+                job._finish("done", result=payload)
+        except RateLimitError as e:
+            job._finish("failed", error=e.user_message, retry_after=e.retry_after)
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            job._finish("failed", error=str(e))
+
+    def get(self, job_id):
+        """Return the job with ``job_id`` or None if unknown or expired."""
+
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def _purge(self):
+        # Caller must hold the lock
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished > self.ttl_seconds:
+                del self._jobs[job_id]
+
+        if len(self._jobs) > self.max_retained:
+            for job_id, job in list(self._jobs.items()):
+                if len(self._jobs) <= self.max_retained:
+                    break
+                if job.status in TERMINAL_STATUSES:
+                    del self._jobs[job_id]
+
+    def stats(self):
+        """Return job counts by status."""
+
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            counts["rejected"] = self._rejected
+        return counts
+
+
+job_manager = JobManager()
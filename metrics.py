@@ -0,0 +1,196 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = "learnsphere"
+# Quantiles are computed over the most recent samples of each series
+METRICS_SAMPLE_SIZE = int(os.getenv('METRICS_SAMPLE_SIZE', '1024'))
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Summary:
+    def __init__(self, sample_size):
+        self.samples = deque(maxlen=sample_size)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics registry with Prometheus text output.
+
+    Summaries keep a bounded window of recent samples for p50/p95/p99 plus
+    lifetime sum and count; counters are plain totals. Recording is a dict
+    lookup and an append under a lock, cheap enough to leave on.
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX, sample_size=METRICS_SAMPLE_SIZE):
+        self.prefix = prefix
+        self.sample_size = sample_size
+        self._summaries = {}
+        self._counters = {}
+        self._help = {}
+        self._gauge_sources = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        """Attach a HELP string to a metric name."""
+
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        """Record one sample of a summary metric."""
+
+        key = _label_key(labels)
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            summary = series.get(key)
+            if summary is None:
+                summary = series[key] = _Summary(self.sample_size)
+            summary.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        """Increment a counter metric."""
+
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Context manager that observes the elapsed wall time in seconds."""
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def register_gauges(self, name, source):
+        """
+        Export the numeric values of ``source()`` as gauges.
+
+        Args:
+            name: Metric name prefix
+            source: Callable returning a (possibly nested) dict of numbers
+        """
+
+        self._gauge_sources[name] = source
+
+    def snapshot(self):
+        """
+        Return a JSON-friendly view of every summary and counter.
+
+        Returns:
+            Dictionary keyed by metric name
+        """
+
+        with self._lock:
+            summaries = {
+                name: [
+                    dict(labels=dict(key), count=s.count, sum=round(s.total, 6),
+                         **{f"p{int(q * 100)}": round(v, 6) for q, v in s.quantiles().items()})
+                    for key, s in series.items()
+                ]
+                for name, series in self._summaries.items()
+            }
+            counters = {
+                name: [dict(labels=dict(key), value=value) for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+        return {"summaries": summaries, "counters": counters}
+
+    def _gauge_lines(self, name, value, path=()):
+        if isinstance(value, dict):
+            lines = []
+            for key, item in value.items():
+                lines.extend(self._gauge_lines(name, item, path + (str(key),)))
+            return lines
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return []
+        # Keys such as upstream names may contain characters Prometheus doesn't allow
+        metric = re.sub(r"[^a-zA-Z0-9_]", "_", "_".join((self.prefix, name) + path))
+        return [f"# TYPE {metric} gauge", f"{metric} {value}"]
+
+    def render_prometheus(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            Exposition text
+        """
+
+        lines = []
+        with self._lock:
+            for name in sorted(self._summaries):
+                metric = f"{self.prefix}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {metric} {self._help[name]}")
+                lines.append(f"# TYPE {metric} summary")
+                for key, summary in sorted(self._summaries[name].items()):
+                    for q, value in summary.quantiles().items():
+                        lines.append(f"{metric}{_format_labels(key, [('quantile', str(q))])} {value:.6f}")
+                    lines.append(f"{metric}_sum{_format_labels(key)} {summary.total:.6f}")
+                    lines.append(f"{metric}_count{_format_labels(key)} {summary.count}")
+
+            for name in sorted(self._counters):
+                metric = f"{self.prefix}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {metric} {self._help[name]}")
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{metric}{_format_labels(key)} {value}")
+
+            gauge_sources = list(self._gauge_sources.items())
+
+        for name, source in gauge_sources:
+            try:
+                lines.extend(self._gauge_lines(name, source()))
+            except Exception as e:
+                logger.error(f"Error collecting gauges for {name}: {e}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("stage_seconds", "Time spent in each processing stage")
+metrics.describe("http_request_seconds", "Time to produce a response, per route")
+metrics.describe("http_requests_total", "Responses served, per route and status")
+metrics.describe("upstream_errors_total", "Failed upstream calls, per upstream and kind")
+metrics.describe("upstream_retries_total", "Upstream calls retried after rate limiting")
+metrics.describe("generation_tokens", "Gemini tokens per call, per model, mode, length and kind")
+metrics.describe("generation_budget_used", "Fraction of the max_output_tokens cap used per call")
+metrics.describe("generation_truncated_total", "Gemini calls stopped by the max_output_tokens cap")
@@ -0,0 +1,256 @@
+"""
+Warm the serving caches for a list of topics ahead of time.
+
+Reads topics from a CSV (with a ``topic`` column, optional ``length`` and
+``mode`` columns) or a JSONL file (objects with the same keys) and runs
+``call_genai`` for every requested mode and length:
+
+    python pregenerate.py syllabus.csv --modes text code images --lengths Brief Detailed
+    python pregenerate.py syllabus.jsonl --concurrency 4 --checkpoint warm.jsonl
+
+Results land where the app looks for them: the response cache, generated
+code files, the image store and the audio directory. Completed items are
+appended to the checkpoint file, so an interrupted run picks up where it
+stopped. Rate-limited items wait for the upstream's retry hint and are
+tried again.
+"""
+
+import argparse
+import csv
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# The modules import each other as ``utils.<module>``; without an installed
+# ``utils`` package, map it onto this directory as tests/conftest.py does
+if "utils" not in sys.modules and importlib.util.find_spec("utils") is None:
+    package = types.ModuleType("utils")
+    package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules["utils"] = package
+
+from utils.audio_utils import text_to_audio  # noqa: E402
+from utils.cache_utils import make_cache_key  # noqa: E402
+from utils.code_executor import save_code_to_file  # noqa: E402
+from utils.genai_utils import call_genai  # noqa: E402
+from utils.image_utils import generate_images  # noqa: E402
+from utils.rate_limiter import RateLimitError  # noqa: E402
+
+logger = logging.getLogger("pregenerate")
+
+MODES = {
+    "text": "Text explanation",
+    "code": "Code with explanation",
+    "audio": "Audio",
+    "images": "Image Explanation",
+}
+LENGTHS = ["Brief", "Detailed", "Comprehensive"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate LearnSphere content for a list of topics")
+    parser.add_argument("topics", help="CSV or JSONL file of topics")
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["text", "code", "images"],
+                        help="Modes to generate when a row doesn't name one")
+    parser.add_argument("--lengths", nargs="+", choices=LENGTHS, default=["Brief"],
+                        help="Lengths to generate when a row doesn't name one")
+    parser.add_argument("--concurrency", type=int, default=4, help="Items generated at the same time")
+    parser.add_argument("--checkpoint", help="Progress file (default: <topics>.checkpoint.jsonl)")
+    parser.add_argument("--max-attempts", type=int, default=5, help="Attempts per item when rate limited")
+    parser.add_argument("--no-media", action="store_true", help="Skip image generation and audio synthesis")
+    parser.add_argument("--api-key", default=os.getenv("GEMINI_API_KEY", ""), help="Gemini API key")
+    parser.add_argument("--hf-key", default=os.getenv("HF_API_KEY", ""), help="Hugging Face API key")
+    parser.add_argument("--backend", default="Google Gemini (Fast & Free)", help="Image backend")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show app logging")
+    return parser.parse_args(argv)
+
+
+def read_topics(path):
+    """
+    Read topic rows from a CSV or JSONL file.
+
+    Args:
+        path: File path; ``.jsonl``/``.ndjson`` files are read as JSON lines
+
+    Returns:
+        List of dictionaries with at least a ``topic`` key
+    """
+
+    rows = []
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError as e:
+                    logger.error(f"Skipping line {line_number} of {path}: {e}")
+    else:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = [cell.strip().lower() for cell in next(reader, [])]
+            if "topic" in header:
+                rows.extend(dict(zip(header, (cell.strip() for cell in row))) for row in reader)
+            else:
+                # No header: the first column is the topic
+                rows.extend({"topic": row[0].strip()} for row in [header] + list(reader) if row)
+
+    return [row for row in rows if isinstance(row, dict) and str(row.get("topic") or "").strip()]
+
+
+def expand_items(rows, modes, lengths):
+    """Turn topic rows into unique (topic, length, mode) work items."""
+
+    items = []
+    seen = set()
+    for row in rows:
+        topic = str(row["topic"]).strip()
+        row_modes = [MODES.get(row["mode"], row["mode"])] if row.get("mode") else [MODES[m] for m in modes]
+        row_lengths = [row["length"]] if row.get("length") else lengths
+        for mode in row_modes:
+            for length in row_lengths:
+                item = (topic, length, mode)
+                if item not in seen:
+                    seen.add(item)
+                    items.append(item)
+    return items
+
+
+def load_checkpoint(path):
+    """Return the ids of items a previous run completed."""
+
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                # A line cut short by an interrupted write
+                continue
+    return done
+
+
+class Backoff:
+    """Shared pause so every worker waits out a rate limit, not just the one that hit it."""
+
+    def __init__(self):
+        self._until = 0.0
+        self._lock = threading.Lock()
+
+    def extend(self, seconds):
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + seconds)
+
+    def wait(self):
+        while True:
+            with self._lock:
+                remaining = self._until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+
+def generate_item(topic, length, mode, args, backoff):
+    """
+    Generate one item and its media, retrying while rate limited.
+
+    Returns:
+        Checkpoint record for the item
+
+    Raises:
+        RuntimeError: If generation failed or rate limiting outlasted the attempts
+    """
+
+    for attempt in range(1, args.max_attempts + 1):
+        backoff.wait()
+        try:
+            result = call_genai(args.api_key, topic, length, mode)
+            if not result:
+                raise RuntimeError("generation failed")
+
+            briefing, code_content, audio_script, image_prompts = result
+            record = {"id": make_cache_key(topic, length, mode), "topic": topic, "length": length, "mode": mode}
+
+            if code_content:
+                record["code_file"] = save_code_to_file(code_content, topic)
+            if image_prompts:
+                record["image_prompts"] = len(image_prompts)
+                if not args.no_media:
+                    record["images"] = generate_images(image_prompts, args.api_key, args.hf_key, args.backend)
+                    if len(record["images"]) < len(image_prompts):
+                        # Leave it out of the checkpoint; stored images are reused on the rerun
+                        raise RuntimeError(f"only {len(record['images'])}/{len(image_prompts)} images generated")
+            if mode == MODES["audio"] and not args.no_media:
+                # Same text and topic as /api/generate-audio, so it finds this file
+                record["audio_file"] = text_to_audio(audio_script or briefing, topic)
+            return record
+
+        except RateLimitError as e:
+            logger.warning(f"Rate limited on '{topic}' ({length}, {mode}), attempt {attempt}; waiting {e.retry_after}s")
+            backoff.extend(e.retry_after)
+
+    raise RuntimeError(f"still rate limited after {args.max_attempts} attempts")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logger.setLevel(logging.INFO)
+
+    if not args.api_key:
+        logger.error("A Gemini API key is required (--api-key or GEMINI_API_KEY)")
+        return 2
+
+    rows = read_topics(args.topics)
+    items = expand_items(rows, args.modes, args.lengths)
+    checkpoint_path = args.checkpoint or f"{os.path.splitext(args.topics)[0]}.checkpoint.jsonl"
+    done = load_checkpoint(checkpoint_path)
+    pending = [item for item in items if make_cache_key(*item) not in done]
+    logger.info(f"{len(rows)} topics, {len(items)} items, {len(items) - len(pending)} already done, {len(pending)} to go")
+
+    backoff = Backoff()
+    completed = failed = 0
+    started = time.perf_counter()
+    write_lock = threading.Lock()
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        futures = {executor.submit(generate_item, *item, args, backoff): item for item in pending}
+        try:
+            for future in as_completed(futures):
+                topic, length, mode = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Failed '{topic}' ({length}, {mode}): {e}")
+                    continue
+
+                completed += 1
+                with write_lock:
+                    checkpoint.write(json.dumps(record) + "\n")
+                    checkpoint.flush()
+                logger.info(f"[{completed + failed}/{len(pending)}] '{topic}' ({length}, {mode})")
+
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; finished items are in the checkpoint, rerun to resume")
+            for future in futures:
+                future.cancel()
+            raise
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Done in {elapsed:.1f}s: {completed} generated, {failed} failed, checkpoint {checkpoint_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
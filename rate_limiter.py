@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GEMINI_TEXT_RPM = float(os.getenv('GEMINI_TEXT_RPM', '15'))
+GEMINI_IMAGE_RPM = float(os.getenv('GEMINI_IMAGE_RPM', '10'))
+HF_IMAGE_RPM = float(os.getenv('HF_IMAGE_RPM', '30'))
+RETRY_MAX_ATTEMPTS = int(os.getenv('GEMINI_RETRY_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.getenv('GEMINI_RETRY_BASE_DELAY', '1.0'))
+RETRY_MAX_DELAY = float(os.getenv('GEMINI_RETRY_MAX_DELAY', '8.0'))
+RETRY_MAX_TOTAL_WAIT = float(os.getenv('GEMINI_RETRY_MAX_TOTAL_WAIT', '10.0'))
+
+
+class RateLimitError(Exception):
+    """Raised when an upstream call cannot be made within the allowed wait."""
+
+    status_code = 429
+    user_message = "Rate limit exceeded. Please try again later."
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class UpstreamUnavailableError(RateLimitError):
+    """Raised when a call is shed because the upstream is failing or saturated."""
+
+    status_code = 503
+    user_message = "The content service is temporarily unavailable. Please try again shortly."
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every caller of one upstream quota.
+
+    Tokens refill continuously at ``rate_per_minute``; up to ``burst`` tokens
+    can be banked. A server retry hint pauses the whole bucket so concurrent
+    callers back off together instead of each discovering the 429 separately.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1.0, rate_per_minute))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Caller must hold the lock
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait):
+        """
+        Reserve one token if it becomes available within ``max_wait`` seconds.
+
+        Args:
+            max_wait: Longest acceptable wait in seconds
+
+        Returns:
+            Seconds the caller must wait before using the token, or None if the
+            token would not be available in time (nothing is reserved then)
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            pause = max(0.0, self._paused_until - now)
+            deficit = max(0.0, 1.0 - self._tokens)
+            wait = max(pause, deficit / self.rate if self.rate > 0 else float('inf'))
+            if wait > max_wait:
+                return None
+            self._tokens -= 1.0
+            return wait
+
+    def next_available(self):
+        """Return seconds until a token is expected to be available."""
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            pause = max(0.0, self._paused_until - now)
+            deficit = max(0.0, 1.0 - self._tokens)
+            return max(pause, deficit / self.rate if self.rate > 0 else 60.0)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for ``seconds`` (e.g. after a server retry hint)."""
+
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def is_rate_limited(error):
+    """
+    Check whether an upstream exception is a 429 / RESOURCE_EXHAUSTED error.
+
+    Covers google.api_core exceptions (``code`` is an HTTPStatus) and
+    google.genai API errors (``code`` is an int).
+    """
+
+    if getattr(error, 'code', None) == 429:
+        return True
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+_HINT_PATTERNS = [
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?([\d.]+)s"),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+]
+
+
+def retry_hint(error):
+    """
+    Extract the server-suggested retry delay from an upstream exception.
+
+    Looks at RetryInfo details, a Retry-After response header and finally
+    the error message.
+
+    Args:
+        error: Exception raised by a Gemini SDK call
+
+    Returns:
+        Delay in seconds, or None if the server gave no hint
+    """
+
+    details = getattr(error, 'details', None)
+    if isinstance(details, (list, tuple)):
+        for detail in details:
+            delay = getattr(detail, 'retry_delay', None)
+            if delay is not None and hasattr(delay, 'seconds'):
+                return delay.seconds + getattr(delay, 'nanos', 0) / 1e9
+
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('Retry-After'):
+            return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        pass
+
+    text = f"{details} {error}" if details else str(error)
+    for pattern in _HINT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+
+    return None
+
+
+class RetryScheduler:
+    """
+    Runs upstream calls through a token bucket with bounded retries.
+
+    Rate-limited calls are retried with exponential backoff and full jitter,
+    or after the server's retry hint when one is given. The total time a
+    single request may spend waiting is capped by ``max_total_wait``; beyond
+    that a RateLimitError is raised so the caller can answer with HTTP 429.
+    """
+
+    def __init__(self, name, bucket, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY, max_total_wait=RETRY_MAX_TOTAL_WAIT):
+        self.name = name
+        self.bucket = bucket
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total_wait = max_total_wait
+
+    def backoff(self, attempt):
+        """Return the jittered backoff delay for a zero-based retry attempt."""
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _reserve(self, waited):
+        """Reserve a token within the remaining budget or shed the request."""
+
+        wait = self.bucket.reserve(self.max_total_wait - waited)
+        if wait is None:
+            retry_after = self.bucket.next_available()
+            metrics.inc("upstream_errors_total", upstream=self.name, kind="shed")
+            logger.warning(f"{self.name}: local rate limit reached, shedding request (retry in {retry_after:.1f}s)")
+            raise RateLimitError(f"{self.name} rate limit reached", retry_after)
+        if wait > 0:
+            metrics.observe("stage_seconds", wait, stage="rate_limit_wait")
+        return wait
+
+    def _retry_delay(self, error, attempt, waited):
+        """Return how long to wait before retrying ``error``, or raise if we should not."""
+
+        if not is_rate_limited(error):
+            metrics.inc("upstream_errors_total", upstream=self.name, kind="error")
+            raise error
+        metrics.inc("upstream_errors_total", upstream=self.name, kind="rate_limited")
+        hint = retry_hint(error)
+        if hint is not None:
+            self.bucket.pause(hint)
+        delay = hint if hint is not None else self.backoff(attempt)
+
+        if attempt + 1 >= self.max_attempts or waited + delay > self.max_total_wait:
+            logger.warning(f"{self.name}: rate limited, giving up after {attempt + 1} attempt(s)")
+            raise RateLimitError(f"{self.name} rate limit exceeded", delay) from error
+
+        logger.warning(f"{self.name}: rate limited, retrying in {delay:.1f}s ({attempt + 1}/{self.max_attempts})")
+        metrics.inc("upstream_retries_total", upstream=self.name)
+        metrics.observe("stage_seconds", delay, stage="retry_wait")
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call ``fn(*args, **kwargs)`` under the rate limit.
+
+        Non rate-limit exceptions propagate unchanged.
+
+        Returns:
+            Whatever ``fn`` returns
+
+        Raises:
+            RateLimitError: If the call cannot succeed within the wait budget
+        """
+
+        waited = 0.0
+        for attempt in range(self.max_attempts):
+            wait = self._reserve(waited)
+            if wait > 0:
+                time.sleep(wait)
+                waited += wait
+
+            try:
+                return fn(*args, **kwargs)
+            except UpstreamUnavailableError:
+                raise
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, waited)
+                time.sleep(delay)
+                waited += delay
+
+        raise RateLimitError(f"{self.name} rate limit exceeded", self.bucket.next_available())
+
+    async def call_async(self, fn, *args, **kwargs):
+        """
+        Await ``fn(*args, **kwargs)`` under the rate limit.
+
+        Same policy as ``call``, but waits yield to the event loop instead of
+        blocking a thread.
+
+        Returns:
+            Whatever ``fn`` resolves to
+
+        Raises:
+            RateLimitError: If the call cannot succeed within the wait budget
+        """
+
+        waited = 0.0
+        for attempt in range(self.max_attempts):
+            wait = self._reserve(waited)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+
+            try:
+                return await fn(*args, **kwargs)
+            except UpstreamUnavailableError:
+                raise
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, waited)
+                await asyncio.sleep(delay)
+                waited += delay
+
+        raise RateLimitError(f"{self.name} rate limit exceeded", self.bucket.next_available())
+
+
+text_scheduler = RetryScheduler("gemini-text", TokenBucket(GEMINI_TEXT_RPM))
+image_scheduler = RetryScheduler("gemini-image", TokenBucket(GEMINI_IMAGE_RPM))
+hf_image_scheduler = RetryScheduler("huggingface-image", TokenBucket(HF_IMAGE_RPM))
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import threading
+
+from utils.rate_limiter import UpstreamUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _retrieve_exception(task):
+    # Every waiter may have been cancelled; don't let asyncio log the failure as unhandled
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight block until it finishes and receive the same result (or the same
+    exception). Nothing is remembered once the call completes; caching is left
+    to the caller.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` once per concurrent ``key``.
+
+        Args:
+            key: Hashable identity of the call
+            fn: Function to run if no identical call is in flight
+
+        Returns:
+            The (possibly shared) return value of ``fn``
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            logger.info(f"{self.name}: joined in-flight call")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """
+        Coroutine variant of ``do`` for callers sharing one event loop.
+
+        The call runs in its own task and every caller, the first included,
+        waits on it through ``asyncio.shield``: a caller that is cancelled
+        stops waiting, but the call carries on for the others.
+
+        Args:
+            key: Hashable identity of the call
+            fn: Coroutine function to await if no identical call is in flight
+
+        Returns:
+            The (possibly shared) result of ``fn``
+        """
+
+        task = self._async_calls.get(key)
+        if task is not None:
+            with self._lock:
+                self._coalesced += 1
+            logger.info(f"{self.name}: joined in-flight call")
+        else:
+            task = asyncio.get_running_loop().create_task(self._run_shared(key, fn, args, kwargs))
+            task.add_done_callback(_retrieve_exception)
+            self._async_calls[key] = task
+            with self._lock:
+                self._executed += 1
+
+        return await asyncio.shield(task)
+
+    async def _run_shared(self, key, fn, args, kwargs):
+        try:
+            return await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # The shared call itself was aborted: give every waiter an error it can retry
+            raise UpstreamUnavailableError(f"{self.name}: in-flight call was cancelled", 1) from None
+        finally:
+            del self._async_calls[key]
+
+    def stats(self):
+        """
+        Return coalescing counters.
+
+        Returns:
+            Dictionary with executed, coalesced and in-flight counts
+        """
+
+        with self._lock:
+            executed, coalesced = self._executed, self._coalesced
+            in_flight = len(self._calls) + len(self._async_calls)
+        total = executed + coalesced
+        return {
+            "executed": executed,
+            "coalesced": coalesced,
+            "in_flight": in_flight,
+            "coalesced_ratio": round(coalesced / total, 4) if total else 0.0,
+        }
+
+
+text_flight = SingleFlight("gemini-text")
+image_flight = SingleFlight("gemini-image")
+
+
+def get_coalescing_stats():
+    """
+    Return coalescing counters for text and image generation.
+
+    Returns:
+        Dictionary keyed by flight group
+    """
+
+    return {
+        "text": text_flight.stats(),
+        "image": image_flight.stats(),
+    }
@@ -0,0 +1,24 @@
+"""
+Test setup: the modules live in the repository root but import each other
+as ``utils.<module>``, and the Gemini SDKs are replaced by fake_gemini.
+"""
+
+import os
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if "utils" not in sys.modules:
+    package = types.ModuleType("utils")
+    package.__path__ = [ROOT]
+    sys.modules["utils"] = package
+
+import fake_gemini  # noqa: E402
+
+fake_gemini.install()
+
+# Caches, history and generated files are written relative to the working directory
+os.chdir(tempfile.mkdtemp(prefix="learnsphere_tests_"))
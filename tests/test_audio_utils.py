@@ -0,0 +1,33 @@
+import pytest
+
+import fake_gemini
+from utils import audio_utils
+
+
+@pytest.fixture
+def process_pool(monkeypatch):
+    monkeypatch.setattr(audio_utils, "_process_executor", None)
+    monkeypatch.setattr(audio_utils, "TTS_PROCESS_WORKERS", 1)
+    engine = fake_gemini.FakeTTSEngine("standin-cpu", latency_ms=1, cpu_bound=True)
+    executor = audio_utils._executor_for(engine)
+    yield engine, executor
+    executor.shutdown(wait=True)
+
+
+def test_worker_processes_load_the_tts_worker_instead_of_the_parents_main(process_pool):
+    _, executor = process_pool
+
+    main_file = executor.submit(eval, "__import__('sys').modules['__mp_main__'].__file__").result(timeout=60)
+    modules = executor.submit(eval, "sorted(__import__('sys').modules)").result(timeout=60)
+
+    assert main_file == audio_utils.TTS_WORKER_MAIN
+    assert "pytest" not in modules and "_pytest" not in modules
+
+
+def test_worker_processes_synthesize_chunks(process_pool):
+    engine, executor = process_pool
+
+    audio, seconds = executor.submit(audio_utils._synthesize_chunk, engine, "Hello there.").result(timeout=60)
+
+    assert audio.startswith(b"\xff\xfb")
+    assert seconds is not None
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+import pytest
+
+import app as app_module
+from app import app
+from utils.rate_limiter import RateLimitError
+
+
+def _post(body):
+    response = app.test_client().post('/api/batch-generate', json=body)
+    return response, [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+@pytest.fixture
+def pipelines(monkeypatch):
+    in_flight = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def text_pipeline(api_key, topic, length):
+        with lock:
+            in_flight.append(topic)
+            peak[0] = max(peak[0], len(in_flight))
+        try:
+            time.sleep(0.05)
+            if topic == "limited":
+                raise RateLimitError("limited", 9)
+            if topic == "broken":
+                raise RuntimeError("boom")
+            return {'briefing': f"{topic} ({length})"}, 200
+        finally:
+            with lock:
+                in_flight.remove(topic)
+
+    monkeypatch.setattr(app_module, "_text_pipeline", text_pipeline)
+    monkeypatch.setattr(app_module, "_code_pipeline", lambda api_key, topic, length: ({'code': topic}, 200))
+    return peak
+
+
+@pytest.mark.parametrize("body, error", [
+    ({'items': []}, 'A non-empty list of items is required'),
+    ({'items': [{'topic': 'PCA'}], 'api_key': 'k', 'concurrency': 'many'}, 'concurrency must be an integer'),
+])
+def test_invalid_batches_are_refused(body, error):
+    response, _ = _post(body)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+
+def test_batch_is_capped(monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_MAX_ITEMS", 2)
+
+    response, _ = _post({'items': [{'topic': 'a'}] * 3, 'api_key': 'k'})
+
+    assert response.status_code == 400
+
+
+def test_each_item_gets_a_line_and_the_batch_a_summary(pipelines):
+    items = [
+        {'topic': 'PCA', 'length': 'Detailed'},
+        {'topic': 'SVM', 'mode': 'code'},
+        {'topic': 'limited'},
+        {'topic': 'broken'},
+        {'topic': ' '},
+        {'topic': 'KNN', 'mode': 'poetry'},
+    ]
+
+    response, lines = _post({'items': items, 'api_key': 'k'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    summary = lines.pop()
+    by_index = {line['index']: line for line in lines}
+    assert summary == {'done': True, 'succeeded': 2, 'failed': 4}
+    assert by_index[0]['result'] == {'briefing': 'PCA (Detailed)'}
+    assert by_index[1] == {'index': 1, 'status': 200, 'topic': 'SVM', 'mode': 'code', 'result': {'code': 'SVM'}}
+    assert (by_index[2]['status'], by_index[2]['retry_after']) == (429, 9)
+    assert (by_index[3]['status'], by_index[3]['error']) == (500, 'boom')
+    assert (by_index[4]['status'], by_index[4]['error']) == (400, 'Topic is required')
+    assert (by_index[5]['status'], by_index[5]['error']) == (400, 'Unknown mode: poetry')
+
+
+def test_items_in_flight_are_limited_by_concurrency(pipelines):
+    items = [{'topic': f"topic {i}"} for i in range(8)]
+
+    _, lines = _post({'items': items, 'api_key': 'k', 'concurrency': 2})
+
+    assert lines[-1]['succeeded'] == 8
+    assert pipelines[0] == 2
@@ -0,0 +1,80 @@
+import types
+
+import pytest
+
+from utils import cache_utils
+from utils.cache_utils import ResponseCache, make_cache_key
+
+VALUE = ("briefing", "code", "script", ["prompt"])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_utils, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_cache_key_ignores_case_and_whitespace():
+    assert make_cache_key("  Linear   Regression", "Brief", "Text") == make_cache_key("linear regression", "brief", "text")
+    assert make_cache_key("linear regression", "Brief", "Text") != make_cache_key("linear regression", "Detailed", "Text")
+
+
+def test_hit_from_memory_then_from_disk_after_restart(tmp_path, clock):
+    cache = ResponseCache(cache_dir=str(tmp_path), max_entries=4, ttl_seconds=60)
+    cache.set("k", VALUE)
+
+    assert cache.get("k") == ("briefing", "code", "script", ["prompt"])
+    assert cache.stats()["memory_hits"] == 1
+
+    restarted = ResponseCache(cache_dir=str(tmp_path), max_entries=4, ttl_seconds=60)
+    assert restarted.get("k") == VALUE
+    assert restarted.get("k") == VALUE
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_miss_is_counted(tmp_path, clock):
+    cache = ResponseCache(cache_dir=str(tmp_path), ttl_seconds=60)
+
+    assert cache.get("unknown") is None
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hit_rate"] == 0.0
+
+
+def test_expired_entry_misses_but_is_served_stale_until_the_stale_period_ends(tmp_path, clock):
+    cache = ResponseCache(cache_dir=str(tmp_path), ttl_seconds=60, stale_seconds=100)
+    cache.set("k", VALUE)
+
+    clock[0] += 61
+    assert cache.get("k") is None
+    assert cache.get_stale("k") == VALUE
+    assert cache.stats()["stale_hits"] == 1
+
+    clock[0] += 100
+    assert cache.get_stale("k") is None
+    assert cache.get("k") is None
+    assert not (tmp_path / "k.json").exists()
+
+
+def test_least_recently_used_entry_is_evicted_from_memory(tmp_path, clock):
+    cache = ResponseCache(cache_dir=str(tmp_path), max_entries=2, ttl_seconds=60)
+    cache.set("a", VALUE)
+    cache.set("b", VALUE)
+    cache.get("a")
+    cache.set("c", VALUE)
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["memory_entries"] == 2
+
+    # "b" was evicted from memory but is still on disk
+    cache.get("b")
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path, clock):
+    cache = ResponseCache(cache_dir=str(tmp_path), ttl_seconds=60)
+    (tmp_path / "k.json").write_text("{not json", encoding="utf-8")
+
+    assert cache.get("k") is None
@@ -0,0 +1,42 @@
+import asyncio
+
+from google.genai import Client
+
+import fake_gemini
+from utils.client_pool import get_async_text_model, get_text_model
+
+CONFIG = {"temperature": 0.7, "max_output_tokens": 256}
+SAFETY = [{"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"}]
+
+
+def test_text_models_are_built_on_a_public_client_per_key():
+    first = get_text_model("key-a", "gemini-test", CONFIG, SAFETY)
+    again = get_text_model("key-a", "gemini-test", dict(CONFIG), SAFETY)
+    other = get_text_model("key-b", "gemini-test", CONFIG, SAFETY)
+
+    assert first is again
+    assert isinstance(first.client, Client)
+    assert other.client is not first.client
+    assert first.config.max_output_tokens == 256
+    assert first.config.safety_settings[0].category == "HARM_CATEGORY_HARASSMENT"
+
+
+def test_async_models_use_their_own_client_per_event_loop():
+    async def model():
+        return get_async_text_model("key-c", "gemini-test", CONFIG)
+
+    sync_model = get_text_model("key-c", "gemini-test", CONFIG)
+    first_loop = asyncio.run(model())
+    second_loop = asyncio.run(model())
+
+    assert first_loop is not sync_model and first_loop.client is not sync_model.client
+    assert second_loop.client is not first_loop.client
+
+
+def test_streamed_text_comes_back_in_chunks(monkeypatch):
+    monkeypatch.setattr(fake_gemini.config, "text_latency_ms", 0)
+    monkeypatch.setattr(fake_gemini.config, "jitter_ms", 0)
+    chunks = list(get_text_model("key-d", "gemini-test", CONFIG).generate_content('Topic: "PCA"', stream=True))
+
+    assert len(chunks) > 1
+    assert "".join(chunk.text for chunk in chunks).startswith("LEARNING OBJECTIVE")
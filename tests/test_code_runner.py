@@ -0,0 +1,61 @@
+import subprocess
+import sys
+import threading
+import time
+
+from utils import code_runner
+
+
+class _FakeSandbox:
+    live = set()
+    duplicates = []
+    lock = threading.Lock()
+
+    def __init__(self, slot, preload, hidden):
+        with self.lock:
+            if slot in self.live:
+                self.duplicates.append(slot)
+            self.live.add(slot)
+        time.sleep(0.05)
+        self.slot = slot
+
+    def run(self, code, limits):
+        yield "exit", {"exit_code": 0}
+
+    def destroy(self):
+        with self.lock:
+            self.live.discard(self.slot)
+
+
+def test_concurrent_runs_never_respawn_the_same_slot_twice(monkeypatch):
+    monkeypatch.setattr(code_runner, "_Sandbox", _FakeSandbox)
+    pool = code_runner.WarmRunnerPool(size=2)
+    pool._started = True
+    pool._down = {0, 1}
+
+    threads = [threading.Thread(target=lambda: list(pool.run("print(1)"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _FakeSandbox.duplicates == []
+    assert pool._down == set() and pool._spawning == set()
+
+
+def test_multibyte_characters_split_across_reads_are_decoded():
+    writer = (
+        "import sys, time\n"
+        "sys.stdin.buffer.read()\n"
+        "data = 'é✓'.encode()\n"
+        "for i in range(len(data)):\n"
+        "    sys.stdout.buffer.write(data[i:i + 1]); sys.stdout.flush(); time.sleep(0.02)\n"
+    )
+    sandbox = object.__new__(code_runner._Sandbox)
+    sandbox.process = subprocess.Popen([sys.executable, "-c", writer], stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    events = list(sandbox.run("", code_runner.default_limits()))
+
+    assert "".join(text for name, text in events if name == "stdout") == "é✓"
+    assert events[-1][1]["exit_code"] == 0
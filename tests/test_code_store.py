@@ -0,0 +1,63 @@
+import io
+import random
+import zipfile
+
+from app import app
+from utils import code_store
+from utils.code_store import code_metadata, code_path, save_code, stream_bundle
+
+
+def _big_script(lines=20000):
+    rng = random.Random(7)
+    return "".join(f"value_{i} = {rng.random()!r}  # {rng.getrandbits(64):x}\n" for i in range(lines))
+
+
+def test_identical_code_is_stored_once():
+    first = save_code("print('dedup')\n", "Linear Regression", ["numpy"])
+    before = code_store.get_code_store_stats()["dedup_hits"]
+
+    second = save_code("print('dedup')\n", "Another topic", ["pandas"])
+
+    assert first == second
+    assert code_store.get_code_store_stats()["dedup_hits"] == before + 1
+    assert code_metadata(first)["topic"] == "Linear Regression"
+    assert code_metadata(first)["dependencies"] == ["numpy"]
+
+
+def test_unknown_and_unsafe_names_do_not_resolve():
+    assert code_path("missing.py") is None
+    assert code_path("../app.py") is None
+    assert code_metadata("legacy_20240101_000000.py") is None
+
+
+def test_stream_bundle_yields_a_valid_zip_in_several_chunks():
+    script = _big_script()
+    filename = save_code(script, "Big topic", ["scikit-learn", "numpy"])
+
+    chunks = list(stream_bundle(filename, "Big_topic", ["scikit-learn", "numpy"]))
+
+    assert len([chunk for chunk in chunks if chunk]) > 2
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as bundle:
+        assert bundle.testzip() is None
+        assert bundle.namelist() == ["Big_topic.py", "requirements.txt"]
+        assert bundle.read("Big_topic.py").decode() == script
+        assert bundle.read("requirements.txt").decode() == "numpy\nscikit-learn\n"
+
+
+def test_download_bundle_route_streams_the_zip_and_honours_its_etag():
+    filename = save_code("import pandas as pd\nprint(pd)\n", "Data Frames", ["pandas"])
+    client = app.test_client()
+
+    response = client.get(f'/api/download-bundle/{filename}')
+    data = response.get_data()
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert 'filename="Data_Frames.zip"' in response.headers['Content-Disposition']
+    with zipfile.ZipFile(io.BytesIO(data)) as bundle:
+        assert bundle.testzip() is None
+        assert bundle.read("requirements.txt") == b"pandas\n"
+
+    again = client.get(f'/api/download-bundle/{filename}', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert client.get('/api/download-bundle/missing.py').status_code == 404
@@ -0,0 +1,31 @@
+import pytest
+
+import fake_gemini
+from utils import genai_utils
+from utils.cache_utils import make_cache_key, response_cache
+
+LENGTH = "Brief"
+MODE = "Text explanation"
+
+
+@pytest.fixture
+def empty_upstream(monkeypatch):
+    monkeypatch.setattr(fake_gemini.config, "text_latency_ms", 0)
+    monkeypatch.setattr(fake_gemini.config, "jitter_ms", 0)
+    monkeypatch.setattr(fake_gemini, "_response_text", lambda prompt: "")
+
+
+def test_empty_stream_yields_error_and_is_not_cached(empty_upstream):
+    topic = "empty stream topic"
+
+    events = list(genai_utils.call_genai_stream("test-key", topic, LENGTH, MODE))
+
+    assert [event for event, _ in events] == ["error"]
+    assert response_cache.get(make_cache_key(topic, LENGTH, MODE)) is None
+
+
+def test_empty_response_is_not_cached(empty_upstream):
+    topic = "empty response topic"
+
+    assert genai_utils.call_genai("test-key", topic, LENGTH, MODE) is None
+    assert response_cache.get(make_cache_key(topic, LENGTH, MODE)) is None
@@ -0,0 +1,65 @@
+import pytest
+
+from utils.history_store import HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(path=str(tmp_path / "history.db"), max_per_session=5)
+
+
+def test_pages_are_newest_first_and_follow_the_cursor(store):
+    ids = [store.record("s1", f"topic {i}", "Brief", "Text explanation") for i in range(4)]
+
+    first = store.list("s1", limit=3)
+    second = store.list("s1", limit=3, before=first["next_cursor"])
+
+    assert [item["id"] for item in first["items"]] == ids[:0:-1]
+    assert first["next_cursor"] == ids[1]
+    assert [item["id"] for item in second["items"]] == [ids[0]]
+    assert second["next_cursor"] is None
+    assert "briefing" not in first["items"][0]
+
+
+def test_sessions_only_see_their_own_entries(store):
+    entry_id = store.record("s1", "PCA", "Brief", "Text explanation", briefing="notes")
+
+    assert store.list("s2")["items"] == []
+    assert store.get("s2", entry_id) is None
+    assert store.delete("s2", entry_id) == 0
+    assert store.get("s1", entry_id)["briefing"] == "notes"
+
+
+def test_filters_and_latest_normalize_the_topic(store):
+    store.record("s1", "Linear Regression", "Brief", "Text explanation", briefing="old")
+    store.record("s1", "linear  regression", "Brief", "Code with explanation", code_file="lr.py")
+    store.record("s1", "LINEAR REGRESSION", "Brief", "Text explanation", briefing="new",
+                 images=["/api/images/a.webp"])
+
+    by_topic = store.list("s1", topic=" linear regression ")
+    by_mode = store.list("s1", mode="Code with explanation")
+    latest = store.latest("s1", "linear regression", "Brief", "Text explanation")
+
+    assert len(by_topic["items"]) == 3
+    assert [item["code_file"] for item in by_mode["items"]] == ["lr.py"]
+    assert latest["briefing"] == "new"
+    assert latest["images"] == ["/api/images/a.webp"]
+
+
+def test_old_entries_are_pruned_past_the_per_session_cap(store):
+    ids = [store.record("s1", f"topic {i}", "Brief", "Text explanation") for i in range(7)]
+    store.record("s2", "other", "Brief", "Text explanation")
+
+    kept = [item["id"] for item in store.list("s1", limit=100)["items"]]
+
+    assert kept == ids[:1:-1]
+    assert store.stats()["pruned"] == 2
+    assert len(store.list("s2")["items"]) == 1
+
+
+def test_delete_one_entry_or_the_whole_session(store):
+    ids = [store.record("s1", f"topic {i}", "Brief", "Text explanation") for i in range(3)]
+
+    assert store.delete("s1", ids[0]) == 1
+    assert store.delete("s1") == 2
+    assert store.list("s1")["items"] == []
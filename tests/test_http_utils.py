@@ -0,0 +1,103 @@
+import gzip
+
+import pytest
+from flask import Response
+
+import app as app_module
+from app import app
+from utils import http_utils
+from utils.http_utils import choose_encoding, compress_body, compress_response
+
+PAGE = "<html><body>" + "LearnSphere explains machine learning. " * 100 + "</body></html>"
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    monkeypatch.setattr(app_module, "render_template", lambda name, **context: PAGE)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0, identity", None),
+    ("*", "gzip"),
+    ("", None),
+    (None, None),
+])
+def test_choose_encoding_without_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(http_utils, "brotli", None)
+
+    assert choose_encoding(header) == expected
+
+
+def test_small_bodies_are_not_compressed():
+    assert compress_body(b"{}", "gzip") == (b"{}", None)
+
+
+def test_gzip_output_is_stable():
+    data = PAGE.encode()
+
+    first, coding = compress_body(data, "gzip")
+
+    assert coding == "gzip"
+    assert gzip.decompress(first) == data
+    assert compress_body(data, "gzip")[0] == first
+
+
+def test_streamed_responses_are_not_compressed():
+    with app.test_request_context():
+        response = Response(iter([PAGE]), mimetype="application/json")
+        compress_response(response, "gzip")
+
+    assert response.is_streamed
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.vary
+
+
+def test_partial_responses_are_not_compressed():
+    with app.test_request_context():
+        response = Response(PAGE, status=206, mimetype="text/plain")
+        response.headers["Content-Range"] = f"bytes 0-{len(PAGE) - 1}/{len(PAGE) * 2}"
+        compress_response(response, "gzip")
+
+    assert response.get_data(as_text=True) == PAGE
+
+
+def test_pages_are_compressed_and_revalidated_with_an_etag(pages):
+    client = app.test_client()
+
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode() == PAGE
+    assert 'no-cache' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+
+    again = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b""
+
+    changed = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"stale"'})
+    assert changed.status_code == 200
+
+
+def test_pages_without_compression_get_a_different_etag(pages):
+    client = app.test_client()
+
+    plain = client.get('/')
+    compressed = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['ETag'] != compressed.headers['ETag']
+
+
+def test_streamed_api_responses_are_sent_uncompressed(monkeypatch):
+    monkeypatch.setattr(app_module, "_text_pipeline", lambda api_key, topic, length: ({'briefing': PAGE}, 200))
+
+    response = app.test_client().post('/api/batch-generate', json={'items': [{'topic': 'PCA'}], 'api_key': 'k'},
+                                      headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert 'ETag' not in response.headers
+    assert PAGE in response.get_data(as_text=True)
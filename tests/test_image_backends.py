@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from utils import image_backends
+from utils.image_backends import ImageBackend, generate_image
+from utils.rate_limiter import RateLimitError
+
+
+class ScriptedBackend(ImageBackend):
+    """Answers after ``delay`` seconds with an image, or raises ``error``."""
+
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.finished = threading.Event()
+
+    def generate(self, prompt):
+        self.calls += 1
+        try:
+            time.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            return f"{self.name}:{prompt}".encode(), "image/png"
+        finally:
+            self.finished.set()
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(image_backends, "IMAGE_HEDGE", True)
+    monkeypatch.setattr(image_backends, "hedge_delay", lambda name: 0.05)
+
+
+def test_image_backend_requires_generate():
+    class Incomplete(ImageBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_hedge_wins_when_the_primary_is_slow(hedging):
+    primary = ScriptedBackend("primary", delay=1.0)
+    hedge = ScriptedBackend("hedge", delay=0.01)
+
+    started = time.perf_counter()
+    result = generate_image([primary, hedge], "cat", "1/1")
+
+    assert result == (b"hedge:cat", "image/png", "hedge")
+    assert time.perf_counter() - started < 0.5
+    assert primary.calls == 1 and hedge.calls == 1
+    primary.finished.wait(2)
+
+
+def test_primary_error_falls_back_without_waiting_for_the_hedge_delay(monkeypatch):
+    monkeypatch.setattr(image_backends, "IMAGE_HEDGE", True)
+    monkeypatch.setattr(image_backends, "hedge_delay", lambda name: 30)
+    primary = ScriptedBackend("primary", error=RuntimeError("boom"))
+    fallback = ScriptedBackend("fallback")
+
+    started = time.perf_counter()
+    result = generate_image([primary, fallback], "cat", "1/1")
+
+    assert result == (b"fallback:cat", "image/png", "fallback")
+    assert time.perf_counter() - started < 5
+
+
+def test_primary_error_falls_back_without_hedging():
+    primary = ScriptedBackend("primary", error=RuntimeError("boom"))
+    fallback = ScriptedBackend("fallback")
+
+    assert generate_image([primary, fallback], "cat", "1/1") == (b"fallback:cat", "image/png", "fallback")
+
+
+@pytest.mark.parametrize("hedge", [False, True])
+def test_both_failing_returns_none(monkeypatch, hedge):
+    monkeypatch.setattr(image_backends, "IMAGE_HEDGE", hedge)
+    backends = [ScriptedBackend("primary", error=RuntimeError("boom")),
+                ScriptedBackend("fallback", error=RuntimeError("boom"))]
+
+    assert generate_image(backends, "cat", "1/1") is None
+    assert [backend.calls for backend in backends] == [1, 1]
+
+
+def test_both_failing_reraises_a_rate_limit(hedging):
+    limited = RateLimitError("quota exhausted", retry_after=5)
+    backends = [ScriptedBackend("primary", error=limited),
+                ScriptedBackend("fallback", error=RuntimeError("boom"))]
+
+    with pytest.raises(RateLimitError):
+        generate_image(backends, "cat", "1/1")
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import image_utils
+
+
+@pytest.fixture
+def one_worker(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(image_utils, "_image_executor", executor)
+    yield
+    executor.shutdown(wait=True)
+
+
+def test_time_queued_behind_other_images_does_not_count_against_the_deadline(one_worker, monkeypatch):
+    def slow_image(backends, prompt, index, total):
+        time.sleep(0.2)
+        return f"/api/images/{prompt}.webp"
+
+    monkeypatch.setattr(image_utils, "_gen_one", slow_image)
+    batch = image_utils.ImageBatch("test-key", timeout=0.3)
+    for prompt in ("a", "b", "c"):
+        batch.submit(prompt)
+
+    assert batch.collect() == ["/api/images/a.webp", "/api/images/b.webp", "/api/images/c.webp"]
+
+
+def test_images_beyond_the_queue_bound_are_shed(one_worker, monkeypatch):
+    release = threading.Event()
+
+    def blocked_image(backends, prompt, index, total):
+        release.wait(5)
+        return f"/api/images/{prompt}.webp"
+
+    monkeypatch.setattr(image_utils, "_gen_one", blocked_image)
+    monkeypatch.setattr(image_utils, "IMAGE_MAX_QUEUED", 1)
+    batch = image_utils.ImageBatch("test-key")
+    batch.submit("running")
+    assert batch._pending[0].started.wait(5)
+    batch.submit("queued")
+    batch.submit("shed")
+    release.set()
+
+    assert batch.collect() == ["/api/images/running.webp", "/api/images/queued.webp"]
+    assert image_utils.get_image_queue_stats()["queued"] == 0
+
+
+def test_images_waiting_too_long_for_a_worker_are_shed(one_worker, monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def blocked_image(backends, prompt, index, total):
+        started.append(prompt)
+        release.wait(5)
+        return f"/api/images/{prompt}.webp"
+
+    monkeypatch.setattr(image_utils, "_gen_one", blocked_image)
+    monkeypatch.setattr(image_utils, "IMAGE_QUEUE_TIMEOUT_SECONDS", 0.1)
+    batch = image_utils.ImageBatch("test-key", timeout=0.5)
+    batch.submit("running")
+    batch.submit("waiting")
+    threading.Timer(0.3, release.set).start()
+
+    assert batch.collect() == ["/api/images/running.webp"]
+    assert started == ["running"]
+    assert image_utils.get_image_queue_stats()["queued"] == 0
+
+
+def test_async_image_slots_work_across_event_loops(monkeypatch):
+    async def generate(backends, prompt, label):
+        await asyncio.sleep(0.01)
+        return None
+
+    async def contended():
+        # More images than slots, so callers really wait on the semaphore
+        backends = [types.SimpleNamespace(name="fake")]
+        return await asyncio.gather(*(
+            image_utils._generate_and_store_async(backends, "prompt", f"key-{i}", i, 8) for i in range(8)
+        ))
+
+    monkeypatch.setattr(image_utils, "generate_image_async", generate)
+
+    for _ in range(2):
+        assert asyncio.run(contended()) == [None] * 8
+
+
+def test_images_pipeline_cancels_queued_images_when_the_text_fails(one_worker, monkeypatch):
+    import app
+
+    release = threading.Event()
+    started = []
+
+    def blocked_image(backends, prompt, index, total):
+        started.append(prompt)
+        release.wait(5)
+        return f"/api/images/{prompt}.webp"
+
+    def failing_stream(api_key, topic, length, mode):
+        for i in range(3):
+            yield "image_prompt", f"prompt {i}"
+        yield "error", "stream broke"
+
+    monkeypatch.setattr(image_utils, "_gen_one", blocked_image)
+    monkeypatch.setattr(app, "call_genai_stream", failing_stream)
+
+    _, status = app._images_pipeline("test-key", None, "gemini", "PCA", "Brief")
+    release.set()
+
+    assert status == 500
+    assert started == ["prompt 0"]
+    assert image_utils.get_image_queue_stats()["queued"] == 0
@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app import app
+from utils.job_queue import JobManager, JobQueueFullError
+from utils.rate_limiter import RateLimitError
+
+
+def _blocked_manager(release, max_queued):
+    manager = JobManager(workers=1, max_queued=max_queued)
+
+    def pipeline(progress):
+        release.wait(5)
+        return {"ok": True}, 200
+
+    return manager, pipeline
+
+
+def test_submit_refuses_jobs_beyond_the_queue_cap():
+    release = threading.Event()
+    manager, pipeline = _blocked_manager(release, max_queued=2)
+    running = manager.submit("test", pipeline)
+    while running.to_dict(include_events=False)["status"] != "running":
+        time.sleep(0.01)
+    queued = [manager.submit("test", pipeline) for _ in range(2)]
+
+    with pytest.raises(JobQueueFullError) as refused:
+        manager.submit("test", pipeline)
+    release.set()
+    manager._executor.shutdown(wait=True)
+
+    assert refused.value.status_code == 503 and refused.value.retry_after >= 1
+    assert [job.status for job in queued] == ["done", "done"]
+    assert manager.stats()["rejected"] == 1
+
+
+def test_async_route_answers_503_with_retry_after_when_the_queue_is_full(monkeypatch):
+    release = threading.Event()
+    manager, _ = _blocked_manager(release, max_queued=0)
+    monkeypatch.setattr("app.job_manager", manager)
+
+    response = app.test_client().post('/api/generate-code', json={'topic': 'PCA', 'api_key': 'k', 'async': True})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def _raise(error):
+    raise error
+
+
+def _finished(manager, job):
+    manager._executor.shutdown(wait=True)
+    return job.to_dict()
+
+
+def test_job_runs_through_queued_running_and_done():
+    manager = JobManager(workers=1)
+
+    def pipeline(topic, progress):
+        progress("text", "Explaining", chars=12)
+        return {"topic": topic}, 200
+
+    job = manager.submit("text", pipeline, "PCA")
+    info = _finished(manager, job)
+
+    assert info["status"] == "done"
+    assert info["result"] == {"topic": "PCA"}
+    assert info["created"] <= info["started"] <= info["finished"]
+    assert [(e["seq"], e["stage"]) for e in info["events"]] == [(1, "queued"), (2, "running"), (3, "text"), (4, "done")]
+    assert info["events"][2]["chars"] == 12
+    assert manager.stats()["done"] == 1
+
+
+@pytest.mark.parametrize("outcome, error, retry_after", [
+    (lambda: ({"error": "Bad topic"}, 400), "Bad topic", None),
+    (lambda: _raise(RuntimeError("boom")), "boom", None),
+    (lambda: _raise(RateLimitError("limited", 7)), RateLimitError.user_message, 7),
+])
+def test_failed_jobs_keep_the_error(outcome, error, retry_after):
+    manager = JobManager(workers=1)
+
+    info = _finished(manager, manager.submit("text", lambda progress: outcome()))
+
+    assert info["status"] == "failed"
+    assert info["error"] == error
+    assert info.get("retry_after") == retry_after
+    assert "result" not in info
+    assert info["events"][-1]["stage"] == "failed"
+
+
+def test_events_after_waits_for_the_next_event():
+    manager = JobManager(workers=1)
+    release = threading.Event()
+
+    def pipeline(progress):
+        release.wait(5)
+        progress("text", "Explaining")
+        return {}, 200
+
+    job = manager.submit("text", pipeline)
+    while len(job.events_after(0)) < 2:
+        time.sleep(0.01)
+    threading.Timer(0.05, release.set).start()
+
+    started = time.perf_counter()
+    new_events = job.events_after(2, timeout=5)
+
+    assert new_events[0]["stage"] == "text"
+    assert time.perf_counter() - started < 4
+    manager._executor.shutdown(wait=True)
+
+
+def test_job_routes_report_status_and_stream_events(monkeypatch):
+    manager = JobManager(workers=1)
+    monkeypatch.setattr("app.job_manager", manager)
+    job = manager.submit("text", lambda progress: ({"ok": True}, 200))
+    manager._executor.shutdown(wait=True)
+    client = app.test_client()
+
+    assert client.get('/api/jobs/unknown').status_code == 404
+    assert client.get(f'/api/jobs/{job.id}').get_json()["result"] == {"ok": True}
+
+    stream = client.get(f'/api/jobs/{job.id}/events', headers={'Last-Event-ID': '1'}).get_data(as_text=True)
+    messages = [dict(line.split(": ", 1) for line in block.splitlines()) for block in stream.strip().split("\n\n")]
+
+    assert [(m["id"], m["event"]) for m in messages] == [("2", "progress"), ("3", "progress"), ("3", "done")]
+    assert json.loads(messages[-1]["data"])["status"] == "done"
@@ -0,0 +1,76 @@
+import re
+
+from app import app
+from utils.metrics import MetricsRegistry
+
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? -?[0-9.e+-]+$')
+
+
+def assert_exposition_format(text):
+    assert text.endswith("\n")
+    for line in text.splitlines():
+        if line.startswith("#"):
+            assert re.match(r"^# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* .+$", line), line
+        else:
+            assert SAMPLE_LINE.match(line), line
+
+
+def test_summaries_and_counters_render_in_prometheus_text_format():
+    registry = MetricsRegistry(prefix="test")
+    registry.describe("stage_seconds", "Time per stage")
+    for value in (0.1, 0.2, 0.3, 0.4):
+        registry.observe("stage_seconds", value, stage="text")
+    registry.inc("requests_total", route="/api/x", status=200)
+    registry.inc("requests_total", route="/api/x", status=200)
+
+    text = registry.render_prometheus()
+
+    assert_exposition_format(text)
+    assert "# HELP test_stage_seconds Time per stage" in text
+    assert "# TYPE test_stage_seconds summary" in text
+    assert 'test_stage_seconds{stage="text",quantile="0.5"} 0.300000' in text
+    assert 'test_stage_seconds_sum{stage="text"} 1.000000' in text
+    assert 'test_stage_seconds_count{stage="text"} 4' in text
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{route="/api/x",status="200"} 2' in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(prefix="test")
+    registry.inc("errors_total", kind='say "hi"\\\n')
+
+    text = registry.render_prometheus()
+
+    assert_exposition_format(text)
+    assert 'test_errors_total{kind="say \\"hi\\"\\\\\\n"} 1' in text
+
+
+def test_gauges_are_flattened_and_sanitized():
+    registry = MetricsRegistry(prefix="test")
+    registry.register_gauges("upstream", lambda: {"gemini-text": {"open": True, "failures": 3, "state": "closed"}})
+
+    def broken():
+        raise RuntimeError("boom")
+
+    registry.register_gauges("broken", broken)
+
+    text = registry.render_prometheus()
+
+    assert_exposition_format(text)
+    assert "# TYPE test_upstream_gemini_text_failures gauge" in text
+    assert "test_upstream_gemini_text_failures 3" in text
+    assert "open" not in text and "state" not in text
+
+
+def test_metrics_endpoint_serves_the_exposition_format():
+    client = app.test_client()
+    client.get('/api/upstream-status')
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "version=0.0.4" in response.headers["Content-Type"]
+    text = response.get_data(as_text=True)
+    assert_exposition_format(text)
+    assert 'learnsphere_http_requests_total{method="GET",route="/api/upstream-status",status="200"}' in text
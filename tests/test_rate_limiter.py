@@ -0,0 +1,125 @@
+import types
+
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import RateLimitError, RetryScheduler, TokenBucket, retry_hint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TooManyRequests(Exception):
+    code = 429
+
+    def __init__(self, message="quota exhausted", retry_after=None):
+        super().__init__(message)
+        self.response = types.SimpleNamespace(headers={"Retry-After": retry_after} if retry_after else {})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", fake)
+    return fake
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+
+    assert bucket.reserve(0) == 0
+    assert bucket.reserve(0) == 0
+    assert bucket.reserve(0) is None
+    assert bucket.next_available() == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert bucket.reserve(1) == pytest.approx(0.5)
+
+    clock.now += 10
+    assert bucket.reserve(0) == 0
+    assert bucket.reserve(0) == 0
+    assert bucket.reserve(0) is None
+
+
+def test_paused_bucket_hands_out_no_tokens(clock):
+    bucket = TokenBucket(rate_per_minute=600)
+    bucket.pause(5)
+
+    assert bucket.reserve(1) is None
+    assert bucket.reserve(6) == pytest.approx(5)
+
+
+def test_retry_hint_from_header_and_message():
+    assert retry_hint(TooManyRequests(retry_after="7")) == 7.0
+    assert retry_hint(TooManyRequests("Please retry in 12.5s.")) == 12.5
+    assert retry_hint(TooManyRequests()) is None
+
+
+def test_server_retry_after_is_honoured_and_pauses_the_bucket(clock):
+    bucket = TokenBucket(rate_per_minute=600)
+    scheduler = RetryScheduler("test", bucket, max_attempts=3, max_total_wait=30)
+    calls = []
+    held_back = []
+    sleep = clock.sleep
+
+    def sleep_and_probe(seconds):
+        # Other callers are held back by the same hint while this one waits
+        held_back.append(bucket.reserve(0))
+        sleep(seconds)
+
+    clock.sleep = sleep_and_probe
+
+    def flaky():
+        calls.append(clock.now)
+        if len(calls) == 1:
+            raise TooManyRequests(retry_after="4")
+        return "ok"
+
+    assert scheduler.call(flaky) == "ok"
+    assert calls[1] - calls[0] == pytest.approx(4)
+    assert clock.sleeps[0] == pytest.approx(4)
+    assert held_back == [None]
+
+
+def test_retry_after_beyond_the_wait_budget_raises_with_the_hint(clock):
+    scheduler = RetryScheduler("test", TokenBucket(rate_per_minute=600), max_attempts=3, max_total_wait=10)
+
+    def limited():
+        raise TooManyRequests(retry_after="30")
+
+    with pytest.raises(RateLimitError) as excinfo:
+        scheduler.call(limited)
+    assert excinfo.value.retry_after == 30
+    assert clock.sleeps == []
+
+
+def test_other_errors_are_not_retried(clock):
+    scheduler = RetryScheduler("test", TokenBucket(rate_per_minute=600))
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.call(broken)
+    assert calls == [1]
+
+
+def test_requests_over_the_local_limit_are_shed(clock):
+    scheduler = RetryScheduler("test", TokenBucket(rate_per_minute=6, burst=1), max_total_wait=2)
+
+    assert scheduler.call(lambda: "ok") == "ok"
+    with pytest.raises(RateLimitError) as excinfo:
+        scheduler.call(lambda: "ok")
+    assert excinfo.value.retry_after == 10
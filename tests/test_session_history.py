@@ -0,0 +1,44 @@
+import pytest
+
+from app import app, session_from_token
+from utils.history_store import record_generation
+
+
+@pytest.fixture
+def owner():
+    client = app.test_client()
+    token = client.get('/api/session-token').get_json()['session_token']
+    session_id = session_from_token(token)
+    record_generation(session_id, "private topic", "Brief", "Text explanation", briefing="secret notes")
+    return session_id, token
+
+
+def _topics(response):
+    return [item['topic'] for item in response.get_json()['items']]
+
+
+def test_history_is_read_through_the_session_cookie(owner):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['sid'] = owner[0]
+
+    assert _topics(client.get('/api/history')) == ["private topic"]
+
+
+def test_raw_session_id_header_is_ignored(owner):
+    response = app.test_client().get('/api/history', headers={'X-Session-Id': owner[0]})
+
+    assert _topics(response) == []
+
+
+def test_signed_session_token_header_is_accepted(owner):
+    response = app.test_client().get('/api/history', headers={'X-Session-Token': owner[1]})
+
+    assert _topics(response) == ["private topic"]
+
+
+def test_forged_session_token_is_rejected(owner):
+    forged = owner[1][:-4] + ("AAAA" if not owner[1].endswith("AAAA") else "BBBB")
+    response = app.test_client().get('/api/history', headers={'X-Session-Token': forged})
+
+    assert _topics(response) == []
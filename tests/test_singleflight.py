@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from utils.rate_limiter import UpstreamUnavailableError
+from utils.singleflight import SingleFlight
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return "shared"
+
+        leader = asyncio.create_task(flight.do_async("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do_async("key", work))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await follower == "shared"
+        assert leader.cancelled()
+        assert calls == [1]
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_aborted_call_gives_followers_a_retryable_error():
+    async def scenario():
+        flight = SingleFlight("test")
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(10)
+
+        follower = asyncio.create_task(flight.do_async("key", work))
+        await started.wait()
+        flight._async_calls["key"].cancel()
+
+        with pytest.raises(UpstreamUnavailableError):
+            await follower
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+import pytest
+
+from utils.topic_index import TopicIndex, canonical_topic, same_terms
+
+LENGTH = "Brief"
+MODE = "Text explanation"
+
+
+@pytest.mark.parametrize("cached, requested", [
+    ("unsupervised learning", "supervised learning"),
+    ("L2 regularization", "L1 regularization"),
+    ("text benchmark topic 1", "text benchmark topic 0"),
+])
+def test_different_topics_are_not_served_from_each_other(cached, requested):
+    index = TopicIndex()
+    index.add(cached, LENGTH, MODE, "cached-key")
+
+    assert index.lookup(requested, LENGTH, MODE) is None
+
+
+@pytest.mark.parametrize("cached, requested", [
+    ("convolutional neural networks", "CNNs explained"),
+    ("gradient descent", "What is gradient descent?"),
+    ("random forests", "random forest basics"),
+])
+def test_rephrased_topics_are_served_from_cache(cached, requested):
+    index = TopicIndex()
+    index.add(cached, LENGTH, MODE, "cached-key")
+
+    match = index.lookup(requested, LENGTH, MODE)
+
+    assert match is not None and match[0] == "cached-key"
+
+
+def test_same_terms_allows_typos_but_not_numbers_or_negations():
+    assert same_terms(canonical_topic("backpropagation algorithm"), canonical_topic("backpropogation algorithm"))
+    assert not same_terms(canonical_topic("linear regression"), canonical_topic("non-linear regression"))
+    assert not same_terms(canonical_topic("GPT 3"), canonical_topic("GPT 4"))
+
+
+def test_lookup_is_scoped_to_mode_and_length():
+    index = TopicIndex()
+    index.add("gradient descent", LENGTH, MODE, "cached-key")
+
+    assert index.lookup("gradient descent", "Detailed", MODE) is None
+    assert index.lookup("gradient descent", LENGTH, "Code with explanation") is None
@@ -0,0 +1,66 @@
+import pytest
+import requests
+
+import fake_gemini
+from utils import genai_utils
+from utils.rate_limiter import RateLimitError, TokenBucket, text_scheduler
+from utils.upstream_guard import CLOSED, AdaptiveLimiter, CircuitBreaker, text_guard
+
+LENGTH = "Brief"
+MODE = "Text explanation"
+
+
+@pytest.fixture
+def rate_limited_upstream(monkeypatch):
+    monkeypatch.setattr(fake_gemini.config, "rate_limit_rate", 1.0)
+    monkeypatch.setattr(fake_gemini.config, "retry_after_seconds", 0)
+    monkeypatch.setattr(text_scheduler, "bucket", TokenBucket(6000))
+    monkeypatch.setattr(text_scheduler, "max_attempts", 1)
+    monkeypatch.setattr(text_guard, "limiter", AdaptiveLimiter())
+    monkeypatch.setattr(text_guard, "breaker", CircuitBreaker(failure_threshold=3))
+
+
+def test_streamed_rate_limits_do_not_open_the_breaker(rate_limited_upstream):
+    for i in range(6):
+        with pytest.raises(RateLimitError):
+            list(genai_utils.call_genai_stream("test-key", f"rate limited topic {i}", LENGTH, MODE))
+
+    assert fake_gemini.config.calls["rate_limited"] >= 6
+    assert text_guard.breaker.stats()["state"] == CLOSED
+    assert text_guard.breaker.stats()["consecutive_failures"] == 0
+    assert text_guard.limiter.in_flight == 0
+
+
+def test_local_errors_do_not_open_the_breaker(monkeypatch):
+    monkeypatch.setattr(text_guard, "limiter", AdaptiveLimiter())
+    monkeypatch.setattr(text_guard, "breaker", CircuitBreaker(failure_threshold=3))
+
+    def broken(error):
+        raise error
+
+    for error in (ValueError("bad parse"), KeyError("text"), TypeError("bad config")) * 2:
+        with pytest.raises(type(error)):
+            text_guard.call(broken, error)
+
+    assert text_guard.breaker.stats()["state"] == CLOSED
+    assert text_guard.breaker.stats()["consecutive_failures"] == 0
+
+
+@pytest.mark.parametrize("error", [
+    TimeoutError("read timed out"),
+    ConnectionError("connection reset"),
+    requests.exceptions.ConnectTimeout("connect timed out"),
+    type("ServerError", (Exception,), {"code": 503})("503 unavailable"),
+])
+def test_upstream_failures_open_the_breaker(monkeypatch, error):
+    monkeypatch.setattr(text_guard, "limiter", AdaptiveLimiter())
+    monkeypatch.setattr(text_guard, "breaker", CircuitBreaker(failure_threshold=3))
+
+    def broken():
+        raise error
+
+    for _ in range(3):
+        with pytest.raises(type(error)):
+            text_guard.call(broken)
+
+    assert text_guard.breaker.stats()["state"] != CLOSED
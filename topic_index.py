@@ -0,0 +1,377 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+
+from utils.cache_utils import CACHE_DIR, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Minimum Jaccard similarity of canonical topic trigrams to reuse a response; the
+# topics must also have the same words up to typos (see ``same_terms``)
+TOPIC_SIMILARITY_THRESHOLD = float(os.getenv('TOPIC_SIMILARITY_THRESHOLD', '0.8'))
+TOPIC_SIMILARITY_ENABLED = os.getenv('TOPIC_SIMILARITY_ENABLED', '1') != '0'
+
+SHINGLE_SIZE = 3
+# 32 bands of 2 rows favour recall: topics at the default threshold share a
+# band with near certainty. Weaker candidates are dropped by the exact check.
+MINHASH_BANDS = 32
+MINHASH_ROWS = 2
+NUM_PERM = MINHASH_BANDS * MINHASH_ROWS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Question phrasing that doesn't change what is being asked about
+FILLER_PATTERNS = [
+    r"^(what|who|why|how) (is|are|does|do)( an?| the)? ",
+    r"^(explain|describe|define|introduce)( me)?( an?| the)? ",
+    r"^(introduction|intro|guide|tutorial) to( an?| the)? ",
+    r"^(an?|the) ",
+    r" (explained|explanation|basics|overview|tutorial|for beginners)$",
+    r" (work|works)$",
+]
+
+# Common acronyms, so "CNNs explained" lands next to "convolutional neural networks"
+ABBREVIATIONS = {
+    "ai": "artificial intelligence",
+    "ml": "machine learning",
+    "dl": "deep learning",
+    "nn": "neural network",
+    "ann": "artificial neural network",
+    "cnn": "convolutional neural network",
+    "rnn": "recurrent neural network",
+    "lstm": "long short term memory",
+    "gru": "gated recurrent unit",
+    "gan": "generative adversarial network",
+    "vae": "variational autoencoder",
+    "gnn": "graph neural network",
+    "mlp": "multilayer perceptron",
+    "svm": "support vector machine",
+    "knn": "k nearest neighbor",
+    "pca": "principal component analysis",
+    "nlp": "natural language processing",
+    "llm": "large language model",
+    "rl": "reinforcement learning",
+    "sgd": "stochastic gradient descent",
+}
+
+
+def canonical_topic(topic):
+    """
+    Reduce a topic to the form used for similarity matching.
+
+    Lower-cases, drops punctuation and question phrasing, singularizes plain
+    plurals and expands common acronyms.
+
+    Args:
+        topic: Topic as typed by the user
+
+    Returns:
+        Canonical topic string
+    """
+
+    text = re.sub(r"[^a-z0-9 ]+", " ", normalize_text(topic))
+    text = " ".join(text.split())
+    for pattern in FILLER_PATTERNS:
+        text = re.sub(pattern, "", text).strip()
+
+    words = []
+    for word in text.split():
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(ABBREVIATIONS.get(word, word))
+    return " ".join(words)
+
+
+# "supervised" and "unsupervised" differ by two letters but mean opposite things
+NEGATION_PREFIXES = ("un", "non", "in", "dis", "ir", "il", "im")
+
+
+def _edit_distance(first, second):
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions)."""
+
+    previous, current = None, list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return current[-1]
+
+
+def same_term(first, second):
+    """
+    Whether two canonical topic words name the same thing, allowing for typos.
+
+    Words with digits must match exactly ("l1" is not "l2"), a negated word
+    never matches its base ("unsupervised" is not "supervised"), and other
+    words may differ by one edit, or two from eight letters on.
+
+    Args:
+        first: Canonical word
+        second: Canonical word
+
+    Returns:
+        True if the words are interchangeable
+    """
+
+    if first == second:
+        return True
+    if any(c.isdigit() for c in first + second):
+        return False
+    for prefix in NEGATION_PREFIXES:
+        if first == prefix + second or second == prefix + first:
+            return False
+    shorter = min(len(first), len(second))
+    allowed = 2 if shorter >= 8 else 1 if shorter >= 4 else 0
+    return abs(len(first) - len(second)) <= allowed and _edit_distance(first, second) <= allowed
+
+
+def same_terms(first, second):
+    """
+    Whether two canonical topics consist of the same words, in any order, up to typos.
+
+    Args:
+        first: Canonical topic
+        second: Canonical topic
+
+    Returns:
+        True if every word of one pairs off with a word of the other
+    """
+
+    words = sorted(set(first.split()))
+    remaining = sorted(set(second.split()))
+    if len(words) != len(remaining):
+        return False
+    for word in words:
+        match = next((other for other in remaining if same_term(word, other)), None)
+        if match is None:
+            return False
+        remaining.remove(match)
+    return True
+
+
+def _shingles(text):
+    padded = f" {text} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded}
+    return {padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+
+def _make_permutations(count, seed=b"learnsphere-minhash"):
+    params = []
+    for i in range(count):
+        digest = hashlib.blake2b(seed + struct.pack(">I", i), digest_size=16).digest()
+        a, b = struct.unpack(">QQ", digest)
+        params.append((a % (_MERSENNE_PRIME - 1) + 1, b % _MERSENNE_PRIME))
+    return params
+
+
+_PERMUTATIONS = _make_permutations(NUM_PERM)
+
+
+def minhash(shingles):
+    """
+    Compute the MinHash signature of a shingle set.
+
+    Args:
+        shingles: Set of strings
+
+    Returns:
+        Tuple of NUM_PERM integers
+    """
+
+    hashes = [struct.unpack(">I", hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest())[0] for s in shingles]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def jaccard(first, second):
+    """Exact Jaccard similarity of two sets."""
+
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class TopicIndex:
+    """
+    MinHash/LSH index of previously generated topics.
+
+    Topics are grouped by (mode, length); a lookup only considers entries
+    generated for the same pair. LSH bands narrow the search to likely
+    matches, which are then confirmed with the exact trigram Jaccard
+    similarity against ``threshold`` and must have the same words up to
+    typos, so numbers and negations are never traded for each other. Each entry points at a response cache
+    key, so a match is served from the shared response cache.
+    """
+
+    def __init__(self, threshold=TOPIC_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._entries = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "candidates": 0, "rebuilt": 0}
+
+    def _bands(self, signature):
+        for band in range(MINHASH_BANDS):
+            yield band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+
+    def add(self, topic, length, mode, cache_key):
+        """
+        Index a generated topic.
+
+        Args:
+            topic: Topic as requested
+            length: Length of explanation
+            mode: Output mode
+            cache_key: Response cache key holding the generated response
+        """
+
+        canonical = canonical_topic(topic)
+        if not canonical:
+            return
+
+        shingles = _shingles(canonical)
+        signature = minhash(shingles)
+        group = (normalize_text(mode), normalize_text(length))
+
+        with self._lock:
+            if cache_key in self._entries:
+                return
+            self._entries[cache_key] = (group, canonical, shingles, signature)
+            for band, rows in self._bands(signature):
+                self._buckets.setdefault((group, band, rows), set()).add(cache_key)
+
+    def discard(self, cache_key):
+        """Forget an entry whose response is no longer cached."""
+
+        with self._lock:
+            entry = self._entries.pop(cache_key, None)
+            if entry is None:
+                return
+            group, _, _, signature = entry
+            for band, rows in self._bands(signature):
+                bucket = self._buckets.get((group, band, rows))
+                if bucket is not None:
+                    bucket.discard(cache_key)
+                    if not bucket:
+                        del self._buckets[(group, band, rows)]
+
+    def lookup(self, topic, length, mode):
+        """
+        Find the most similar indexed topic for the same mode and length.
+
+        Args:
+            topic: Topic as requested
+            length: Length of explanation
+            mode: Output mode
+
+        Returns:
+            Tuple of (cache_key, similarity) or None if nothing reaches the threshold
+        """
+
+        canonical = canonical_topic(topic)
+        shingles = _shingles(canonical)
+        signature = minhash(shingles)
+        group = (normalize_text(mode), normalize_text(length))
+
+        with self._lock:
+            self._stats["lookups"] += 1
+            candidates = set()
+            for band, rows in self._bands(signature):
+                candidates.update(self._buckets.get((group, band, rows), ()))
+            self._stats["candidates"] += len(candidates)
+
+            best = None
+            for cache_key in candidates:
+                _, other_canonical, other, _ = self._entries[cache_key]
+                similarity = jaccard(shingles, other)
+                if similarity < self.threshold or not same_terms(canonical, other_canonical):
+                    continue
+                if best is None or similarity > best[1]:
+                    best = (cache_key, similarity)
+
+            self._stats["hits" if best else "misses"] += 1
+        return best
+
+    def record_stale(self):
+        """Count a match whose cached response had already expired as a miss."""
+
+        with self._lock:
+            self._stats["hits"] -= 1
+            self._stats["misses"] += 1
+
+    def rebuild(self, cache_dir=CACHE_DIR):
+        """
+        Rebuild the index from the response cache's disk records.
+
+        Args:
+            cache_dir: Directory of response cache JSON records
+
+        Returns:
+            Number of indexed entries
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+        if not os.path.isdir(cache_dir):
+            return 0
+
+        for filename in os.listdir(cache_dir):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(cache_dir, filename), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+                if record.get("topic") and record.get("mode"):
+                    self.add(record["topic"], record.get("length", ""), record["mode"], filename[:-len(".json")])
+            except Exception as e:
+                logger.warning(f"Skipping cache record {filename} while indexing topics: {e}")
+
+        with self._lock:
+            self._stats["rebuilt"] += 1
+            count = len(self._entries)
+        logger.info(f"Topic similarity index rebuilt with {count} entries")
+        return count
+
+    def stats(self):
+        """
+        Return similarity lookup counters.
+
+        Returns:
+            Dictionary with lookups, hits, misses, hit_rate, entries and threshold
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["threshold"] = self.threshold
+        return stats
+
+
+topic_index = TopicIndex()
+if TOPIC_SIMILARITY_ENABLED:
+    topic_index.rebuild()
+
+
+def get_similarity_stats():
+    """
+    Return counters for the near-duplicate topic index.
+
+    Returns:
+        Dictionary with similarity lookup statistics
+    """
+
+    return topic_index.stats()
@@ -0,0 +1,187 @@
+"""
+Throughput and latency comparison of the TTS engines in audio_utils.
+
+Synthesizes long, unique explanations with each engine and reports time to
+first audio, time to the whole file and characters synthesized per second:
+
+    python tts_benchmark.py --engine gtts --engine espeak --texts 8 --chars 6000
+    python tts_benchmark.py --engine piper --concurrency 4
+    python tts_benchmark.py --standin-latency-ms 400 --standin-cpu-ms-per-kchar 300
+
+The --standin options add fake engines from fake_gemini.py ("standin" sleeps
+like a network engine, "standin-cpu" spins like a local one), so the
+harness itself can be checked without network access or installed voices.
+Each engine runs in its own empty working directory, so no chunk is served
+from cache; one short warm-up synthesis per engine starts its pool first.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import fake_gemini
+
+WORDS = (
+    "model gradient training data feature layer weight bias loss function network neuron activation "
+    "learning rate batch epoch validation accuracy overfitting regularization tree forest boosting "
+    "cluster vector matrix probability distribution sample estimate variance error prediction"
+).split()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput and latency comparison of the TTS engines")
+    parser.add_argument("--engine", action="append",
+                        help="Engine to benchmark (repeatable, default: the TTS_ENGINE setting unless stand-ins are used)")
+    parser.add_argument("--texts", type=int, default=6, help="Explanations synthesized per engine")
+    parser.add_argument("--chars", type=int, default=6000, help="Approximate characters per explanation")
+    parser.add_argument("--concurrency", type=int, default=2, help="Explanations synthesized at once")
+    parser.add_argument("--standin-latency-ms", type=float,
+                        help="Add a sleeping stand-in engine with this per-chunk latency")
+    parser.add_argument("--standin-cpu-ms-per-kchar", type=float,
+                        help="Add a CPU-bound stand-in engine spinning this long per 1000 characters")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_texts(count, chars, seed):
+    """Build ``count`` distinct explanation-like texts of about ``chars`` characters."""
+
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        sentences = [f"This is explanation {i} of the run {seed}."]
+        while sum(len(s) + 1 for s in sentences) < chars:
+            words = rng.choices(WORDS, k=rng.randint(8, 20))
+            sentences.append(" ".join(words).capitalize() + ".")
+        texts.append(" ".join(sentences))
+    return texts
+
+
+def run_engine(audio_utils, name, texts, args):
+    # A fresh directory keeps the chunk and file caches cold
+    os.chdir(tempfile.mkdtemp(prefix=f"learnsphere_tts_{name}_"))
+    engine = audio_utils.get_engine(name)
+    for _ in audio_utils.stream_audio(f"Warm up {name}.", "warmup", engine=name):
+        pass
+
+    first_audio = []
+    totals = []
+    errors = []
+    audio_bytes = [0]
+    done_chars = [0]
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        first = None
+        size = 0
+        try:
+            for segment in audio_utils.stream_audio(texts[i], f"bench_{i}", engine=name):
+                if first is None:
+                    first = time.perf_counter() - started
+                size += len(segment)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            first_audio.append(first)
+            totals.append(elapsed)
+            audio_bytes[0] += size
+            done_chars[0] += len(texts[i])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one, range(len(texts))))
+    wall = time.perf_counter() - started
+
+    first_audio.sort()
+    totals.sort()
+    return {
+        "engine": name,
+        "process_pool": engine.use_processes,
+        "workers": audio_utils.TTS_PROCESS_WORKERS if engine.use_processes else audio_utils.TTS_MAX_WORKERS,
+        "texts": len(texts),
+        "completed": len(totals),
+        "wall_seconds": round(wall, 3),
+        "chars_per_second": round(done_chars[0] / wall, 1) if wall else 0.0,
+        "first_audio_ms": {
+            "p50": round(percentile(first_audio, 0.50) * 1000, 1),
+            "p95": round(percentile(first_audio, 0.95) * 1000, 1),
+        },
+        "total_ms": {
+            "p50": round(percentile(totals, 0.50) * 1000, 1),
+            "p95": round(percentile(totals, 0.95) * 1000, 1),
+            "max": round(totals[-1] * 1000, 1) if totals else 0.0,
+        },
+        "audio_mb": round(audio_bytes[0] / (1024 * 1024), 2),
+        "errors": errors[:3],
+    }
+
+
+def print_report(results):
+    header = (f"{'engine':<12} {'pool':>8} {'chars/s':>9} {'first p50':>10} {'first p95':>10} "
+              f"{'total p50':>10} {'total p95':>10} {'done':>6}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        pool = f"{'proc' if r['process_pool'] else 'thread'}x{r['workers']}"
+        done = f"{r['completed']}/{r['texts']}"
+        print(f"{r['engine']:<12} {pool:>8} {r['chars_per_second']:>9} {r['first_audio_ms']['p50']:>10} "
+              f"{r['first_audio_ms']['p95']:>10} {r['total_ms']['p50']:>10} {r['total_ms']['p95']:>10} {done:>6}")
+        for error in r["errors"]:
+            print(f"    error: {error}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # The modules import each other as ``utils.<module>``; without an installed
+    # ``utils`` package, map it onto this directory as tests/conftest.py does
+    if "utils" not in sys.modules and importlib.util.find_spec("utils") is None:
+        package = types.ModuleType("utils")
+        package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+        sys.modules["utils"] = package
+    from utils import audio_utils
+
+    engines = list(args.engine or [])
+    if args.standin_latency_ms is not None:
+        fake_gemini.FakeTTSEngine("standin", latency_ms=args.standin_latency_ms).register()
+        engines.append("standin")
+    if args.standin_cpu_ms_per_kchar is not None:
+        fake_gemini.FakeTTSEngine("standin-cpu", latency_ms=0, ms_per_kchar=args.standin_cpu_ms_per_kchar,
+                                  cpu_bound=True).register()
+        engines.append("standin-cpu")
+
+    if not engines:
+        engines.append(audio_utils.TTS_ENGINE)
+
+    texts = make_texts(args.texts, args.chars, args.seed)
+    results = [run_engine(audio_utils, name, texts, args) for name in engines]
+    print_report(results)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "cpu_count": os.cpu_count()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
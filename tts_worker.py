@@ -0,0 +1,22 @@
+"""
+Main module of the TTS worker processes.
+
+Spawned workers normally re-run the parent's ``__main__`` before taking a
+job, which for ``python app.py`` means importing and setting up the whole
+web app in every worker. audio_utils starts its process pool with this file
+standing in for ``__main__`` instead, so a worker only imports the speech
+code its jobs unpickle.
+"""
+
+import importlib.util
+import os
+import sys
+import types
+
+# Jobs are pickled as ``utils.audio_utils`` functions. When the modules aren't
+# installed as a ``utils`` package, map it onto this directory like
+# tests/conftest.py does.
+if "utils" not in sys.modules and importlib.util.find_spec("utils") is None:
+    package = types.ModuleType("utils")
+    package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules["utils"] = package
@@ -0,0 +1,447 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import requests
+
+try:
+    import httpx
+except ImportError:  # Only installed alongside google.genai
+    httpx = None
+
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimitError, UpstreamUnavailableError, is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_GUARD_ENABLED = os.getenv('UPSTREAM_GUARD_ENABLED', '1') != '0'
+UPSTREAM_INITIAL_LIMIT = int(os.getenv('UPSTREAM_INITIAL_LIMIT', '8'))
+UPSTREAM_MIN_LIMIT = int(os.getenv('UPSTREAM_MIN_LIMIT', '1'))
+UPSTREAM_MAX_LIMIT = int(os.getenv('UPSTREAM_MAX_LIMIT', '64'))
+# A call slower than this multiple of the baseline latency counts as congestion.
+# Generous, because one model serves both Brief and Comprehensive requests.
+UPSTREAM_LATENCY_TOLERANCE = float(os.getenv('UPSTREAM_LATENCY_TOLERANCE', '3.0'))
+UPSTREAM_BACKOFF_RATIO = float(os.getenv('UPSTREAM_BACKOFF_RATIO', '0.7'))
+# How long a call may wait for a concurrency slot before it is shed
+UPSTREAM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT_SECONDS', '10'))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '30'))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Transport failures of the HTTP clients behind the SDKs and the Hugging Face backend
+_TRANSPORT_ERRORS = (TimeoutError, ConnectionError, requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+if httpx is not None:
+    _TRANSPORT_ERRORS += (httpx.TransportError,)
+
+
+def is_upstream_failure(error):
+    """
+    Check whether an exception means the upstream itself is unhealthy.
+
+    Server errors (5xx), timeouts and connection failures count. Client
+    errors such as a bad API key (4xx) belong to one caller, and anything
+    else (a parse error, a bad config) is a local bug; neither does.
+    """
+
+    if isinstance(error, _TRANSPORT_ERRORS):
+        return True
+    code = getattr(error, 'code', None)
+    try:
+        return int(code) >= 500
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_rate_limit_exhausted(error):
+    # The retry budget ran out on 429s or the local quota shed the call (e.g. a
+    # streamed call finished with the scheduler's error); a shed by a breaker
+    # or concurrency limit (UpstreamUnavailableError) is not a rate limit
+    return isinstance(error, RateLimitError) and not isinstance(error, UpstreamUnavailableError)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for calls to one upstream.
+
+    Each call that finishes within ``tolerance`` times the baseline latency
+    raises the limit by 1/limit, so roughly one step per full window.
+    Slower calls, rate limits and upstream failures multiply it by
+    ``backoff``, at most once per baseline interval. The baseline follows
+    faster calls quickly and slower ones only slowly, so it tracks the
+    unloaded latency rather than the current one.
+    """
+
+    def __init__(self, initial=UPSTREAM_INITIAL_LIMIT, min_limit=UPSTREAM_MIN_LIMIT, max_limit=UPSTREAM_MAX_LIMIT,
+                 tolerance=UPSTREAM_LATENCY_TOLERANCE, backoff=UPSTREAM_BACKOFF_RATIO):
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.baseline = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _has_room(self):
+        return self.in_flight < max(self.min_limit, int(self.limit))
+
+    def try_acquire(self):
+        """Take a slot if one is free; returns True on success."""
+
+        with self._cond:
+            if self._has_room():
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for a slot.
+
+        Returns:
+            True if a slot was taken, False if the wait timed out
+        """
+
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._has_room():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, congested=False):
+        """
+        Return a slot and adjust the limit.
+
+        Args:
+            latency: Seconds the call took, or None if it shouldn't be sampled
+            congested: Whether the call failed in a way that signals overload
+        """
+
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None:
+                if self.baseline is None or latency < self.baseline:
+                    self.baseline = latency if self.baseline is None else (self.baseline + latency) / 2
+                else:
+                    self.baseline += 0.01 * (latency - self.baseline)
+                congested = congested or latency > self.baseline * self.tolerance
+
+            if congested:
+                now = time.monotonic()
+                if now - self._last_decrease >= (self.baseline or 0.0):
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "baseline_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+            }
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after consecutive failures.
+
+    Opens after ``failure_threshold`` failures in a row. While open, calls
+    are refused until ``reset_seconds`` have passed; then a single probe is
+    let through (half-open). A successful probe closes the breaker, a failed
+    one opens it again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Check whether a call may go upstream.
+
+        Returns:
+            Tuple of (allowed, is_probe)
+        """
+
+        with self._lock:
+            if self.state == CLOSED:
+                return True, False
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True, True
+            return False, False
+
+    def retry_after(self):
+        """Seconds until the breaker lets a probe through."""
+
+        with self._lock:
+            return max(1.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def record(self, outcome, is_probe=False):
+        """
+        Feed back the outcome of an allowed call.
+
+        Args:
+            outcome: "success", "failure", or "neutral" for results that say
+                nothing about upstream health (rate limits, client errors)
+            is_probe: Whether the call was the half-open probe
+
+        Returns:
+            The new state if it changed, else None
+        """
+
+        with self._lock:
+            if is_probe:
+                self._probing = False
+            previous = self.state
+
+            if outcome == "success":
+                self.failures = 0
+                self.state = CLOSED
+            elif outcome == "failure":
+                self.failures += 1
+                if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                    if self.state != OPEN:
+                        self.times_opened += 1
+                    self.state = OPEN
+                    self.opened_at = time.monotonic()
+
+            return self.state if self.state != previous else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "open": 1 if self.state != CLOSED else 0,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+            }
+
+
+class _Permit:
+    """An admitted upstream call; ``finish`` must be called exactly once."""
+
+    def __init__(self, guard, is_probe):
+        self.guard = guard
+        self.is_probe = is_probe
+        self.started = time.perf_counter()
+        self._finished = False
+
+    def finish(self, error=None):
+        """
+        Record how the call ended and free its slot.
+
+        Args:
+            error: Exception the call raised, or None on success
+        """
+
+        if self._finished:
+            return
+        self._finished = True
+        self.guard._finish(self, error)
+
+    def abandon(self):
+        """Free the slot without judging the upstream, e.g. when the caller gave up."""
+
+        if self._finished:
+            return
+        self._finished = True
+        self.guard._abandon(self)
+
+
+class UpstreamGuard:
+    """
+    Adaptive concurrency limit plus circuit breaker for one upstream.
+
+    ``call``/``call_async`` wrap a single upstream attempt; pass them to a
+    RetryScheduler so each retry is admitted separately. Refused calls raise
+    UpstreamUnavailableError straight away, which callers can answer from
+    cache or with a 503.
+    """
+
+    def __init__(self, name, limiter=None, breaker=None, queue_timeout=UPSTREAM_QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.queue_timeout = queue_timeout
+        self._shed = {"breaker": 0, "concurrency": 0}
+        self._lock = threading.Lock()
+
+    def _refuse(self, reason, retry_after):
+        with self._lock:
+            self._shed[reason] += 1
+        metrics.inc("upstream_shed_total", upstream=self.name, reason=reason)
+        raise UpstreamUnavailableError(f"{self.name} unavailable ({reason})", retry_after)
+
+    def _admit_breaker(self):
+        allowed, is_probe = self.breaker.allow()
+        if not allowed:
+            self._refuse("breaker", self.breaker.retry_after())
+        if is_probe:
+            logger.info(f"{self.name}: circuit half-open, probing upstream")
+        return is_probe
+
+    def admit(self, timeout=None):
+        """
+        Wait for permission to make one upstream call.
+
+        Args:
+            timeout: Seconds to wait for a concurrency slot (default ``queue_timeout``)
+
+        Returns:
+            _Permit to ``finish`` when the call ends
+
+        Raises:
+            UpstreamUnavailableError: If the breaker is open or no slot frees up in time
+        """
+
+        if not UPSTREAM_GUARD_ENABLED:
+            return _Permit(self, False)
+
+        is_probe = self._admit_breaker()
+        if not self.limiter.acquire(self.queue_timeout if timeout is None else timeout):
+            self.breaker.record("neutral", is_probe)
+            self._refuse("concurrency", 1)
+        return _Permit(self, is_probe)
+
+    async def admit_async(self, timeout=None):
+        """Async counterpart of ``admit``; polls for a slot without blocking the event loop."""
+
+        if not UPSTREAM_GUARD_ENABLED:
+            return _Permit(self, False)
+
+        is_probe = self._admit_breaker()
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        delay = 0.005
+        while not self.limiter.try_acquire():
+            if time.monotonic() >= deadline:
+                self.breaker.record("neutral", is_probe)
+                self._refuse("concurrency", 1)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return _Permit(self, is_probe)
+
+    def _abandon(self, permit):
+        if UPSTREAM_GUARD_ENABLED:
+            self.limiter.release()
+            self.breaker.record("neutral", permit.is_probe)
+
+    def _finish(self, permit, error):
+        if not UPSTREAM_GUARD_ENABLED:
+            return
+
+        latency = time.perf_counter() - permit.started
+        if error is None:
+            self.limiter.release(latency)
+            outcome = "success"
+        elif is_rate_limited(error) or _is_rate_limit_exhausted(error):
+            self.limiter.release(congested=True)
+            outcome = "neutral"
+        elif is_upstream_failure(error):
+            self.limiter.release(congested=True)
+            outcome = "failure"
+        else:
+            self.limiter.release()
+            outcome = "neutral"
+
+        changed = self.breaker.record(outcome, permit.is_probe)
+        if changed == OPEN:
+            logger.warning(f"{self.name}: circuit opened after repeated failures ({error})")
+            metrics.inc("upstream_breaker_opened_total", upstream=self.name)
+        elif changed == CLOSED:
+            logger.info(f"{self.name}: circuit closed, upstream recovered")
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call ``fn(*args, **kwargs)`` once under the guard.
+
+        Returns:
+            Whatever ``fn`` returns
+
+        Raises:
+            UpstreamUnavailableError: If the call was shed
+        """
+
+        permit = self.admit()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            permit.finish(e)
+            raise
+        except BaseException:
+            permit.abandon()
+            raise
+        permit.finish()
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """Async counterpart of ``call`` for coroutine functions."""
+
+        permit = await self.admit_async()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            permit.finish(e)
+            raise
+        except BaseException:
+            # Cancelled by the caller (e.g. a lost hedge); says nothing about the upstream
+            permit.abandon()
+            raise
+        permit.finish()
+        return result
+
+    def is_open(self):
+        """Whether calls are currently being refused by the breaker."""
+
+        return self.breaker.stats()["state"] == OPEN
+
+    def stats(self):
+        """
+        Return limiter, breaker and shedding state.
+
+        Returns:
+            Dictionary with the concurrency limit, breaker state and shed counts
+        """
+
+        with self._lock:
+            shed = dict(self._shed)
+        return dict(self.limiter.stats(), **self.breaker.stats(), shed=shed)
+
+
+text_guard = UpstreamGuard("gemini-text")
+image_guard = UpstreamGuard("gemini-image")
+hf_image_guard = UpstreamGuard("huggingface-image")
+
+_guards = [text_guard, image_guard, hf_image_guard]
+
+
+def get_upstream_stats():
+    """
+    Return the protection state of every upstream.
+
+    Returns:
+        Dictionary keyed by upstream name
+    """
+
+    return {guard.name: guard.stats() for guard in _guards}